@@ -0,0 +1,226 @@
+import os
+import time
+import json
+import queue
+import argparse
+import threading
+import numpy as np
+
+from clock import SYSTEM_CLOCK
+from instrumentation import NULL_METRIC
+
+# --- CẤU HÌNH ---
+ALARM_LATENCY_BUDGET_S = 0.5  # từ lúc chụp frame bắt đầu cảnh báo tới lúc chuông ra loa
+MIXER_FREQUENCY = 44100
+MIXER_BUFFER = 512            # mẫu / buffer SDL: nhỏ -> tiếng ra loa sớm hơn (512 / 44100 ≈ 12 ms)
+READY_TIMEOUT_S = 5.0
+SOUND_ALARM = "alarm"         # chuông báo ngủ / gật đầu
+SOUND_WARN = "warn"           # tiếng bíp báo fatigue
+
+
+# ================= BACKEND ÂM THANH =================
+class NullAudioBackend:
+    """Không phát tiếng (chạy headless / test): chỉ ghi lại các lệnh, không cần file âm thanh"""
+    name = "null"
+    output_latency = 0.0
+
+    def __init__(self):
+        self.sounds = {}
+        self.calls = []
+
+    def load(self, name, path):
+        self.sounds[name] = path
+
+    def play(self, name, loops=-1):
+        self.calls.append(("play", name, loops))
+
+    def stop(self, name):
+        self.calls.append(("stop", name))
+
+    def close(self):
+        pass
+
+
+class PygameAudioBackend:
+    """pygame.mixer, âm thanh decode sẵn vào bộ nhớ lúc load"""
+    name = "pygame"
+
+    def __init__(self, frequency=MIXER_FREQUENCY, buffer=MIXER_BUFFER):
+        import pygame
+        pygame.mixer.init(frequency=frequency, buffer=buffer)
+        self.mixer = pygame.mixer
+        # Tiếng mới chỉ ra loa sau khi SDL phát hết buffer đang chờ
+        self.output_latency = buffer / self.mixer.get_init()[0]
+        self.sounds = {}
+
+    def load(self, name, path):
+        sound = self.mixer.Sound(path)
+        sound.set_volume(1.0)
+        self.sounds[name] = sound
+
+    def play(self, name, loops=-1):
+        self.sounds[name].play(loops=loops)
+
+    def stop(self, name):
+        self.sounds[name].stop()
+
+    def close(self):
+        self.mixer.quit()
+
+
+AUDIO_BACKENDS = {"null": NullAudioBackend, "pygame": PygameAudioBackend}
+
+
+# ================= SERVICE CHUÔNG BÁO =================
+class AlarmService(threading.Thread):
+    """
+    Thread riêng giữ mixer + âm thanh đã load sẵn. Frame loop / GUI chỉ đẩy lệnh play / stop vào
+    queue (không bao giờ chờ), lỗi âm thanh không làm hỏng vòng lặp frame.
+    Mỗi lần bật chuông SOUND_ALARM ghi lại time-to-audible tính từ t_warning (t_capture của frame bắt đầu
+    cảnh báo), gồm cả thời gian suy luận, nên chứng minh được độ trễ phát hiện -> chuông so với ngân sách.
+    Tiếng bíp fatigue (SOUND_WARN) không có frame khởi phát nên không tính vào thống kê độ trễ.
+    Không khởi tạo được backend thì chuyển sang NullAudioBackend và ghi lỗi vào errors.
+    """
+    def __init__(self, sounds, backend="pygame", clock=None, budget_s=ALARM_LATENCY_BUDGET_S, metrics=None):
+        super().__init__(name="alarm-audio", daemon=True)
+        self.sound_paths = dict(sounds)      # tên -> đường dẫn file
+        self.backend_name = backend
+        self.backend = None
+        self.clock = clock or SYSTEM_CLOCK
+        self.budget_s = budget_s
+        self.commands = queue.SimpleQueue()
+        self.ready_event = threading.Event()
+        self.loaded = set()
+        self.errors = []
+        self.latencies = []                  # mỗi lần bật SOUND_ALARM: các mốc thời gian (giây)
+        self.m_latency = (metrics.histogram("alarm_latency_ms", "frame bắt đầu cảnh báo -> chuông ra loa")
+                          if metrics is not None else NULL_METRIC)
+
+    # ----- gọi từ thread khác (không chờ) -----
+    def play(self, name=SOUND_ALARM, t_warning=None, loops=-1):
+        """t_warning: thời điểm (theo clock) chụp frame bắt đầu cảnh báo, None = lúc gọi"""
+        t_sent = self.clock.time()
+        self.commands.put(("play", name, loops, t_sent if t_warning is None else t_warning, t_sent))
+
+    def stop(self, name=SOUND_ALARM):
+        self.commands.put(("stop", name, 0, None, self.clock.time()))
+
+    def wait_ready(self, timeout=READY_TIMEOUT_S):
+        """Chờ mixer + âm thanh load xong (True nếu kịp)"""
+        return self.ready_event.wait(timeout)
+
+    def close(self, timeout=2.0):
+        self.commands.put(None)
+        self.join(timeout)
+
+    # ----- thread audio -----
+    def run(self):
+        try:
+            self.backend = AUDIO_BACKENDS[self.backend_name]()
+        except Exception as e:
+            self.errors.append(f"audio ({self.backend_name}): {e} -> không phát tiếng")
+            self.backend = NullAudioBackend()
+        for name, path in self.sound_paths.items():
+            try:
+                self.backend.load(name, path)
+                self.loaded.add(name)
+            except Exception as e:
+                self.errors.append(f"audio {name} ({os.path.basename(path)}): {e}")
+        self.ready_event.set()
+
+        while True:
+            command = self.commands.get()
+            if command is None:
+                break
+            op, name, loops, t_warning, t_sent = command
+            if name not in self.loaded:
+                continue
+            t_start = self.clock.time()
+            try:
+                if op == "play":
+                    self.backend.play(name, loops)
+                    if name == SOUND_ALARM:
+                        self._record(name, t_warning, t_sent, t_start, self.clock.time())
+                else:
+                    self.backend.stop(name)
+            except Exception as e:
+                self.errors.append(f"audio {op} {name}: {e}")
+        self.backend.close()
+
+    def _record(self, name, t_warning, t_sent, t_start, t_played):
+        t_audible = t_played + self.backend.output_latency
+        latency = t_audible - t_warning
+        self.latencies.append({
+            "sound": name,
+            "t_warning": t_warning,
+            "detect_s": t_sent - t_warning,      # capture -> suy luận -> logic ra quyết định
+            "queue_s": t_start - t_sent,         # chờ trong queue của service
+            "play_s": t_played - t_start,        # lời gọi play của backend
+            "output_s": self.backend.output_latency,
+            "latency_s": latency,
+            "within_budget": latency <= self.budget_s,
+        })
+        self.m_latency.observe(latency * 1000)
+        if latency > self.budget_s:
+            print(f"[ALARM] ⚠️ {name} kêu sau {latency * 1000:.0f} ms (ngân sách {self.budget_s * 1000:.0f} ms)")
+
+    # ----- báo cáo -----
+    def stats(self):
+        latencies = np.array([r["latency_s"] for r in self.latencies]) * 1000
+        return {
+            "backend": self.backend.name if self.backend is not None else self.backend_name,
+            "alarms": len(latencies),
+            "mean_ms": float(latencies.mean()) if len(latencies) else None,
+            "p95_ms": float(np.percentile(latencies, 95)) if len(latencies) else None,
+            "max_ms": float(latencies.max()) if len(latencies) else None,
+            "budget_ms": self.budget_s * 1000,
+            "over_budget": sum(not r["within_budget"] for r in self.latencies),
+        }
+
+    def format_stats(self):
+        s = self.stats()
+        if not s["alarms"]:
+            return f"[ALARM] {s['backend']}: chưa bật chuông lần nào"
+        return (f"[ALARM] {s['backend']}: {s['alarms']} lần | time-to-audible TB {s['mean_ms']:.0f} ms, "
+                f"p95 {s['p95_ms']:.0f} ms, max {s['max_ms']:.0f} ms | "
+                f"vượt ngân sách {s['budget_ms']:.0f} ms: {s['over_budget']}")
+
+
+if __name__ == "__main__":
+    current_dir = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(
+        description="Đo time-to-audible của chuông: frame bắt đầu cảnh báo -> suy luận (giả lập) -> chuông ra loa")
+    parser.add_argument("--backend", default="pygame", choices=sorted(AUDIO_BACKENDS))
+    parser.add_argument("--sound", default=os.path.join(current_dir, "chuongqd.wav"))
+    parser.add_argument("--trials", type=int, default=20)
+    parser.add_argument("--inference-ms", type=float, default=0.0,
+                        help="giả lập suy luận chậm giữa lúc chụp frame và lúc ra quyết định")
+    parser.add_argument("--budget", type=float, default=ALARM_LATENCY_BUDGET_S, help="giây")
+    parser.add_argument("--json", help="ghi báo cáo ra file JSON")
+    args = parser.parse_args()
+
+    service = AlarmService({SOUND_ALARM: args.sound}, args.backend, budget_s=args.budget)
+    service.start()
+    if not service.wait_ready():
+        raise SystemExit("Audio không sẵn sàng sau %.0fs" % READY_TIMEOUT_S)
+    for error in service.errors:
+        print(f"[BỎ QUA] {error}")
+
+    for _ in range(args.trials):
+        t_capture = service.clock.time()
+        time.sleep(args.inference_ms / 1000)          # FaceMesh + model + logic
+        service.play(SOUND_ALARM, t_capture)
+        time.sleep(0.05)
+        service.stop(SOUND_ALARM)
+    service.close()
+
+    print(service.format_stats())
+    parts = {k: np.mean([r[k] for r in service.latencies]) * 1000 if service.latencies else 0.0
+             for k in ("detect_s", "queue_s", "play_s", "output_s")}
+    print("    TB từng phần: " + ", ".join(f"{k[:-2]} {v:.1f} ms" for k, v in parts.items()))
+    report = dict(service.stats(), parts_ms=parts, inference_ms=args.inference_ms, errors=service.errors)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    ok = service.backend.name == args.backend and service.latencies and report["over_budget"] == 0
+    raise SystemExit(0 if ok else 1)
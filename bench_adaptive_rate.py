@@ -0,0 +1,67 @@
+import os
+import json
+import argparse
+import tempfile
+
+import offline_analysis
+
+# --- CẤU HÌNH ---
+# Sự kiện của bản adaptive bắt đầu trễ hơn mức này so với bản gốc thì coi là bỏ lỡ
+MAX_ONSET_DELAY = 0.5
+
+
+def match_events(base, other, max_delay=MAX_ONSET_DELAY):
+    """Ghép từng sự kiện (t_start, t_end) của bản gốc với sự kiện chồng lên nó ở bản adaptive"""
+    delays, missed = [], []
+    for b_start, b_end in base:
+        hits = [o_start for o_start, o_end in other if o_start <= b_end and o_end >= b_start]
+        if hits and hits[0] - b_start <= max_delay:
+            delays.append(hits[0] - b_start)
+        else:
+            missed.append((b_start, b_end))
+    return delays, missed
+
+
+def compare(base_summary, adaptive_summary):
+    report = {
+        "video": base_summary["video"],
+        "inferred_ratio": adaptive_summary["inferred_ratio"],
+        "processing_s": [base_summary["processing_s"], adaptive_summary["processing_s"]],
+        "cpu_saving": 1 - adaptive_summary["processing_s"] / max(base_summary["processing_s"], 1e-9),
+    }
+    for key in ("alarms", "yawns"):
+        delays, missed = match_events(base_summary[key], adaptive_summary[key])
+        report[key] = {
+            "baseline": len(base_summary[key]),
+            "adaptive": len(adaptive_summary[key]),
+            "missed": missed,
+            "max_onset_delay_s": max(delays) if delays else 0.0,
+        }
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="So sánh CPU và sự kiện bị bỏ lỡ: suy luận mọi frame vs AdaptiveRateScheduler")
+    parser.add_argument("inputs", nargs="+", help="file video hoặc thư mục chứa video")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--backend", default="pickle", choices=["pickle", "lut", "native"])
+    parser.add_argument("--json", help="ghi kết quả ra file JSON")
+    args = parser.parse_args()
+
+    videos = offline_analysis.find_videos(args.inputs)
+    with tempfile.TemporaryDirectory() as tmp:
+        base = offline_analysis.run(videos, os.path.join(tmp, "full"), args.workers, 0, backend=args.backend)
+        adaptive = offline_analysis.run(videos, os.path.join(tmp, "adaptive"), args.workers, 0,
+                                        backend=args.backend, adaptive=True)
+
+    reports = [compare(b, a) for b, a in zip(base["videos"], adaptive["videos"])]
+    for r in reports:
+        print(f"\n{os.path.basename(r['video'])}: suy luận {r['inferred_ratio'] * 100:.0f}% frame, "
+              f"CPU {r['processing_s'][0]:.1f}s -> {r['processing_s'][1]:.1f}s (tiết kiệm {r['cpu_saving'] * 100:.0f}%)")
+        for key in ("alarms", "yawns"):
+            e = r[key]
+            print(f"    {key}: {e['baseline']} -> {e['adaptive']}, bỏ lỡ {len(e['missed'])}, "
+                  f"trễ tối đa {e['max_onset_delay_s'] * 1000:.0f} ms")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(reports, f, indent=2)
@@ -0,0 +1,78 @@
+import os
+import sys
+import time
+import shutil
+import tempfile
+import numpy as np
+import cv2
+from dataset import process_video, sample_indices, SAMPLERS
+
+# --- CẤU HÌNH ---
+N_FRAMES = 3000          # ~100s video 30 FPS
+FRAME_SIZE = (640, 480)
+FPS = 30
+TARGET = 145
+# Khoảng cách keyframe giống camera hành trình H.264 (mỗi lần seek phải giải mã lại từ đây)
+KEY_INTERVAL = 250
+
+
+def make_test_video(path, n_frames=N_FRAMES, size=FRAME_SIZE):
+    """Video giả có nội dung thay đổi theo từng frame (để so khớp frame lấy được)"""
+    params = []
+    if hasattr(cv2, "VIDEOWRITER_PROP_KEY_INTERVAL"):   # OpenCV >= 4.9
+        params = [cv2.VIDEOWRITER_PROP_KEY_INTERVAL, KEY_INTERVAL]
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), FPS, size, params)
+    w, h = size
+    yy, xx = np.mgrid[0:h, 0:w]
+    for i in range(n_frames):
+        frame = np.empty((h, w, 3), dtype=np.uint8)
+        frame[..., 0] = (xx + 3 * i) % 256
+        frame[..., 1] = (yy + 5 * i) % 256
+        frame[..., 2] = i % 256
+        cv2.putText(frame, str(i), (20, 80), cv2.FONT_HERSHEY_SIMPLEX, 2, (255, 255, 255), 3)
+        writer.write(frame)
+    writer.release()
+
+
+def grab_samples(path, mode):
+    cap = cv2.VideoCapture(path)
+    total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    frames = [f for _, f in SAMPLERS[mode](cap, sample_indices(total, TARGET))]
+    cap.release()
+    return frames
+
+
+if __name__ == "__main__":
+    # python bench_dataset_sampling.py [video_that.mp4]  -> không truyền thì tự tạo video thử
+    tmp = tempfile.mkdtemp(prefix="bench_dataset_")
+    try:
+        if len(sys.argv) > 1:
+            video = sys.argv[1]
+            print(f"[1] Dùng video: {video}")
+        else:
+            video = os.path.join(tmp, "test.mp4")
+            print(f"[1] Tạo video thử {N_FRAMES} frames {FRAME_SIZE[0]}x{FRAME_SIZE[1]}, keyframe mỗi {KEY_INTERVAL} frames...")
+            make_test_video(video)
+
+        # Frame lấy được ở 2 chế độ có giống nhau không
+        seek_frames = grab_samples(video, "seek")
+        seq_frames = grab_samples(video, "sequential")
+        same = sum(a is not None and b is not None and np.array_equal(a, b)
+                   for a, b in zip(seek_frames, seq_frames))
+        print(f"[2] Frame trùng khớp giữa seek và sequential: {same}/{len(seq_frames)}")
+
+        print("[3] Thời gian lấy mẫu + ghi ảnh:")
+        results = {}
+        for mode in ("seek", "sequential"):
+            for ext in (".jpg", ".png", ".bmp"):
+                out = os.path.join(tmp, f"{mode}{ext[1:]}")
+                t0 = time.perf_counter()
+                saved, _ = process_video((video, out), mode=mode, ext=ext, target_count=TARGET)
+                elapsed = time.perf_counter() - t0
+                results[(mode, ext)] = elapsed
+                print(f"    {mode:<10} {ext:<5} {saved} ảnh  {elapsed:6.2f}s")
+        base = results[("seek", ".jpg")]
+        best = min(results, key=results.get)
+        print(f"-> Nhanh nhất: {best[0]} {best[1]} (x{base / results[best]:.1f} so với seek .jpg)")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
@@ -0,0 +1,64 @@
+import time
+import numpy as np
+from mediapipe.framework.formats import landmark_pb2
+from face_utils import FaceMeshDetector, compute_features, landmarks_to_array
+
+# --- CẤU HÌNH ---
+N_SAMPLES = 2000
+IMG_W, IMG_H = 1280, 720
+N_LANDMARKS = 478
+
+
+def legacy_features(lm, w, h):
+    """Cách tính cũ: duyệt từng landmark bằng Python"""
+    det = FaceMeshDetector.__new__(FaceMeshDetector)
+    left_ear = det.get_ear(lm, [362, 385, 387, 263, 373, 380], w, h)
+    right_ear = det.get_ear(lm, [33, 160, 158, 133, 153, 144], w, h)
+    mar = det.get_mar(lm, w, h)
+    features = np.array([left_ear, right_ear, mar])
+    x_list = [pt.x for pt in lm]
+    y_list = [pt.y for pt in lm]
+    x_min, x_max = int(min(x_list) * w), int(max(x_list) * w)
+    y_min, y_max = int(min(y_list) * h), int(max(y_list) * h)
+    nose_x, nose_y = int(lm[1].x * w), int(lm[1].y * h)
+    return features, (x_min, y_min, x_max, y_max), (nose_x, nose_y)
+
+
+def random_landmarks(rng):
+    """Sinh NormalizedLandmarkList giả (giống output MediaPipe) quanh vùng mặt"""
+    msg = landmark_pb2.NormalizedLandmarkList()
+    for x, y, z in rng.normal(0.5, 0.08, size=(N_LANDMARKS, 3)):
+        pt = msg.landmark.add()
+        pt.x, pt.y, pt.z = x, y, z
+    return msg
+
+
+def bench(fn, samples):
+    t0 = time.perf_counter()
+    for s in samples:
+        fn(s)
+    return (time.perf_counter() - t0) / len(samples) * 1e6
+
+
+if __name__ == "__main__":
+    rng = np.random.default_rng(0)
+    samples = [random_landmarks(rng) for _ in range(N_SAMPLES)]
+    arrays = [landmarks_to_array(lm) for lm in samples]
+
+    # 1. Kiểm tra kết quả giống hệt cách cũ
+    for lm, pts in zip(samples, arrays):
+        f_old, b_old, n_old = legacy_features(lm.landmark, IMG_W, IMG_H)
+        f_new, b_new, n_new = compute_features(pts, IMG_W, IMG_H)
+        assert np.array_equal(f_old, f_new) and b_old == b_new and n_old == n_new
+        assert np.array_equal(pts, landmarks_to_array(lm.landmark))
+    print(f"[OK] {N_SAMPLES} mẫu: kết quả vector hóa trùng khớp tuyệt đối với cách cũ")
+
+    # 2. Đo thời gian / frame
+    t_old = bench(lambda lm: legacy_features(lm.landmark, IMG_W, IMG_H), samples)
+    buf = np.empty((N_LANDMARKS, 3))    # giống FaceMeshDetector: ghi vào buffer cấp sẵn
+    t_conv = bench(lambda lm: landmarks_to_array(lm, out=buf), samples)
+    t_new = bench(lambda pts: compute_features(pts, IMG_W, IMG_H), arrays)
+    print(f"Cách cũ (list comprehension):   {t_old:8.1f} us/frame")
+    print(f"landmarks_to_array:             {t_conv:8.1f} us/frame")
+    print(f"compute_features (vector hóa):  {t_new:8.1f} us/frame")
+    print(f"Tổng đường mới:                 {t_conv + t_new:8.1f} us/frame  (x{t_old / (t_conv + t_new):.1f})")
@@ -0,0 +1,120 @@
+import sys
+import time
+import json
+import argparse
+import warnings
+import numpy as np
+import cv2
+
+from face_utils import FaceMeshDetector, GATE_THRESHOLD, GATE_MAX_REUSE
+from model_loader import load_classifier, predict_batch
+from replay import Timeline, replay, compare_events, MODEL_PATH, LUT_PATH, DEFAULT_FPS
+
+# --- CẤU HÌNH ---
+MAX_FRAMES = 1800
+FEATURE_NAMES = ["LeftEAR", "RightEAR", "MAR"]
+
+
+def run_detector(detector, frames):
+    """Chạy detector trên list frame -> (features (n,3) NaN khi mất mặt, nose_y, thời gian từng frame, frame bỏ qua)"""
+    n = len(frames)
+    feats = np.full((n, 3), np.nan)
+    nose_y = np.zeros(n)
+    times = np.zeros(n)
+    skipped = np.zeros(n, dtype=bool)
+    for i, frame in enumerate(frames):
+        t0 = time.perf_counter()
+        features, _, nose = detector.extract_features(frame)
+        times[i] = time.perf_counter() - t0
+        skipped[i] = detector.gate_skipped
+        if features is not None:
+            feats[i], nose_y[i] = features, nose[1]
+    return feats, nose_y, times, skipped
+
+
+def to_timeline(feats, nose_y, clf, fps, source):
+    face = ~np.isnan(feats[:, 0])
+    preds, _ = predict_batch(clf, np.nan_to_num(feats), face)
+    return Timeline(np.arange(len(face)) / fps, np.nan_to_num(feats), nose_y, preds, face, source)
+
+
+def error_stats(err):
+    return {"mean": float(err.mean()) if len(err) else None,
+            "p95": float(np.percentile(err, 95)) if len(err) else None,
+            "max": float(err.max()) if len(err) else None}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Cổng chuyển động: tỉ lệ frame bỏ qua FaceMesh và sai số feature / sự kiện so với chạy mọi frame")
+    parser.add_argument("videos", nargs="+", help="video đã ghi (camera cabin)")
+    parser.add_argument("--frames", type=int, default=MAX_FRAMES)
+    parser.add_argument("--threshold", type=float, default=GATE_THRESHOLD)
+    parser.add_argument("--max-reuse", type=int, default=GATE_MAX_REUSE)
+    parser.add_argument("--tracking", action="store_true", help="FaceMesh chạy trên ROI vùng mặt")
+    parser.add_argument("--backend", default="pickle", choices=["pickle", "lut", "native"])
+    parser.add_argument("--json", help="ghi kết quả ra file JSON")
+    args = parser.parse_args()
+    warnings.filterwarnings("ignore", message="X does not have valid feature names")
+    clf = load_classifier(args.backend, MODEL_PATH, LUT_PATH)
+
+    reports = []
+    failed = False
+    for path in args.videos:
+        cap = cv2.VideoCapture(path)
+        fps = cap.get(cv2.CAP_PROP_FPS) or DEFAULT_FPS
+        frames = []
+        while len(frames) < args.frames:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            frames.append(cv2.flip(frame, 1))
+        cap.release()
+        if not frames:
+            sys.exit(f"Không đọc được frame nào từ {path}")
+
+        full_feats, full_nose, full_t, _ = run_detector(FaceMeshDetector(tracking=args.tracking), frames)
+        gate_feats, gate_nose, gate_t, skipped = run_detector(
+            FaceMeshDetector(tracking=args.tracking, motion_gate=True, gate_threshold=args.threshold,
+                             gate_max_reuse=args.max_reuse), frames)
+
+        # Sai số feature trên các frame đã bỏ qua FaceMesh (các frame còn lại chạy FaceMesh như thường)
+        both = ~np.isnan(full_feats[:, 0]) & ~np.isnan(gate_feats[:, 0])
+        err = np.abs(full_feats - gate_feats)[both & skipped]
+        full = to_timeline(full_feats, full_nose, clf, fps, path)
+        gated = to_timeline(gate_feats, gate_nose, clf, fps, path)
+        # Dùng lại tối đa max_reuse frame -> sự kiện được phép lệch tối đa chừng ấy frame
+        tolerance = (args.max_reuse + 0.5) / fps
+        full_events, gate_events = replay(full)["events"], replay(gated)["events"]
+        diffs = compare_events(gate_events, full_events, tolerance)
+        failed |= bool(diffs)
+
+        report = {
+            "source": path,
+            "frames": len(frames),
+            "skip_rate": float(skipped.mean()),
+            "full_ms": {"mean": float(full_t.mean() * 1000), "p50": float(np.median(full_t) * 1000)},
+            "gated_ms": {"mean": float(gate_t.mean() * 1000), "p50": float(np.median(gate_t) * 1000)},
+            "feature_error": {name: error_stats(err[:, i]) for i, name in enumerate(FEATURE_NAMES)},
+            "pred_mismatch": int((full.pred_raw != gated.pred_raw)[both].sum()),
+            "events": len(full_events),
+            "event_diffs": diffs,
+        }
+        reports.append(report)
+
+        print(f"-> {path}: {len(frames)} frames, bỏ qua FaceMesh {report['skip_rate'] * 100:.0f}% | "
+              f"TB {report['full_ms']['mean']:.1f} -> {report['gated_ms']['mean']:.1f} ms / frame")
+        for name, e in report["feature_error"].items():
+            if e["mean"] is not None:
+                print(f"    {name:<9} sai số trên frame bỏ qua: mean {e['mean']:.4f} | p95 {e['p95']:.4f} | "
+                      f"max {e['max']:.4f}")
+        print(f"    nhãn model khác {report['pred_mismatch']} frame | sự kiện: {len(full_events)} "
+              f"(lệch > {tolerance * 1000:.0f} ms: {len(diffs)})")
+        for d in diffs:
+            print(f"    [KHÁC] {d}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"threshold": args.threshold, "max_reuse": args.max_reuse, "reports": reports}, f, indent=2)
+    print("❌ Sự kiện khác khi bật cổng chuyển động" if failed else "✅ Sự kiện giống khi chạy FaceMesh mọi frame")
+    raise SystemExit(1 if failed else 0)
@@ -0,0 +1,237 @@
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import warnings
+import numpy as np
+import cv2
+
+# Chạy được trên máy không có màn hình
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+from PyQt5.QtWidgets import QApplication, QLabel
+from PyQt5.QtGui import QImage, QPixmap
+from PyQt5.QtCore import Qt
+
+from face_utils import FaceMeshDetector, landmarks_to_array, compute_features
+from model_loader import load_classifier
+from detection_logic import DrowsinessLogic, NOD_COUNT_THRESH
+from display_utils import FrameDisplay
+
+warnings.filterwarnings("ignore", message="X does not have valid feature names")
+
+# --- CẤU HÌNH ---
+current_dir = os.path.dirname(os.path.abspath(__file__))
+MODEL_PATH = os.path.join(current_dir, "drowsiness_ensemble.pkl")
+LUT_PATH = os.path.join(current_dir, "drowsiness_lut.npz")
+DISPLAY_SIZE = (900, 660)      # kích thước video_label trong main_gui.py
+DISPLAY_MODES = ("fast", "legacy")
+DEFAULT_FRAMES = 300
+WARMUP_FRAMES = 10
+
+# Thứ tự các bước giống update_frame / run_inference
+# display = tổng thời gian hiển thị; display_cvt / qimage / scaled chỉ có ở chế độ legacy
+STAGES = ["decode", "flip", "cvt_rgb", "facemesh", "landmarks", "features", "predict",
+          "logic", "draw", "display_cvt", "qimage", "scaled", "display", "end_to_end"]
+
+
+# ================= NGUỒN FRAME =================
+def video_source(path, n_frames):
+    """Đọc lần lượt từ file video (lặp lại từ đầu nếu hết)"""
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        sys.exit(f"Không mở được video: {path}")
+
+    def read():
+        ret, frame = cap.read()
+        if not ret:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ret, frame = cap.read()
+        return frame
+    return read, cap.release
+
+
+def synthetic_source(width, height, face_image=None):
+    """Frame tạo sẵn: nền nhiễu + ảnh mặt (nếu có) di chuyển qua lại để FaceMesh phải bám theo"""
+    rng = np.random.default_rng(0)
+    background = rng.integers(40, 90, (height, width, 3), dtype=np.uint8)
+    face = cv2.imread(face_image) if face_image else None
+    if face is not None:
+        scale = min(0.6 * height / face.shape[0], 0.6 * width / face.shape[1])
+        face = cv2.resize(face, None, fx=scale, fy=scale)
+    state = {"i": 0}
+
+    def read():
+        frame = background.copy()
+        if face is not None:
+            fh, fw = face.shape[:2]
+            i = state["i"]
+            x = int((width - fw) / 2 + 0.15 * (width - fw) * np.sin(i / 40))
+            y = int((height - fh) / 2 + 0.15 * (height - fh) * np.sin(i / 23))
+            frame[y:y + fh, x:x + fw] = face
+        state["i"] += 1
+        return frame
+    return read, lambda: None
+
+
+# ================= ĐO TỪNG BƯỚC =================
+def make_label(display_size=DISPLAY_SIZE):
+    """QLabel giống video_label của main_gui (offscreen)"""
+    label = QLabel()
+    label.setStyleSheet("border:3px solid white; background:black;")
+    label.resize(*display_size)
+    label.show()
+    return label
+
+
+def run_benchmark(read_frame, n_frames, clf, detector, display_size=DISPLAY_SIZE, display_mode="fast"):
+    times = {stage: [] for stage in STAGES}
+    logic = DrowsinessLogic()
+    label = make_label(display_size)
+    display = FrameDisplay(label)
+    faces = 0
+    perf = time.perf_counter
+
+    for i in range(n_frames + WARMUP_FRAMES):
+        record = i >= WARMUP_FRAMES
+        t = {}
+        t_start = perf()
+        frame = read_frame()
+        t["decode"] = perf() - t_start
+
+        if display_mode == "fast":
+            t0 = perf(); frame = cv2.flip(frame, 1, dst=frame); t["flip"] = perf() - t0
+        else:
+            t0 = perf(); frame = cv2.flip(frame, 1); t["flip"] = perf() - t0
+        h, w = frame.shape[:2]
+
+        t0 = perf(); rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB); t["cvt_rgb"] = perf() - t0
+        t0 = perf(); results = detector.face_mesh.process(rgb); t["facemesh"] = perf() - t0
+
+        if results.multi_face_landmarks:
+            faces += record
+            t0 = perf(); points = landmarks_to_array(results.multi_face_landmarks[0]); t["landmarks"] = perf() - t0
+            t0 = perf(); features, bbox, nose = compute_features(points, w, h); t["features"] = perf() - t0
+            t0 = perf(); pred = clf.predict([features])[0]; t["predict"] = perf() - t0
+            t0 = perf(); decision = logic.update(features, nose, pred); t["logic"] = perf() - t0
+
+            t0 = perf()
+            (fx, fy, fw, fh) = bbox
+            cv2.rectangle(frame, (fx, fy), (fw, fh), decision.box_color, 2)
+            cv2.putText(frame, decision.status_text, (fx, fy - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.7, decision.box_color, 2)
+            cv2.putText(frame, f"NODS: {decision.nods}/{NOD_COUNT_THRESH}", (20, 50),
+                        cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 0), 2)
+            t["draw"] = perf() - t0
+
+        t_display = perf()
+        if display_mode == "fast":
+            display.show(frame)
+        else:
+            # Đường cũ của update_frame: đổi màu, QImage RGB888, QPixmap, scaled()
+            t0 = perf(); rgb_display = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB); t["display_cvt"] = perf() - t0
+            t0 = perf()
+            qt_img = QImage(rgb_display.data, w, h, w * 3, QImage.Format_RGB888)
+            pixmap = QPixmap.fromImage(qt_img)
+            t["qimage"] = perf() - t0
+            t0 = perf()
+            label.setPixmap(pixmap.scaled(label.size(), Qt.IgnoreAspectRatio, Qt.SmoothTransformation))
+            t["scaled"] = perf() - t0
+        t["display"] = perf() - t_display
+        t["end_to_end"] = perf() - t_start
+
+        if record:
+            for stage, value in t.items():
+                times[stage].append(value)
+    return times, faces
+
+
+def summarize(times, wall):
+    report = {}
+    for stage in STAGES:
+        values = np.array(times[stage]) * 1000
+        if len(values) == 0:
+            report[stage] = {"n": 0}
+            continue
+        report[stage] = {
+            "n": int(len(values)),
+            "mean_ms": float(values.mean()),
+            "p50_ms": float(np.percentile(values, 50)),
+            "p95_ms": float(np.percentile(values, 95)),
+            "p99_ms": float(np.percentile(values, 99)),
+            "throughput_fps": float(1000 / values.mean()) if values.mean() > 0 else 0.0,
+        }
+    report["end_to_end"]["wall_fps"] = len(times["end_to_end"]) / wall if wall > 0 else 0.0
+    return report
+
+
+def print_report(stages, baseline=None):
+    print(f"{'stage':<12}{'n':>6}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'fps':>10}" +
+          ("   p50 so với baseline" if baseline else ""))
+    for stage in STAGES:
+        s = stages[stage]
+        if s["n"] == 0:
+            print(f"{stage:<12}{0:>6}")
+            continue
+        line = (f"{stage:<12}{s['n']:>6}{s['p50_ms']:>10.3f}{s['p95_ms']:>10.3f}"
+                f"{s['p99_ms']:>10.3f}{s['throughput_fps']:>10.0f}")
+        old = (baseline or {}).get(stage, {})
+        if old.get("n"):
+            line += f"   {(s['p50_ms'] / old['p50_ms'] - 1) * 100:+.0f}%"
+        print(line)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Đo độ trễ từng bước của update_frame (headless)")
+    parser.add_argument("video", nargs="?", help="file video; bỏ trống để dùng frame tạo sẵn")
+    parser.add_argument("--frames", type=int, default=DEFAULT_FRAMES)
+    parser.add_argument("--size", default="1280x720", help="kích thước frame tạo sẵn, vd. 1920x1080")
+    parser.add_argument("--face-image", help="ảnh mặt người chèn vào frame tạo sẵn")
+    parser.add_argument("--backend", default="pickle", choices=["pickle", "lut", "native"])
+    parser.add_argument("--display", default="fast", choices=DISPLAY_MODES,
+                        help="fast: FrameDisplay (buffer cố định, BGR888) | legacy: đường hiển thị cũ")
+    parser.add_argument("--json", help="ghi kết quả ra file JSON")
+    parser.add_argument("--compare", help="file JSON của lần chạy trước để so sánh")
+    args = parser.parse_args()
+
+    app = QApplication(sys.argv)
+    if args.video:
+        read_frame, release = video_source(args.video, args.frames)
+        source = args.video
+    else:
+        width, height = (int(v) for v in args.size.lower().split("x"))
+        read_frame, release = synthetic_source(width, height, args.face_image)
+        source = f"synthetic {width}x{height}" + (f" + {args.face_image}" if args.face_image else "")
+
+    clf = load_classifier(args.backend, MODEL_PATH, LUT_PATH)
+    detector = FaceMeshDetector()
+    t0 = time.perf_counter()
+    times, faces = run_benchmark(read_frame, args.frames, clf, detector, display_mode=args.display)
+    wall = time.perf_counter() - t0
+    release()
+
+    result = {
+        "source": source,
+        "frames": args.frames,
+        "face_frames": faces,
+        "backend": args.backend,
+        "display": args.display,
+        "display_size": list(DISPLAY_SIZE),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "env": {"python": platform.python_version(), "opencv": cv2.__version__,
+                "machine": platform.machine(), "cpu_count": os.cpu_count()},
+        "stages": summarize(times, wall),
+    }
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)["stages"]
+    print(f"[INFO] {source}: {args.frames} frames, có mặt {faces}, backend={args.backend}, display={args.display}")
+    print_report(result["stages"], baseline)
+    print(f"end-to-end (wall): {result['stages']['end_to_end']['wall_fps']:.1f} fps")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+        print(f"✅ Đã lưu: {args.json}")
@@ -0,0 +1,111 @@
+import sys
+import time
+import json
+import argparse
+import numpy as np
+import cv2
+from face_utils import FaceMeshDetector
+from preprocessing import Preprocessor
+
+# --- CẤU HÌNH ---
+MAX_FRAMES = 300
+
+
+def legacy_preprocess(image):
+    """Cách cũ trong gom_file.py: tạo CLAHE mới + split / merge + cấp phát mới mỗi lần gọi"""
+    lab = cv2.cvtColor(image, cv2.COLOR_BGR2LAB)
+    l, a, b = cv2.split(lab)
+    clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
+    cl = clahe.apply(l)
+    enhanced_img = cv2.cvtColor(cv2.merge((cl, a, b)), cv2.COLOR_LAB2BGR)
+    kernel = np.array([[0, -1, 0], [-1, 5, -1], [0, -1, 0]])
+    return cv2.filter2D(enhanced_img, -1, kernel)
+
+
+def time_ms(fn, frames, bboxes):
+    times = []
+    for frame, bbox in zip(frames, bboxes):
+        t0 = time.perf_counter()
+        fn(frame, bbox)
+        times.append(time.perf_counter() - t0)
+    times = np.array(times) * 1000
+    return {"mean_ms": float(times.mean()), "p95_ms": float(np.percentile(times, 95))}
+
+
+def run_detector(frames, preprocessor=None):
+    """FaceMesh (có / không tiền xử lý) -> features (n,3), NaN khi mất mặt"""
+    detector = FaceMeshDetector()
+    feats = np.full((len(frames), 3), np.nan)
+    for i, frame in enumerate(frames):
+        if preprocessor is not None:
+            frame = preprocessor.apply(frame, detector.last_bbox)
+        features, _, _ = detector.extract_features(frame)
+        if features is not None:
+            feats[i] = features
+    return feats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Đo chi phí tiền xử lý CLAHE + làm nét: cả frame và chỉ vùng mặt")
+    parser.add_argument("video", help="video có mặt người")
+    parser.add_argument("--frames", type=int, default=MAX_FRAMES)
+    parser.add_argument("--no-facemesh", action="store_true", help="chỉ đo tiền xử lý, bỏ phần so sánh đặc trưng")
+    parser.add_argument("--json", help="ghi kết quả ra file JSON")
+    args = parser.parse_args()
+
+    cap = cv2.VideoCapture(args.video)
+    frames = []
+    while len(frames) < args.frames:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(cv2.flip(frame, 1))
+    cap.release()
+    if not frames:
+        sys.exit(f"Không đọc được frame nào từ {args.video}")
+    h, w = frames[0].shape[:2]
+    print(f"[1] {len(frames)} frames {w}x{h}")
+
+    # bbox của frame trước, như lúc chạy thật
+    detector = FaceMeshDetector()
+    bboxes = [None]
+    for frame in frames[:-1]:
+        detector.extract_features(frame)
+        bboxes.append(detector.last_bbox)
+
+    full = Preprocessor()
+    roi = Preprocessor(roi=True)
+    exact = all(np.array_equal(legacy_preprocess(f), full.apply(f)) for f in frames[:10])
+    report = {
+        "frames": len(frames),
+        "size": [w, h],
+        "face_bbox_ratio": float(np.mean([b is not None for b in bboxes])),
+        "legacy": time_ms(lambda f, b: legacy_preprocess(f), frames, bboxes),
+        "full": time_ms(lambda f, b: full.apply(f), frames, bboxes),
+        "roi": time_ms(lambda f, b: roi.apply(f, b), frames, bboxes),
+        "full_matches_legacy": exact,
+    }
+    print("[2] Tiền xử lý (ms/frame)   mean    p95")
+    for name in ("legacy", "full", "roi"):
+        print(f"    {name:<22}{report[name]['mean_ms']:>7.2f}{report[name]['p95_ms']:>7.2f}")
+    print(f"    full giống hệt cách cũ: {exact}")
+
+    if not args.no_facemesh:
+        raw_feats = run_detector(frames)
+        full_feats = run_detector(frames, Preprocessor())
+        roi_feats = run_detector(frames, Preprocessor(roi=True))
+        report["face_ratio"] = {name: float((~np.isnan(f[:, 0])).mean())
+                                for name, f in (("raw", raw_feats), ("full", full_feats), ("roi", roi_feats))}
+        both = ~np.isnan(full_feats[:, 0]) & ~np.isnan(roi_feats[:, 0])
+        report["roi_vs_full_abs_err"] = {
+            "mean": float(np.abs(full_feats[both] - roi_feats[both]).mean()) if both.any() else None,
+            "max": float(np.abs(full_feats[both] - roi_feats[both]).max()) if both.any() else None,
+        }
+        print("[3] Tỉ lệ thấy mặt: " + ", ".join(f"{k} {v * 100:.1f}%" for k, v in report["face_ratio"].items()))
+        err = report["roi_vs_full_abs_err"]
+        if err["mean"] is not None:
+            print(f"    Đặc trưng ROI so với cả frame: lệch TB {err['mean']:.4f}, tối đa {err['max']:.4f}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
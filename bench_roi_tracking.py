@@ -0,0 +1,88 @@
+import sys
+import time
+import json
+import argparse
+import numpy as np
+import cv2
+from face_utils import FaceMeshDetector
+
+# --- CẤU HÌNH ---
+MAX_FRAMES = 600
+
+
+def percentile_ms(values, q):
+    return float(np.percentile(values, q) * 1000) if len(values) else float("nan")
+
+
+def run_detector(detector, frames):
+    """Chạy detector trên list frame -> (features (n,3) NaN khi mất mặt, thời gian từng frame, số frame dùng ROI)"""
+    feats = np.full((len(frames), 3), np.nan)
+    times = []
+    roi_frames = 0
+    for i, frame in enumerate(frames):
+        t0 = time.perf_counter()
+        features, _, _ = detector.extract_features(frame)
+        times.append(time.perf_counter() - t0)
+        roi_frames += detector.roi_used
+        if features is not None:
+            feats[i] = features
+    return feats, np.array(times), roi_frames
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="So sánh FaceMesh toàn frame và chế độ ROI tracking")
+    parser.add_argument("video", help="video có mặt người (vd. camera cabin 1080p)")
+    parser.add_argument("--frames", type=int, default=MAX_FRAMES)
+    parser.add_argument("--roi-size", type=int, default=256)
+    parser.add_argument("--padding", type=float, default=0.35)
+    parser.add_argument("--json", help="ghi kết quả ra file JSON")
+    args = parser.parse_args()
+
+    cap = cv2.VideoCapture(args.video)
+    frames = []
+    while len(frames) < args.frames:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(cv2.flip(frame, 1))
+    cap.release()
+    if not frames:
+        sys.exit(f"Không đọc được frame nào từ {args.video}")
+    h, w = frames[0].shape[:2]
+    print(f"[1] {len(frames)} frames {w}x{h}")
+
+    full_feats, full_t, _ = run_detector(FaceMeshDetector(), frames)
+    roi_feats, roi_t, roi_frames = run_detector(
+        FaceMeshDetector(tracking=True, roi_padding=args.padding, roi_size=args.roi_size), frames)
+
+    both = ~np.isnan(full_feats[:, 0]) & ~np.isnan(roi_feats[:, 0])
+    err = np.abs(full_feats[both] - roi_feats[both])
+    report = {
+        "frames": len(frames),
+        "resolution": [w, h],
+        "full": {"p50_ms": percentile_ms(full_t, 50), "p95_ms": percentile_ms(full_t, 95),
+                 "face_rate": float((~np.isnan(full_feats[:, 0])).mean())},
+        "tracking": {"p50_ms": percentile_ms(roi_t, 50), "p95_ms": percentile_ms(roi_t, 95),
+                     "face_rate": float((~np.isnan(roi_feats[:, 0])).mean()),
+                     "roi_rate": roi_frames / len(frames)},
+        "feature_error": {
+            name: {"mean": float(err[:, i].mean()) if len(err) else None,
+                   "p95": float(np.percentile(err[:, i], 95)) if len(err) else None,
+                   "max": float(err[:, i].max()) if len(err) else None}
+            for i, name in enumerate(["LeftEAR", "RightEAR", "MAR"])
+        },
+    }
+
+    print(f"[2] Toàn frame : p50 {report['full']['p50_ms']:.1f} ms | p95 {report['full']['p95_ms']:.1f} ms | "
+          f"thấy mặt {report['full']['face_rate'] * 100:.0f}%")
+    print(f"    ROI tracking: p50 {report['tracking']['p50_ms']:.1f} ms | p95 {report['tracking']['p95_ms']:.1f} ms | "
+          f"thấy mặt {report['tracking']['face_rate'] * 100:.0f}% | chạy trên ROI {report['tracking']['roi_rate'] * 100:.0f}%")
+    print(f"    Tăng tốc p50: x{report['full']['p50_ms'] / report['tracking']['p50_ms']:.2f}")
+    print(f"[3] Sai khác feature so với toàn frame ({int(both.sum())} frame cùng thấy mặt):")
+    for name, e in report["feature_error"].items():
+        if e["mean"] is not None:
+            print(f"    {name:<9} mean {e['mean']:.4f} | p95 {e['p95']:.4f} | max {e['max']:.4f}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
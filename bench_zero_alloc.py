@@ -0,0 +1,353 @@
+import gc
+import sys
+import time
+import json
+import argparse
+import warnings
+import tracemalloc
+import numpy as np
+import cv2
+
+from clock import ManualClock
+from engine import DrowsinessEngine
+from pipeline import FramePool, FramePipeline
+
+warnings.filterwarnings("ignore", message="X does not have valid feature names")
+
+# --- CẤU HÌNH ---
+MODEL_PATH = "drowsiness_ensemble.pkl"
+LUT_PATH = "drowsiness_lut.npz"
+DISPLAY_SIZE = (894, 654)      # contentsRect của video_label (900x660, viền 3px)
+WARMUP_FRAMES = 100
+MEASURE_FRAMES = 600
+THREADED_SECONDS = 10.0
+# Đồng hồ giả bước 3.5 s / frame: sau warm-up các cửa sổ PERCLOS (60 s) / ngáp (300 s) đã đầy,
+# số mẫu giữ lại không đổi nữa -> mọi phần bộ nhớ tăng thêm đều là rò rỉ theo frame
+CLOCK_STEP_S = 3.5
+# Bộ nhớ còn giữ (đo sau gc.collect() mỗi SAMPLE_EVERY frame), hệ số góc (byte / frame) phải ~0.
+# MediaPipe tạo 1 class namedtuple mỗi lần process() (rác vòng, chỉ GC đầy đủ mới dọn) và cache của
+# sklearn / joblib lên xuống vài chục KB, nên không so 2 thời điểm mà fit đường thẳng qua các mẫu
+SAMPLE_EVERY = 25
+MAX_SLOPE_B = 16
+# Chế độ --synthetic: frame giả + detector / model giả, không cần video, MediaPipe hay model đã train
+SYNTHETIC_SHAPE = (480, 640, 3)
+SYNTHETIC_PERIOD = 200         # số frame 1 chu kỳ tỉnh -> nhắm mắt -> ngáp của detector giả
+
+
+class GcPauses:
+    """Đo thời gian các lần GC thế hệ 2 tự chạy (bỏ qua gc.collect() của chính phép đo)"""
+    def __init__(self):
+        self.pauses = []
+        self.paused = False
+        self._t0 = None
+
+    def __call__(self, phase, info):
+        if info["generation"] != 2 or self.paused:
+            return
+        if phase == "start":
+            self._t0 = time.perf_counter()
+        elif self._t0 is not None:
+            self.pauses.append(time.perf_counter() - self._t0)
+            self._t0 = None
+
+    def sample(self):
+        """gc.collect() rồi đọc bộ nhớ còn giữ"""
+        self.paused = True
+        gc.collect()
+        self.paused = False
+        return tracemalloc.get_traced_memory()[0]
+
+    def summary(self):
+        ms = np.array(self.pauses) * 1000
+        return {"gen2_collections": len(ms), "max_ms": float(ms.max()) if len(ms) else 0.0}
+
+
+class LoopingCapture:
+    """Video đọc vòng lặp (hết thì quay lại đầu), cùng giao diện read / grab với cv2.VideoCapture"""
+    def __init__(self, path):
+        self.cap = cv2.VideoCapture(path)
+        if not self.cap.isOpened():
+            sys.exit(f"Không mở được video: {path}")
+
+    def read(self, image=None):
+        ret, frame = self.cap.read(image)
+        if not ret:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ret, frame = self.cap.read(image)
+        return ret, frame
+
+    def grab(self):
+        return self.read()[0]
+
+    def release(self):
+        self.cap.release()
+
+
+class SyntheticCapture:
+    """Frame giả tô 1 màu đổi theo frame, ghi vào buffer truyền vào như cv2.VideoCapture.read(image)"""
+    def __init__(self, shape=SYNTHETIC_SHAPE):
+        self.shape = shape
+        self.index = 0
+
+    def read(self, image=None):
+        if image is None:
+            image = np.empty(self.shape, dtype=np.uint8)
+        image.fill(self.index % 256)
+        self.index += 1
+        return True, image
+
+    def release(self):
+        pass
+
+
+class SyntheticDetector:
+    """
+    Thay FaceMeshDetector: đặc trưng đi qua các pha tỉnh / nhắm mắt / ngáp theo SYNTHETIC_PERIOD
+    để logic ngủ / ngáp / cảnh báo đều chạy; mảng đặc trưng cấp sẵn, ghi đè mỗi frame.
+    """
+    def __init__(self):
+        self.last_bbox = None
+        self.frames = 0
+        self._features = np.empty(3)
+
+    def extract_features(self, frame):
+        phase = self.frames % SYNTHETIC_PERIOD / SYNTHETIC_PERIOD
+        self.frames += 1
+        closed, yawning = 0.3 <= phase < 0.6, phase >= 0.8
+        self._features[0] = self._features[1] = 0.1 if closed else 0.3
+        self._features[2] = 0.7 if yawning else 0.2
+        h, w = frame.shape[:2]
+        self.last_bbox = (w // 4, h // 4, 3 * w // 4, 3 * h // 4)
+        return self._features, self.last_bbox, (w // 2, h // 2)
+
+
+class SyntheticModel:
+    """Thay model sklearn: nhãn theo ngưỡng EAR / MAR, trả về mảng cấp sẵn như clf.predict"""
+    def __init__(self):
+        self._out = np.zeros(1, dtype=np.int64)
+
+    def predict(self, X):
+        self._out[0] = 1 if X[0, 0] < 0.2 else 2 if X[0, 2] > 0.4 else 0
+        return self._out
+
+
+def draw(frame, bbox, decision):
+    """Vẽ tại chỗ giống update_frame"""
+    h, w = frame.shape[:2]
+    if decision.is_warning:
+        cv2.rectangle(frame, (0, 0), (w, h), (0, 0, 255), 10)
+    cv2.rectangle(frame, bbox[:2], bbox[2:], decision.box_color, 2)
+    cv2.putText(frame, decision.status_text, (bbox[0], bbox[1] - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.7,
+                decision.box_color, 2)
+
+
+def slope_b(samples):
+    """Hệ số góc (byte / frame) của bộ nhớ còn giữ, mẫu lấy mỗi SAMPLE_EVERY frame"""
+    samples = np.asarray(samples, dtype=np.float64)
+    if len(samples) < 2:
+        return 0.0
+    return float(np.polyfit(np.arange(len(samples)) * SAMPLE_EVERY, samples, 1)[0])
+
+
+def growth_kb(before, after):
+    """Bộ nhớ tăng thêm giữa 2 snapshot (bỏ phần của chính tracemalloc), kèm 5 chỗ tăng nhiều nhất"""
+    filters = [tracemalloc.Filter(False, tracemalloc.__file__)]
+    stats = after.filter_traces(filters).compare_to(before.filter_traces(filters), "lineno")
+    total = sum(s.size_diff for s in stats) / 1024
+    top = [f"{s.traceback[0].filename.split('/')[-1]}:{s.traceback[0].lineno} {s.size_diff / 1024:+.1f} KB"
+           for s in sorted(stats, key=lambda s: -s.size_diff)[:5] if s.size_diff > 0]
+    return total, top
+
+
+def run_loop(cap, clf, detector, reuse, warmup, frames):
+    """
+    Vòng lặp GUI trên 1 thread: đọc camera -> lật -> FaceMesh + model -> logic -> vẽ -> resize hiển thị.
+    reuse=True: FramePool + cap.read(buf); False: cap.read() cấp phát frame mới như trước.
+    Trả về (cấp phát tạm mỗi frame KB: mean / max, byte tăng / frame, bộ nhớ tăng sau warm-up KB,
+    chỗ tăng nhiều nhất, GC thế hệ 2 tự chạy).
+    """
+    clock = ManualClock()
+    engine = DrowsinessEngine(clf, detector, clock=clock)
+    display = np.empty((DISPLAY_SIZE[1], DISPLAY_SIZE[0], 3), dtype=np.uint8)
+    pool = FramePool(2) if reuse else None
+    # cấp phát trước để chính phép đo không làm tăng bộ nhớ
+    transient = np.zeros(frames)
+    retained = np.zeros((frames - 1) // SAMPLE_EVERY + 1)   # mẫu ở frame 0, SAMPLE_EVERY, ...
+    gc_pauses = GcPauses()
+    before = None
+    for i in range(warmup + frames):
+        if i == warmup:
+            gc_pauses.sample()
+            before = tracemalloc.take_snapshot()
+            gc.callbacks.append(gc_pauses)
+        current = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+
+        buf = pool.acquire() if pool is not None and pool.shape is not None else None
+        ret, frame = cap.read(buf) if buf is not None else cap.read()
+        if pool is not None and pool.shape is None:
+            pool.configure(frame.shape)
+        cv2.flip(frame, 1, dst=frame)
+        clock.advance(CLOCK_STEP_S)
+        features, bbox, nose, pred = engine.infer(frame)
+        if features is not None:
+            draw(frame, bbox, engine.step(features, nose, pred))
+        cv2.resize(frame, DISPLAY_SIZE, dst=display)
+        if pool is not None:
+            pool.release(frame)
+        del frame
+
+        if i >= warmup:
+            transient[i - warmup] = tracemalloc.get_traced_memory()[1] - current
+            if (i - warmup) % SAMPLE_EVERY == 0:
+                retained[(i - warmup) // SAMPLE_EVERY] = gc_pauses.sample()
+    gc.callbacks.remove(gc_pauses)
+    gc_pauses.sample()
+    total, top = growth_kb(before, tracemalloc.take_snapshot())
+    cap.release()
+    transient /= 1024
+    return float(transient.mean()), float(transient.max()), slope_b(retained), total, top, gc_pauses.summary()
+
+
+def check_synthetic(warmup=WARMUP_FRAMES, frames=MEASURE_FRAMES, max_slope=MAX_SLOPE_B):
+    """
+    Kiểm tra tự chứa (không cần video / MediaPipe / model): vòng lặp ổn định với FramePool,
+    detector và model giả; assert không tăng bộ nhớ theo frame và không cấp phát buffer cỡ ảnh.
+    """
+    started = not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start()
+    try:
+        mean_kb, max_kb, slope, total, top, gcs = run_loop(SyntheticCapture(), SyntheticModel(), SyntheticDetector(),
+                                                           True, warmup, frames)
+    finally:
+        if started:
+            tracemalloc.stop()
+    frame_kb = np.prod(SYNTHETIC_SHAPE) / 1024
+    assert slope <= max_slope, f"bộ nhớ tăng {slope:.1f} B / frame > {max_slope:g}: " + "; ".join(top)
+    assert max_kb <= frame_kb / 4, f"vẫn cấp phát buffer cỡ ảnh mỗi frame ({max_kb:.0f} KB)"
+    return {"transient_mean_kb": mean_kb, "transient_max_kb": max_kb, "slope_b_per_frame": slope,
+            "growth_kb": total, "gc": gcs}
+
+
+def run_threaded(video, clf, seconds, warmup_seconds=2.0):
+    """FramePipeline thật (capture + inference thread, reuse_frames=True), GUI giả ở thread chính"""
+    from face_utils import FaceMeshDetector
+    clock = ManualClock()
+    engine = DrowsinessEngine(clf, FaceMeshDetector(), clock=clock)
+    display = np.empty((DISPLAY_SIZE[1], DISPLAY_SIZE[0], 3), dtype=np.uint8)
+    cap = LoopingCapture(video)
+    pipeline = FramePipeline(engine.infer, reuse_frames=True)
+    pipeline.start(cap)
+    t_start = time.perf_counter()
+    before = None
+    shown = 0
+    retained = np.zeros(int(seconds * 1000) // SAMPLE_EVERY + 1)   # đủ cho 1000 fps
+    gc_pauses = GcPauses()
+    while time.perf_counter() - t_start < warmup_seconds + seconds:
+        if before is None and time.perf_counter() - t_start >= warmup_seconds:
+            gc_pauses.sample()
+            before = tracemalloc.take_snapshot()
+            gc.callbacks.append(gc_pauses)
+        result = pipeline.latest_result()
+        if result is None:
+            time.sleep(0.005)
+            continue
+        if result.features is not None:
+            clock.advance(CLOCK_STEP_S)
+            draw(result.frame, result.bbox, engine.step(result.features, result.nose, result.pred))
+        cv2.resize(result.frame, DISPLAY_SIZE, dst=display)
+        pipeline.release(result)
+        if before is not None:
+            if shown % SAMPLE_EVERY == 0 and shown // SAMPLE_EVERY < len(retained):
+                retained[shown // SAMPLE_EVERY] = gc_pauses.sample()
+            shown += 1
+    gc.callbacks.remove(gc_pauses)
+    gc_pauses.sample()
+    total, top = growth_kb(before, tracemalloc.take_snapshot())
+    pipeline.stop()
+    cap.release()
+    samples = retained[:min((shown - 1) // SAMPLE_EVERY + 1, len(retained))] if shown else retained[:0]
+    return slope_b(samples), total, top, shown, pipeline.pool.stats(), gc_pauses.summary()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Kiểm tra vòng lặp frame ổn định không cấp phát buffer mới (tracemalloc)")
+    parser.add_argument("video", nargs="?", help="video có mặt người (không cần với --synthetic)")
+    parser.add_argument("--synthetic", action="store_true",
+                        help="chỉ chạy kiểm tra tự chứa với frame / detector / model giả (assert, không cần video)")
+    parser.add_argument("--backend", default="pickle", choices=["pickle", "lut", "native"])
+    parser.add_argument("--warmup", type=int, default=WARMUP_FRAMES)
+    parser.add_argument("--frames", type=int, default=MEASURE_FRAMES)
+    parser.add_argument("--threaded-seconds", type=float, default=THREADED_SECONDS,
+                        help="chạy thêm FramePipeline thật trong N giây (0 = bỏ qua)")
+    parser.add_argument("--tracking", action="store_true", help="FaceMesh chạy trên ROI vùng mặt")
+    parser.add_argument("--no-freeze", action="store_true", help="không gc.freeze() sau khi load (như main_gui)")
+    parser.add_argument("--max-slope", type=float, default=MAX_SLOPE_B, help="byte / frame")
+    parser.add_argument("--json", help="ghi kết quả ra file JSON")
+    args = parser.parse_args()
+
+    if args.synthetic:
+        result = check_synthetic(args.warmup, args.frames, args.max_slope)
+        print(f"✅ Frame giả: tăng {result['slope_b_per_frame']:.1f} B / frame (≤ {args.max_slope:g}), "
+              f"tạm tối đa {result['transient_max_kb']:.1f} KB / frame")
+        raise SystemExit(0)
+    if args.video is None:
+        parser.error("cần video (hoặc --synthetic)")
+
+    from face_utils import FaceMeshDetector
+    from model_loader import load_classifier
+    clf = load_classifier(args.backend, MODEL_PATH, LUT_PATH)
+    FaceMeshDetector().extract_features(np.zeros((480, 640, 3), dtype=np.uint8))   # import / khởi tạo MediaPipe
+    if not args.no_freeze:
+        gc.freeze()
+    tracemalloc.start()
+    report = {"frames": args.frames, "warmup": args.warmup, "max_slope_b": args.max_slope}
+    failed = False
+
+    cap = cv2.VideoCapture(args.video)
+    ret, frame = cap.read()
+    cap.release()
+    if not ret:
+        sys.exit(f"Không đọc được frame nào từ {args.video}")
+    frame_kb = frame.nbytes / 1024
+    report["frame_kb"] = frame_kb
+
+    print(f"[1] Vòng lặp GUI 1 thread ({args.warmup} frame warm-up + {args.frames} frame đo, frame {frame_kb:.0f} KB)")
+    print(f"    {'chế độ':<10}{'tạm/frame TB':>14}{'max':>10}{'tăng / frame':>14}{'GC thế hệ 2':>20}")
+    for name, reuse in (("cấp phát", False), ("dùng lại", True)):
+        mean_kb, max_kb, slope, total, top, gcs = run_loop(LoopingCapture(args.video), clf,
+                                                           FaceMeshDetector(tracking=args.tracking),
+                                                           reuse, args.warmup, args.frames)
+        report["reuse" if reuse else "alloc"] = {"transient_mean_kb": mean_kb, "transient_max_kb": max_kb,
+                                                 "slope_b_per_frame": slope, "growth_kb": total,
+                                                 "top_growth": top, "gc": gcs}
+        print(f"    {name:<10}{mean_kb:>11.0f} KB{max_kb:>7.0f} KB{slope:>12.1f} B"
+              f"{gcs['gen2_collections']:>8} lần, max {gcs['max_ms']:.1f} ms")
+        if not reuse:
+            continue
+        if slope > args.max_slope:
+            failed = True
+            print("    ❌ bộ nhớ tăng theo frame: " + "; ".join(top))
+        if max_kb > frame_kb / 4:
+            failed = True
+            print(f"    ❌ vẫn cấp phát buffer cỡ ảnh mỗi frame ({max_kb:.0f} KB)")
+
+    if args.threaded_seconds > 0:
+        slope, total, top, shown, pool, gcs = run_threaded(args.video, clf, args.threaded_seconds)
+        report["threaded"] = {"seconds": args.threaded_seconds, "frames_shown": shown, "slope_b_per_frame": slope,
+                              "growth_kb": total, "top_growth": top, "frame_pool": pool, "gc": gcs}
+        print(f"[2] FramePipeline thật {args.threaded_seconds:.0f}s: {shown} frame hiển thị, tăng {slope:.1f} B / frame "
+              f"({total:+.1f} KB), pool {pool['allocated']} buffer, hết buffer {pool['misses']} lần, "
+              f"GC thế hệ 2 max {gcs['max_ms']:.1f} ms")
+        if slope > args.max_slope:
+            failed = True
+            print("    ❌ bộ nhớ tăng theo frame: " + "; ".join(top))
+
+    print("❌ Vòng lặp ổn định vẫn cấp phát / tăng bộ nhớ" if failed
+          else f"✅ Không cấp phát buffer ảnh, không tăng bộ nhớ sau warm-up (≤ {args.max_slope:g} B / frame)")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    raise SystemExit(1 if failed else 0)
@@ -0,0 +1,36 @@
+import time
+from datetime import datetime
+
+
+# ================= ĐỒNG HỒ DÙNG CHUNG CHO LOGIC THỜI GIAN =================
+class SystemClock:
+    """Đồng hồ thật (chạy live)"""
+    def time(self):
+        return time.time()
+
+    def now(self):
+        return datetime.now()
+
+
+class ManualClock:
+    """
+    Đồng hồ điều khiển bằng tay: replay video / timeline theo timestamp của frame,
+    nhanh hết tốc độ CPU thay vì chờ đồng hồ thật.
+    """
+    def __init__(self, start=0.0):
+        self.t = float(start)
+
+    def time(self):
+        return self.t
+
+    def now(self):
+        return datetime.fromtimestamp(self.t)
+
+    def set(self, t):
+        self.t = float(t)
+
+    def advance(self, seconds):
+        self.t += seconds
+
+
+SYSTEM_CLOCK = SystemClock()
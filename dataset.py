@@ -1,9 +1,26 @@
 import cv2
 import os
+import time
+from concurrent.futures import ProcessPoolExecutor
 
 # --- CẤU HÌNH ---
 TARGET_COUNT = 145
 
+# "sequential": giải mã video 1 lượt (grab bỏ qua frame thừa, retrieve frame cần lấy)
+# "seek": cách cũ, nhảy tới từng frame bằng CAP_PROP_POS_FRAMES (chậm với H.264 dài)
+SAMPLE_MODE = "sequential"
+
+# ".jpg" như cũ; ".bmp" ghi nhanh nhất (không nén); ".png" (nén mức 1) không mất chất lượng
+IMAGE_EXT = ".jpg"
+WRITE_PARAMS = {
+    ".jpg": [],
+    ".png": [cv2.IMWRITE_PNG_COMPRESSION, 1],
+    ".bmp": [],
+}
+
+# Số video xử lý song song
+N_WORKERS = os.cpu_count()
+
 TASKS = [
     # Bạn cứ thêm video mới vào đây thoải mái, ảnh cũ vẫn còn nguyên
     ("C://Users//TanLoc//OneDrive//Desktop//Project_TGM_HM//video//deokinh.mp4",   "C://Users//TanLoc//OneDrive//Desktop//Project_TGM_HM//dataset//open"),
@@ -12,14 +29,53 @@ TASKS = [
     # ("C://Users//...//Khoa_open.mp4", "C://Users//...//dataset//open"),
 ]
 
-for video_path, output_folder in TASKS:
+
+def sample_indices(total_frames, target_count=TARGET_COUNT):
+    """Chỉ số frame cần lấy, trải đều trên toàn video"""
+    indices = []
+    for i in range(target_count):
+        frame_idx = int(i * (total_frames / target_count))
+        if frame_idx >= total_frames:
+            break
+        indices.append(frame_idx)
+    return indices
+
+
+def iter_frames_seek(cap, indices):
+    """Cách cũ: seek tới từng frame -> mỗi lần phải giải mã lại từ keyframe"""
+    for frame_idx in indices:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, frame_idx)
+        ret, frame = cap.read()
+        yield frame_idx, (frame if ret else None)
+
+
+def iter_frames_sequential(cap, indices):
+    """Giải mã tuần tự 1 lượt: grab() mọi frame, chỉ retrieve() frame được chọn"""
+    pos = 0
+    for frame_idx in indices:
+        while pos <= frame_idx:
+            if not cap.grab():
+                yield frame_idx, None
+                return
+            pos += 1
+        # frame_idx có thể lặp lại khi video ngắn hơn TARGET_COUNT -> retrieve lại frame vừa grab
+        ret, frame = cap.retrieve()
+        yield frame_idx, (frame if ret else None)
+
+
+SAMPLERS = {"seek": iter_frames_seek, "sequential": iter_frames_sequential}
+
+
+def process_video(task, mode=SAMPLE_MODE, ext=IMAGE_EXT, target_count=TARGET_COUNT):
+    """Lấy mẫu 1 video -> (số ảnh đã lưu, log)"""
+    video_path, output_folder = task
+    log = []
+
     # 1. Tạo folder nếu chưa có
-    if not os.path.exists(output_folder): 
-        os.makedirs(output_folder)
-    
+    os.makedirs(output_folder, exist_ok=True)
+
     if not os.path.exists(video_path):
-        print(f"[BỎ QUA] Không tìm thấy file: {video_path}")
-        continue
+        return 0, [f"[BỎ QUA] Không tìm thấy file: {video_path}"]
 
     # --- [SỬA QUAN TRỌNG] Lấy tên file video để làm tên ảnh ---
     # Ví dụ: video_path là ".../Chopper_open.mp4" -> base_name sẽ là "Chopper_open"
@@ -27,35 +83,37 @@ for video_path, output_folder in TASKS:
 
     cap = cv2.VideoCapture(video_path)
     total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-    
+
     if total_frames == 0:
-        print(f"[LỖI] Video {video_path} bị lỗi.")
-        continue
+        cap.release()
+        return 0, [f"[LỖI] Video {video_path} bị lỗi."]
 
-    print(f"--- Đang xử lý: {base_name} ---")
-    print(f"    Tổng độ dài: {total_frames} frames. Mục tiêu: Lấy {TARGET_COUNT} ảnh.")
+    log.append(f"--- Đang xử lý: {base_name} ({mode}) ---")
+    log.append(f"    Tổng độ dài: {total_frames} frames. Mục tiêu: Lấy {target_count} ảnh.")
 
     saved_count = 0
-    
-    for i in range(TARGET_COUNT):
-        frame_idx = int(i * (total_frames / TARGET_COUNT))
-        
-        if frame_idx >= total_frames:
-            break
-            
-        cap.set(cv2.CAP_PROP_POS_FRAMES, frame_idx)
-        
-        ret, frame = cap.read()
-        if ret:
+    params = WRITE_PARAMS.get(ext, [])
+    for frame_idx, frame in SAMPLERS[mode](cap, sample_indices(total_frames, target_count)):
+        if frame is not None:
             # --- [SỬA QUAN TRỌNG] Đặt tên file theo Tên Video + Số thứ tự ---
             # Kết quả: Chopper_open_0.jpg, Chopper_open_1.jpg ...
-            filename = f"{output_folder}/{base_name}_{saved_count}.jpg"
-            
-            cv2.imwrite(filename, frame)
+            filename = f"{output_folder}/{base_name}_{saved_count}{ext}"
+
+            cv2.imwrite(filename, frame, params)
             saved_count += 1
         else:
-            print(f"    [Cảnh báo] Lỗi frame thứ {frame_idx}")
+            log.append(f"    [Cảnh báo] Lỗi frame thứ {frame_idx}")
 
     cap.release()
 
-    print(f"✅ HOÀN TẤT: Đã thêm {saved_count} ảnh từ video '{base_name}' vào dataset.\n")
+    log.append(f"✅ HOÀN TẤT: Đã thêm {saved_count} ảnh từ video '{base_name}' vào dataset.\n")
+    return saved_count, log
+
+
+if __name__ == "__main__":
+    t0 = time.perf_counter()
+    # Mỗi video 1 process: giải mã H.264 là việc nặng CPU
+    with ProcessPoolExecutor(max_workers=N_WORKERS) as pool:
+        for saved_count, log in pool.map(process_video, TASKS):
+            print("\n".join(log))
+    print(f"Tổng thời gian: {time.perf_counter() - t0:.1f}s")
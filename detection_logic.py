@@ -0,0 +1,217 @@
+from clock import SYSTEM_CLOCK
+
+# ================= NGƯỠNG LOGIC =================
+EYE_CLOSE_TIME_THRESH = 2.0
+YAWN_TIME_THRESH = 1.0
+NOD_COUNT_THRESH = 8
+NOD_RESET_TIME = 4.0
+AWAKE_STOP_ALARM_SEC = 5.0     # tỉnh táo liên tục bấy nhiêu giây thì tự tắt chuông
+
+# Nhãn của model
+LABEL_NORMAL = 0
+LABEL_SLEEP = 1
+LABEL_YAWN = 2
+
+
+# ================= CLASS LOGIC GẬT ĐẦU =================
+class NodDetector:
+    def __init__(self, clock=None):
+        self.clock = clock or SYSTEM_CLOCK
+        self.reset()
+        self.threshold = 60
+        self.awake_start_time = None
+        self.AWAKE_STOP_ALARM_TIME = 5.0  # giây
+        self.total_drive_seconds = 0        # tổng thời gian lái trong ngày
+        self.daily_drive_seconds_cache = 0  # cache khi stop/start
+        self.session_drive_seconds = 0      # thời gian phiên hiện tại
+
+    def reset(self, now=None):
+        """Hàm reset trạng thái về ban đầu"""
+        self.min_y = None; self.max_y = None
+        self.state = 0; self.nod_count = 0
+        self.last_nod_time = self.clock.time() if now is None else now
+
+    def update(self, nose_y, now=None):
+        current_time = self.clock.time() if now is None else now
+        # Reset nếu lâu quá không gật tiếp
+        if current_time - self.last_nod_time > NOD_RESET_TIME and self.nod_count > 0:
+            if self.nod_count < NOD_COUNT_THRESH:
+                self.nod_count = 0; self.state = 0
+
+        if self.min_y is None: self.min_y = nose_y; self.max_y = nose_y; return 0
+        self.min_y = min(self.min_y, nose_y)
+        self.max_y = max(self.max_y, nose_y)
+
+        # State Machine: 0->1->2->Count
+        if self.state == 0:
+            if nose_y > self.min_y + self.threshold: self.state = 1
+        elif self.state == 1:
+            if nose_y < self.max_y - self.threshold: self.state = 2
+        elif self.state == 2:
+             if nose_y < self.max_y - self.threshold:
+                self.nod_count += 1
+                self.last_nod_time = current_time
+                self.min_y = nose_y; self.max_y = nose_y; self.state = 0
+        return self.nod_count
+
+
+# ================= KẾT QUẢ 1 FRAME =================
+class FrameDecision:
+    """Kết quả logic của 1 frame có mặt (dùng để vẽ, báo động và ghi log)"""
+    __slots__ = ("pred", "status_text", "box_color", "is_warning", "has_error",
+                 "nods", "sleep_elapsed", "yawn_elapsed")
+
+    def __init__(self, pred):
+        self.pred = pred
+        self.status_text = "NORMAL"
+        self.box_color = (0, 255, 0)
+        self.is_warning = False
+        self.has_error = False
+        self.nods = 0
+        self.sleep_elapsed = 0.0
+        self.yawn_elapsed = 0.0
+
+
+# ================= LOGIC NGỦ / NGÁP / GẬT ĐẦU =================
+class DrowsinessLogic:
+    """
+    Logic quyết định theo từng frame (không phụ thuộc Qt):
+    ghi đè nhãn theo MAR, đếm thời gian nhắm mắt / ngáp, gật đầu và điểm SLEEP/YAWN/AWAKE.
+    Không truyền now thì đọc thời gian từ clock (mặc định đồng hồ thật).
+    """
+    def __init__(self, clock=None):
+        self.clock = clock or SYSTEM_CLOCK
+        self.nod_logic = NodDetector(self.clock)
+        self.reset()
+
+    def reset(self, now=None):
+        self.nod_logic.reset(now)
+        self.eye_start = None
+        self.yawn_start = None
+        self.score_sleep = 0.0
+        self.score_yawn = 0.0
+        self.score_alert = 100.0
+
+    def update(self, features, nose, pred, now=None):
+        """features: [LeftEAR, RightEAR, MAR], nose: (x, y), pred: nhãn của model"""
+        if now is None:
+            now = self.clock.time()
+
+        # Logic Ghi đè AI
+        mar = features[2]
+        if mar > 0.4: pred = LABEL_YAWN
+        elif pred == LABEL_YAWN and mar < 0.3: pred = LABEL_NORMAL
+
+        decision = FrameDecision(pred)
+
+        # Logic Gật đầu
+        nods = self.nod_logic.update(nose[1], now)
+        decision.nods = nods
+
+        # 1. XỬ LÝ NGỦ (SLEEP)
+        if pred == LABEL_SLEEP:
+            if self.eye_start is None: self.eye_start = now
+            elapsed = now - self.eye_start
+            decision.sleep_elapsed = elapsed
+            decision.status_text = f"SLEEP: {elapsed:.1f}s"
+            decision.box_color = (0, 165, 255)
+            decision.has_error = True
+
+            # Tăng điểm Sleep (max 100)
+            self.score_sleep = min(self.score_sleep + 0.5, 100)
+
+            if elapsed > EYE_CLOSE_TIME_THRESH: decision.is_warning = True
+        else:
+            self.eye_start = None
+            # Giảm điểm Sleep từ từ
+            self.score_sleep = max(self.score_sleep - 0.2, 0)
+
+        # 2. XỬ LÝ NGÁP (YAWN)
+        if pred == LABEL_YAWN:
+            if self.yawn_start is None: self.yawn_start = now
+            dur = now - self.yawn_start
+            decision.yawn_elapsed = dur
+            if dur > YAWN_TIME_THRESH:
+                decision.status_text = f"YAWN !!! ({dur:.1f}s)"
+                decision.box_color = (0, 255, 255)
+                decision.has_error = True
+                # Tăng điểm Yawn
+                self.score_yawn = min(self.score_yawn + 0.5, 100)
+            else:
+                decision.status_text = " "
+                decision.box_color = (200, 255, 200)
+        else:
+            self.yawn_start = None
+            # Giảm điểm Yawn từ từ
+            self.score_yawn = max(self.score_yawn - 0.2, 0)
+
+        # 3. XỬ LÝ GẬT ĐẦU
+        if nods >= NOD_COUNT_THRESH:
+            decision.is_warning = True
+            decision.has_error = True
+            decision.status_text = "SLEEP !!!"
+            # Phạt nặng điểm Sleep
+            self.score_sleep = min(self.score_sleep + 2.0, 100)
+
+        # --- TÍNH ĐIỂM BÙ TRỪ (TỔNG 100%) ---
+        # Công thức: Awake = 100 - (Sleep + Yawn)
+        # Nếu Sleep + Yawn > 100 thì co lại cho phù hợp
+        total_fatigue = self.score_sleep + self.score_yawn
+
+        if total_fatigue > 100:
+            # Nếu tổng mệt > 100, chuẩn hóa lại theo tỉ lệ
+            ratio = 100 / total_fatigue
+            self.score_sleep *= ratio
+            self.score_yawn *= ratio
+            self.score_alert = 0
+        else:
+            self.score_alert = 100 - total_fatigue
+
+        return decision
+
+
+# ================= CHUÔNG BÁO NGỦ =================
+class AlarmLatch:
+    """
+    Trạng thái chuông báo ngủ của GUI (không phụ thuộc Qt / pygame):
+    bật khi frame có cảnh báo, tự tắt sau AWAKE_STOP_ALARM_SEC tỉnh táo liên tục, tắt ngay khi bấm mute.
+    Ngủ lại thì tự bỏ mute. update() trả về "start" / "stop" / None để nơi gọi bật / tắt âm thanh.
+    """
+    def __init__(self, awake_stop_seconds=AWAKE_STOP_ALARM_SEC, clock=None):
+        self.awake_stop_seconds = awake_stop_seconds
+        self.clock = clock or SYSTEM_CLOCK
+        self.playing = False
+        self.muted = False
+        self.awake_start = None
+
+    def update(self, is_warning, now=None):
+        """Gọi cho mỗi frame có mặt"""
+        if now is None:
+            now = self.clock.time()
+        if is_warning:
+            self.awake_start = None
+            self.muted = False
+            if not self.playing:
+                self.playing = True
+                return "start"
+            return None
+        if self.muted:
+            self.awake_start = None
+            return self.stop()
+        if self.awake_start is None:
+            self.awake_start = now
+        elif now - self.awake_start >= self.awake_stop_seconds:
+            return self.stop()
+        return None
+
+    def stop(self):
+        """Tắt chuông -> "stop" nếu đang kêu"""
+        self.awake_start = None
+        if self.playing:
+            self.playing = False
+            return "stop"
+        return None
+
+    def mute(self):
+        self.muted = True
+        return self.stop()
@@ -0,0 +1,48 @@
+import cv2
+import numpy as np
+from PyQt5.QtGui import QImage, QPixmap
+
+
+# ================= HIỂN THỊ FRAME LÊN QLABEL =================
+class FrameDisplay:
+    """
+    Hiển thị frame BGR lên QLabel với ít bản sao nhất:
+    resize 1 lần bằng OpenCV vào buffer cố định đúng kích thước label,
+    QImage Format_BGR888 dùng chung buffer đó (không cần đổi BGR -> RGB).
+    Bỏ qua khi label bị ẩn hoặc cửa sổ thu nhỏ.
+    """
+    def __init__(self, label, interpolation=cv2.INTER_LINEAR):
+        self.label = label
+        self.interpolation = interpolation
+        self._buffer = None
+        self._qimage = None
+        self.shown = 0
+        self.skipped = 0
+
+    def _ensure_buffer(self, w, h):
+        if self._buffer is None or self._buffer.shape[:2] != (h, w):
+            self._buffer = np.empty((h, w, 3), dtype=np.uint8)
+            # QImage chỉ trỏ vào buffer, giữ self._buffer để vùng nhớ không bị giải phóng
+            self._qimage = QImage(self._buffer.data, w, h, w * 3, QImage.Format_BGR888)
+
+    def is_visible(self):
+        return self.label.isVisible() and not self.label.window().isMinimized()
+
+    def show(self, frame):
+        """Vẽ frame BGR; trả về False nếu bỏ qua vì không nhìn thấy"""
+        if not self.is_visible():
+            self.skipped += 1
+            return False
+        size = self.label.contentsRect().size()   # trừ viền 3px của label
+        w, h = size.width(), size.height()
+        if w <= 0 or h <= 0:
+            self.skipped += 1
+            return False
+        self._ensure_buffer(w, h)
+        cv2.resize(frame, (w, h), dst=self._buffer, interpolation=self.interpolation)
+        self.label.setPixmap(QPixmap.fromImage(self._qimage))
+        self.shown += 1
+        return True
+
+    def clear(self):
+        self.label.clear()
@@ -0,0 +1,155 @@
+import numpy as np
+from clock import SYSTEM_CLOCK
+from detection_logic import DrowsinessLogic, LABEL_SLEEP, LABEL_YAWN
+from instrumentation import NULL_METRIC
+from temporal_features import TemporalFeatures
+
+# --- CẤU HÌNH ---
+FATIGUE_DRIVE_SECONDS = 14400    # 4 tiếng lái
+FATIGUE_DRIVE_PERCENT = 70       # ... tương ứng 70% mệt mỏi
+FATIGUE_WARN_PERCENT = 70        # vượt mức này thì GUI cảnh báo nghỉ ngơi
+# Cộng PERCLOS / tần suất ngáp vào fatigue: TẮT mặc định, các mức dưới chưa được kiểm định
+# trên dữ liệu của dự án (bật sẽ đổi thời điểm GUI hiện hộp thoại / phát SOUND_WARN)
+FATIGUE_USE_TEMPORAL = False
+# Ngưỡng PERCLOS hay được trích trong nghiên cứu PERCLOS (Wierwille 1994, Dinges 1998):
+# < 7.5% tỉnh táo, >= 15% buồn ngủ. Ở đây "nhắm" là EAR < EAR_CLOSED_THRESH, không phải P80
+PERCLOS_ALERT = 0.075
+PERCLOS_DROWSY = 0.15
+# Trọng số cộng thêm: heuristic, giữ tổng phần thêm (45%) dưới FATIGUE_WARN_PERCENT để riêng
+# đặc trưng thời gian không đủ bật cảnh báo khi chưa có hành vi ngủ / ngáp / thời gian lái
+FATIGUE_PERCLOS_MAX = 30
+FATIGUE_PER_YAWN_PER_MIN = 5
+FATIGUE_YAWN_MAX = 15
+TEMPORAL_MIN_SECONDS = 10.0      # cần đủ 10 s dữ liệu có mặt mới dùng PERCLOS (ít hơn thì nhiễu)
+
+
+# ================= ENGINE 1 TÀI XẾ (KHÔNG PHỤ THUỘC QT) =================
+class DrowsinessEngine:
+    """
+    Toàn bộ trạng thái của 1 tài xế: FaceMesh detector, logic ngủ / ngáp / gật đầu,
+    điểm số và bộ đếm hành vi trong ngày. Model (clf) có thể dùng chung giữa nhiều engine.
+    preprocessor (preprocessing.Preprocessor, tùy chọn): làm rõ frame trước FaceMesh, vd. khi lái đêm.
+    clock: nguồn thời gian khi không truyền now (clock.ManualClock để replay nhanh hơn thời gian thật).
+    """
+    def __init__(self, clf, detector, metrics=None, preprocessor=None, clock=None,
+                 use_temporal=FATIGUE_USE_TEMPORAL):
+        self.clf = clf
+        self.detector = detector
+        self.preprocessor = preprocessor
+        self.clock = clock or SYSTEM_CLOCK
+        self.logic = DrowsinessLogic(self.clock)
+        self.temporal = TemporalFeatures()
+        self.use_temporal = use_temporal
+        self._row = np.empty((1, 3))      # hàng đặc trưng đưa vào clf.predict, dùng lại mỗi frame
+        if metrics is not None:
+            self.m_preprocess = metrics.histogram("preprocess_ms", "CLAHE + làm nét (chế độ ban đêm)")
+            self.m_extract = metrics.histogram("extract_features_ms", "FaceMesh + tính đặc trưng")
+            self.m_predict = metrics.histogram("predict_ms", "clf.predict")
+            self.m_logic = metrics.histogram("logic_ms", "logic ngủ / ngáp / gật đầu")
+        else:
+            self.m_preprocess = self.m_extract = self.m_predict = self.m_logic = NULL_METRIC
+        self.reset_day()
+
+    # ----- trạng thái -----
+    def reset(self, now=None):
+        """Reset logic gật đầu, các biến đếm thời gian và điểm số"""
+        self.logic.reset(now)
+
+    def reset_day(self):
+        """Reset bộ đếm hành vi (số frame / ngủ / ngáp) và các cửa sổ thời gian"""
+        self.day_total = 0
+        self.day_sleep = 0
+        self.day_yawn = 0
+        self.temporal.reset()
+
+    @property
+    def score_sleep(self):
+        return self.logic.score_sleep
+
+    @property
+    def score_yawn(self):
+        return self.logic.score_yawn
+
+    @property
+    def score_alert(self):
+        return self.logic.score_alert
+
+    # ----- xử lý frame -----
+    def infer(self, frame):
+        """FaceMesh + model -> (features, bbox, nose, pred), None cả 4 nếu không thấy mặt"""
+        if self.clf is None:
+            return None, None, None, None
+        preprocessor = self.preprocessor
+        if preprocessor is not None:
+            with self.m_preprocess.time():
+                frame = preprocessor.apply(frame, self.detector.last_bbox)
+        with self.m_extract.time():
+            features, bbox, nose = self.detector.extract_features(frame)
+        if features is None:
+            return None, None, None, None
+        with self.m_predict.time():
+            self._row[0] = features
+            pred = self.clf.predict(self._row)[0]
+        return features, bbox, nose, pred
+
+    def step(self, features, nose, pred, now=None):
+        """Cập nhật bộ đếm trong ngày, đặc trưng thời gian + logic cho 1 frame có mặt -> FrameDecision"""
+        if now is None:
+            now = self.clock.time()
+        self.temporal.update(now, features)
+        self.day_total += 1
+        if pred == LABEL_SLEEP:
+            self.day_sleep += 1
+        elif pred == LABEL_YAWN:
+            self.day_yawn += 1
+        with self.m_logic.time():
+            return self.logic.update(features, nose, pred, now)
+
+    def process_frame(self, frame, now=None):
+        """infer + step -> (features, bbox, nose, decision); decision=None khi không thấy mặt"""
+        features, bbox, nose, pred = self.infer(frame)
+        if features is None:
+            return None, None, None, None
+        return features, bbox, nose, self.step(features, nose, pred, now)
+
+    def calculate_fatigue(self, total_seconds, now=None):
+        """
+        Tính mức độ mệt mỏi dựa trên:
+        - Số lượng frame sleep và yawn
+        - Thời gian lái (giây)
+        - PERCLOS và tần suất ngáp gần đây, chỉ khi use_temporal (FATIGUE_USE_TEMPORAL)
+        Trả về giá trị 0-100 (%)
+        """
+        if self.day_total == 0:
+            return 0
+
+        # Fatigue cơ bản (hành vi)
+        base_fatigue = (self.day_sleep + 0.5 * self.day_yawn) / self.day_total * 100
+
+        # Fatigue theo thời gian lái: 4 tiếng = 70%
+        time_factor = total_seconds / FATIGUE_DRIVE_SECONDS * FATIGUE_DRIVE_PERCENT
+
+        fatigue = base_fatigue + time_factor
+        if self.use_temporal:
+            fatigue += self.temporal_fatigue(now)
+        return min(100, fatigue)
+
+    def temporal_values(self, now=None):
+        """PERCLOS, tần suất chớp / ngáp, phương sai EAR, coverage tính tới now (mặc định clock.time())"""
+        tf = self._expire_temporal(now)
+        return dict(tf.snapshot(), coverage=tf.coverage)
+
+    def _expire_temporal(self, now):
+        # Cửa sổ chỉ được cập nhật trên frame có mặt -> trôi tới hiện tại trước khi đọc
+        self.temporal.expire(self.clock.time() if now is None else now)
+        return self.temporal
+
+    def temporal_fatigue(self, now=None):
+        """Phần mệt mỏi từ PERCLOS / tần suất ngáp (0 khi chưa đủ dữ liệu)"""
+        tf = self._expire_temporal(now)
+        if tf.coverage < TEMPORAL_MIN_SECONDS:
+            return 0.0
+        perclos = (tf.perclos - PERCLOS_ALERT) / (PERCLOS_DROWSY - PERCLOS_ALERT)
+        perclos_part = FATIGUE_PERCLOS_MAX * min(max(perclos, 0.0), 1.0)
+        yawn_part = min(tf.yawn_rate * FATIGUE_PER_YAWN_PER_MIN, FATIGUE_YAWN_MAX)
+        return perclos_part + yawn_part
@@ -0,0 +1,86 @@
+import numpy as np
+
+# Phần tính toán thuần NumPy trên landmark (không import mediapipe / cv2):
+# train_model.py, feature_store.py dùng được mà không cần nạp MediaPipe
+
+# ================= BẢNG CHỈ SỐ LANDMARK =================
+LEFT_EYE_IDX = [362, 385, 387, 263, 373, 380]
+RIGHT_EYE_IDX = [33, 160, 158, 133, 153, 144]
+MOUTH_IDX = [13, 14, 61, 291]
+NOSE_IDX = 1
+N_LANDMARKS = 478             # số landmark tối đa (refine_landmarks=True)
+
+# Mỗi dòng là 1 cặp điểm cần đo khoảng cách:
+# [mắt trái: ngang, dọc1, dọc2] [mắt phải: ngang, dọc1, dọc2] [miệng: dọc, ngang]
+PAIR_INDEX = np.array([
+    [LEFT_EYE_IDX[0], LEFT_EYE_IDX[3]],
+    [LEFT_EYE_IDX[1], LEFT_EYE_IDX[5]],
+    [LEFT_EYE_IDX[2], LEFT_EYE_IDX[4]],
+    [RIGHT_EYE_IDX[0], RIGHT_EYE_IDX[3]],
+    [RIGHT_EYE_IDX[1], RIGHT_EYE_IDX[5]],
+    [RIGHT_EYE_IDX[2], RIGHT_EYE_IDX[4]],
+    [13, 14],
+    [61, 291],
+])
+
+
+def landmarks_to_array(landmarks, out=None):
+    """
+    Chuyển landmark của MediaPipe (NormalizedLandmarkList hoặc list landmark) thành mảng (N,3)
+    tọa độ chuẩn hóa. out: mảng (>= N, 3) float64 cấp sẵn để ghi vào, trả về view out[:N].
+    """
+    landmarks = getattr(landmarks, "landmark", landmarks)
+    n = len(landmarks)
+    if out is None:
+        out = np.empty((n, 3), dtype=np.float64)
+    out = out[:n]
+    out[:] = [(p.x, p.y, p.z) for p in landmarks]
+    return out
+
+
+def compute_bbox(points, w, h):
+    """Khung mặt (x_min, y_min, x_max, y_max) theo pixel từ mảng landmark (N,3)"""
+    x_min, y_min = points[:, :2].min(axis=0)
+    x_max, y_max = points[:, :2].max(axis=0)
+    return (int(x_min * w), int(y_min * h), int(x_max * w), int(y_max * h))
+
+
+def compute_features(points, w, h):
+    """
+    Tính (features, bbox, nose_point) từ mảng landmark (N,3) trong một lượt vector hóa.
+    Kết quả giống hệt cách tính cũ (tọa độ pixel được cắt về số nguyên trước khi đo).
+    """
+    px = np.trunc(points[PAIR_INDEX, :2] * (w, h))
+    d = np.sqrt(((px[:, 0] - px[:, 1]) ** 2).sum(axis=1))
+
+    # Tử số / mẫu số cho [LeftEAR, RightEAR, MAR]
+    num = np.array([d[1] + d[2], d[4] + d[5], d[6]])
+    den = np.array([2.0 * d[0], 2.0 * d[3], d[7]])
+    features = np.divide(num, den, out=np.zeros(3), where=den != 0)
+
+    # Bounding Box (Khung mặt)
+    bbox = compute_bbox(points, w, h)
+
+    # Đầu mũi (Landmark số 1) - QUAN TRỌNG ĐỂ PHÁT HIỆN GẬT ĐẦU
+    nose = (int(points[NOSE_IDX, 0] * w), int(points[NOSE_IDX, 1] * h))
+    return features, bbox, nose
+
+
+def compute_features_batch(points, sizes):
+    """
+    compute_features cho cả lô: points (n, N, 3), sizes (n, 2) = (w, h) của từng ảnh.
+    Trả về (features (n, 3), bboxes (n, 4), noses (n, 2)), cùng kết quả với từng ảnh riêng lẻ.
+    """
+    scale = np.asarray(sizes, dtype=np.float64)[:, None, None, :]
+    px = np.trunc(points[:, PAIR_INDEX, :2].astype(np.float64) * scale)
+    d = np.sqrt(((px[:, :, 0] - px[:, :, 1]) ** 2).sum(axis=2))
+    num = np.stack([d[:, 1] + d[:, 2], d[:, 4] + d[:, 5], d[:, 6]], axis=1)
+    den = np.stack([2.0 * d[:, 0], 2.0 * d[:, 3], d[:, 7]], axis=1)
+    features = np.divide(num, den, out=np.zeros_like(num), where=den != 0)
+
+    wh = scale[:, 0, 0, :]
+    lo = points[:, :, :2].min(axis=1) * wh
+    hi = points[:, :, :2].max(axis=1) * wh
+    bboxes = np.concatenate([lo, hi], axis=1).astype(np.int64)
+    noses = (points[:, NOSE_IDX, :2] * wh).astype(np.int64)
+    return features, bboxes, noses
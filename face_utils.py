@@ -1,12 +1,92 @@
 import cv2
 import mediapipe as mp
 import numpy as np
+from collections import namedtuple
+
+from face_geometry import (LEFT_EYE_IDX, RIGHT_EYE_IDX, MOUTH_IDX, N_LANDMARKS, landmarks_to_array,
+                           compute_bbox, compute_features, compute_features_batch)
+
+
+# ================= CỔNG CHUYỂN ĐỘNG (MOTION GATE) =================
+# So ảnh xám thu nhỏ của vùng mặt, 2 mắt, miệng với frame FaceMesh chạy gần nhất;
+# mọi vùng đều gần như không đổi thì dùng lại landmark cũ thay vì chạy FaceMesh
+GATE_THRESHOLD = 2.5          # chênh lệch xám trung bình (0-255) tối đa của 1 vùng để dùng lại
+GATE_MAX_REUSE = 5            # số frame liên tiếp tối đa dùng lại, sau đó bắt buộc chạy FaceMesh
+GATE_FACE_SIZE = 32           # cạnh ảnh thu nhỏ của vùng mặt (pixel)
+GATE_PART_SIZE = 16           # cạnh ảnh thu nhỏ của mỗi vùng mắt / miệng
+GATE_PART_SCALE = 1.6         # cạnh vùng mắt / miệng = cạnh dài nhất của các điểm landmark x hệ số này
+GATE_REGIONS = [("face", None, GATE_FACE_SIZE),
+                ("left_eye", LEFT_EYE_IDX, GATE_PART_SIZE),
+                ("right_eye", RIGHT_EYE_IDX, GATE_PART_SIZE),
+                ("mouth", MOUTH_IDX, GATE_PART_SIZE)]
+
+
+def gate_windows(points, w, h):
+    """Cửa sổ (x0, y0, x1, y1) theo pixel của từng vùng trong GATE_REGIONS, None nếu vùng quá nhỏ / ra ngoài ảnh"""
+    windows = []
+    for _, idx, _ in GATE_REGIONS:
+        xy = points[:, :2] if idx is None else points[idx, :2]
+        lo, hi = xy.min(axis=0) * (w, h), xy.max(axis=0) * (w, h)
+        center = (lo + hi) / 2
+        half = max(hi - lo) / 2 if idx is None else max(hi - lo) * GATE_PART_SCALE / 2
+        x0, y0 = np.maximum(center - half, 0).astype(int)
+        x1, y1 = np.minimum(center + half, (w, h)).astype(int)
+        windows.append((x0, y0, x1, y1) if x1 - x0 >= 4 and y1 - y0 >= 4 else None)
+    return windows
+
+
+def gate_patch(image, window, size):
+    """Ảnh xám thu nhỏ size x size (int16) của 1 cửa sổ"""
+    x0, y0, x1, y1 = window
+    small = cv2.resize(image[y0:y1, x0:x1], (size, size), interpolation=cv2.INTER_AREA)
+    return cv2.cvtColor(small, cv2.COLOR_BGR2GRAY).astype(np.int16)
+
+
+def gate_patches(image, windows):
+    """Ảnh thu nhỏ của từng cửa sổ trong GATE_REGIONS, None nếu cửa sổ không dùng được"""
+    return [None if window is None else gate_patch(image, window, size)
+            for (_, _, size), window in zip(GATE_REGIONS, windows)]
+
+
+# Kết quả extract_batch: mask[i] = False khi ảnh i không thấy mặt (features NaN, bbox / nose = -1)
+FeatureBatch = namedtuple("FeatureBatch", ["features", "bboxes", "noses", "mask", "sizes", "landmarks"])
+
 
 class FaceMeshDetector:
-    def __init__(self):
+    def __init__(self, static_image_mode=False, tracking=False, roi_padding=0.35, roi_size=256,
+                 motion_gate=False, gate_threshold=GATE_THRESHOLD, gate_max_reuse=GATE_MAX_REUSE):
         # Khởi tạo MediaPipe FaceMesh
+        # static_image_mode=True: mỗi ảnh detect độc lập (dùng cho dataset ảnh rời)
         self.mp_face_mesh = mp.solutions.face_mesh
-        self.face_mesh = self.mp_face_mesh.FaceMesh(
+        self.face_mesh = self._create_face_mesh(static_image_mode)
+
+        # Chế độ bám vùng mặt (ROI tracking): dùng bbox frame trước để cắt vùng mặt,
+        # thu nhỏ về roi_size x roi_size rồi mới đưa vào FaceMesh
+        self.tracking = tracking
+        self.roi_padding = roi_padding     # nới bbox mỗi phía (tỉ lệ theo cạnh bbox)
+        self.roi_size = roi_size
+        self.roi_face_mesh = None          # FaceMesh riêng cho ảnh ROI (tạo khi cần)
+        self.last_bbox = None
+        self.last_points = None
+        self.roi_used = False              # frame gần nhất có chạy trên ROI hay không
+        self._buffers = {}                 # buffer RGB / ROI dùng lại giữa các frame
+        # Landmark (N,3) của frame hiện tại ghi đè vào đây; ai cần giữ qua frame sau phải copy
+        self._points = np.empty((N_LANDMARKS, 3), dtype=np.float64)
+
+        # Cổng chuyển động: đầu đứng yên (mặt, mắt, miệng không đổi) thì dùng lại landmark frame trước
+        self.motion_gate = motion_gate
+        self.gate_threshold = gate_threshold
+        self.gate_max_reuse = gate_max_reuse
+        self.gate_windows = None           # cửa sổ các vùng của frame FaceMesh chạy gần nhất
+        self.gate_ref = None               # ảnh thu nhỏ tương ứng
+        self.gate_shape = None             # (h, w) của frame đó: đổi độ phân giải thì không so
+        self.gate_reused = 0               # số frame liên tiếp đã dùng lại
+        self.gate_skipped = False          # frame gần nhất có bỏ qua FaceMesh hay không
+        self.gate_motion = None            # chênh lệch lớn nhất giữa các vùng ở lần so gần nhất
+
+    def _create_face_mesh(self, static_image_mode=False):
+        return self.mp_face_mesh.FaceMesh(
+            static_image_mode=static_image_mode,
             max_num_faces=1,                
             refine_landmarks=True,          
             min_detection_confidence=0.5,
@@ -36,33 +116,168 @@ class FaceMeshDetector:
         d_h = self.calculate_distance(landmarks[61], landmarks[291], w, h)
         return d_v / d_h if d_h != 0 else 0
 
+    def _buffer(self, name, shape):
+        """Buffer ảnh dùng lại (cvtColor / resize ghi vào qua dst=), chỉ cấp phát lại khi đổi kích thước"""
+        buf = self._buffers.get(name)
+        if buf is None or buf.shape != shape:
+            buf = self._buffers[name] = np.empty(shape, dtype=np.uint8)
+        return buf
+
+    def _roi_window(self, w, h):
+        """Cửa sổ vuông (left, top, side) quanh bbox frame trước, nằm gọn trong ảnh"""
+        x_min, y_min, x_max, y_max = self.last_bbox
+        side = int(max(x_max - x_min, y_max - y_min) * (1 + 2 * self.roi_padding))
+        side = min(side, w, h)
+        if side < 32:
+            return None
+        left = int(min(max((x_min + x_max) / 2 - side / 2, 0), w - side))
+        top = int(min(max((y_min + y_max) / 2 - side / 2, 0), h - side))
+        return left, top, side
+
+    def _landmarks_full(self, image):
+        image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB, dst=self._buffer("rgb", image.shape))
+        results = self.face_mesh.process(image_rgb)
+        if not results.multi_face_landmarks:
+            return None
+        return landmarks_to_array(results.multi_face_landmarks[0], out=self._points)
+
+    def _landmarks_roi(self, image):
+        h, w = image.shape[:2]
+        window = self._roi_window(w, h)
+        if window is None:
+            return None
+        left, top, side = window
+        crop = image[top:top + side, left:left + side]
+        if side > self.roi_size:
+            crop = cv2.resize(crop, (self.roi_size, self.roi_size), interpolation=cv2.INTER_AREA,
+                              dst=self._buffer("roi", (self.roi_size, self.roi_size, 3)))
+
+        # 1 buffer roi_size x roi_size dùng cho mọi kích thước crop: lấy phần đầu liên tục của nó
+        # (không cấp phát theo bbox dao động từng frame, MediaPipe nhận mảng C-contiguous)
+        n = crop.shape[0] * crop.shape[1] * 3
+        roi_rgb = self._buffer("roi_rgb", (self.roi_size * self.roi_size * 3,))[:n].reshape(crop.shape)
+
+        if self.roi_face_mesh is None:
+            self.roi_face_mesh = self._create_face_mesh()
+        results = self.roi_face_mesh.process(cv2.cvtColor(crop, cv2.COLOR_BGR2RGB, dst=roi_rgb))
+        if not results.multi_face_landmarks:
+            return None
+
+        # Đổi tọa độ chuẩn hóa của ROI về tọa độ chuẩn hóa của toàn frame
+        points = landmarks_to_array(results.multi_face_landmarks[0], out=self._points)
+        points[:, 0] = (points[:, 0] * side + left) / w
+        points[:, 1] = (points[:, 1] * side + top) / h
+        points[:, 2] *= side / w
+        return points
+
+    def reset_tracking(self):
+        """Xóa trạng thái giữa các frame (graph MediaPipe, ROI tracking, cổng chuyển động)"""
+        # Graph FaceMesh ở chế độ video bám theo landmark frame trước: reset để frame sau detect lại từ đầu
+        self.face_mesh.reset()
+        if self.roi_face_mesh is not None:
+            self.roi_face_mesh.reset()
+        self.last_bbox = None
+        self.last_points = None
+        self.gate_windows = None
+        self.gate_ref = None
+        self.gate_shape = None
+        self.gate_reused = 0
+
+    def _gate_reuse(self, image):
+        """True nếu mọi vùng (mặt, 2 mắt, miệng) gần như giống frame FaceMesh chạy gần nhất"""
+        self.gate_motion = None
+        if self.gate_ref is None or self.last_points is None or self.gate_reused >= self.gate_max_reuse:
+            return False
+        if image.shape[:2] != self.gate_shape:
+            # Cửa sổ tính theo pixel của frame cũ, không cắt được trên frame độ phân giải khác
+            return False
+        motion = 0.0
+        # So từng vùng, dừng ở vùng đầu tiên thay đổi (đầu đang chuyển động chỉ tốn 1 ảnh thu nhỏ)
+        for (_, _, size), window, ref in zip(GATE_REGIONS, self.gate_windows, self.gate_ref):
+            if ref is None:
+                return False
+            # Mắt nhắm / miệng mở làm riêng vùng đó đổi mạnh -> chạy lại FaceMesh ngay
+            motion = max(motion, float(cv2.absdiff(gate_patch(image, window, size), ref).mean()))
+            if motion > self.gate_threshold:
+                self.gate_motion = motion
+                return False
+        self.gate_motion = motion
+        return True
+
+    def extract_landmarks(self, image):
+        """Trả về mảng landmark (N,3) chuẩn hóa theo toàn frame, hoặc None nếu không thấy mặt"""
+        self.gate_skipped = False
+        if self.motion_gate:
+            if self._gate_reuse(image):
+                self.gate_skipped = True
+                self.gate_reused += 1
+                return self.last_points
+            self.gate_reused = 0
+
+        points = None
+        self.roi_used = False
+        if self.tracking and self.last_bbox is not None:
+            points = self._landmarks_roi(image)
+            self.roi_used = points is not None
+        if points is None:
+            # Mất mặt trong ROI (hoặc chưa có bbox) -> detect lại trên toàn frame
+            points = self._landmarks_full(image)
+        self.last_points = points
+        if self.motion_gate:
+            h, w = image.shape[:2]
+            self.gate_windows = None if points is None else gate_windows(points, w, h)
+            self.gate_ref = None if points is None else gate_patches(image, self.gate_windows)
+            self.gate_shape = (h, w)
+        return points
+
     def extract_features(self, image):
         """
         Trả về 3 giá trị: (features, bbox, nose_point)
         """
         h, w = image.shape[:2]
-        image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-        results = self.face_mesh.process(image_rgb)
-        
+        points = self.extract_landmarks(image)
+
         # Nếu không thấy mặt, trả về None cho cả 3
-        if not results.multi_face_landmarks:
+        if points is None:
+            self.last_bbox = None
             return None, None, None
-        
-        lm = results.multi_face_landmarks[0].landmark
-
-        # 1. Tính toán Features (EAR, MAR)
-        left_ear = self.get_ear(lm, [362, 385, 387, 263, 373, 380], w, h)
-        right_ear = self.get_ear(lm, [33, 160, 158, 133, 153, 144], w, h)
-        mar = self.get_mar(lm, w, h)
-        features = np.array([left_ear, right_ear, mar])
-
-        # 2. Tính Bounding Box (Khung mặt)
-        x_list = [pt.x for pt in lm]
-        y_list = [pt.y for pt in lm]
-        x_min, x_max = int(min(x_list) * w), int(max(x_list) * w)
-        y_min, y_max = int(min(y_list) * h), int(max(y_list) * h)
-        
-        # 3. Lấy tọa độ đầu mũi (Landmark số 1) - QUAN TRỌNG ĐỂ PHÁT HIỆN GẬT ĐẦU
-        nose_x, nose_y = int(lm[1].x * w), int(lm[1].y * h)
-
-        return features, (x_min, y_min, x_max, y_max), (nose_x, nose_y)
+
+        features, bbox, nose = compute_features(points, w, h)
+        self.last_bbox = bbox
+        return features, bbox, nose
+
+    def extract_batch(self, frames, keep_landmarks=False):
+        """
+        Trích xuất cả lô ảnh (list hoặc iterator, phần tử None = ảnh đọc lỗi) -> FeatureBatch.
+        FaceMesh vẫn chạy từng ảnh theo thứ tự (tracking giữ nguyên), phần tính đặc trưng gộp 1 lần.
+        Iterator chỉ giữ landmark, không giữ lại frame.
+        """
+        all_points, sizes, mask = [], [], []
+        for image in frames:
+            points = None
+            if image is not None:
+                h, w = image.shape[:2]
+                points = self.extract_landmarks(image)
+                # ROI của frame sau cần bbox của frame này
+                self.last_bbox = None if points is None else compute_bbox(points, w, h)
+            else:
+                w = h = 0
+            mask.append(points is not None)
+            sizes.append((w, h))
+            # Landmark nằm trong buffer của detector, ảnh sau sẽ ghi đè
+            all_points.append(None if points is None else points.copy())
+
+        n = len(mask)
+        mask = np.array(mask, dtype=bool)
+        sizes = np.array(sizes, dtype=np.int64).reshape(n, 2)
+        features = np.full((n, 3), np.nan)
+        bboxes = np.full((n, 4), -1, dtype=np.int64)
+        noses = np.full((n, 2), -1, dtype=np.int64)
+        landmarks = None
+        if mask.any():
+            points = np.stack([p for p in all_points if p is not None])
+            features[mask], bboxes[mask], noses[mask] = compute_features_batch(points, sizes[mask])
+            if keep_landmarks:
+                landmarks = np.full((n,) + points.shape[1:], np.nan, dtype=np.float32)
+                landmarks[mask] = points
+        return FeatureBatch(features, bboxes, noses, mask, sizes, landmarks)
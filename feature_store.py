@@ -0,0 +1,407 @@
+import os
+import csv
+import json
+import time
+import argparse
+import numpy as np
+
+from face_geometry import compute_features_batch
+
+# --- CẤU HÌNH ---
+current_dir = os.path.dirname(os.path.abspath(__file__))
+STORE_DIR = os.path.join(current_dir, "feature_store")
+CSV_FILE = os.path.join(current_dir, "geometry_features.csv")
+INDEX_FILE = "index.json"
+VERSION = 3
+N_LANDMARKS = 478                     # FaceMesh với refine_landmarks=True
+FEATURE_NAMES = ["LeftEAR", "RightEAR", "MAR"]
+# Số dòng có landmark mỗi lô của refeaturize (~23 MB landmark / lô, vừa máy ít RAM)
+REFEATURIZE_BATCH = 4096
+
+# Mỗi cột = 1 file nhị phân <tên>.bin, mỗi dòng có kích thước cố định
+BASE_COLUMNS = {
+    "features": ("<f8", (len(FEATURE_NAMES),)),
+    "labels": ("i1", ()),
+    "image_size": ("<i4", (2,)),               # (w, h), 0 nếu không biết
+    "has_landmarks": ("u1", ()),
+    "landmark_row": ("<i8", ()),               # vị trí trong landmarks.bin, -1 nếu không có
+    "deleted": ("u1", ()),                     # 1: dòng đã bị thay / xóa (ghi đè tại chỗ)
+}
+# Landmark lưu thưa: landmarks.bin chỉ chứa các dòng có landmark (dòng nhập từ CSV không tốn chỗ)
+LANDMARKS = ("<f4", (N_LANDMARKS, 3))          # tọa độ chuẩn hóa (x, y, z)
+# Cột chuỗi độ dài thay đổi: <tên>.bin (các chuỗi UTF-8 nối liền) + <tên>.off (vị trí kết thúc từng dòng, <i8)
+TEXT_COLUMNS = ["sources"]
+
+
+# ================= TÍNH ĐẶC TRƯNG TỪ LANDMARK (VECTOR HÓA) =================
+def features_from_landmarks(landmarks, image_size):
+    """
+    [LeftEAR, RightEAR, MAR] cho cả lô landmark (n, N, 3) với kích thước ảnh (n, 2).
+    Cùng công thức với face_utils.compute_features (tọa độ pixel cắt về số nguyên).
+    """
+    return compute_features_batch(landmarks, image_size)[0]
+
+
+# ================= KHO ĐẶC TRƯNG DẠNG CỘT =================
+class FeatureStore:
+    """
+    Thư mục gồm các cột nhị phân (đọc bằng np.memmap), cột chuỗi (nguồn của từng dòng)
+    + index.json nhỏ (số dòng, kiểu dữ liệu từng cột, cấu hình trích xuất).
+    Ghi thêm: nối dữ liệu vào cuối từng cột rồi mới cập nhật index. Dòng bị thay / xóa không bị
+    ghi lại mà chỉ đánh dấu deleted; to_dataframe / export_csv / refeaturize bỏ qua các dòng đó.
+    """
+    def __init__(self, path=STORE_DIR):
+        self.path = path
+        index_path = os.path.join(path, INDEX_FILE)
+        if os.path.exists(index_path):
+            with open(index_path, encoding="utf-8") as f:
+                self.index = json.load(f)
+            if "sources" in self.index:
+                self._migrate_sources()
+            if self.index["version"] < 3:
+                self._migrate_sparse_landmarks()
+            self._drop_partial_rows()
+        else:
+            os.makedirs(path, exist_ok=True)
+            self.index = {
+                "version": VERSION,
+                "count": 0,
+                "landmark_count": 0,
+                "feature_names": FEATURE_NAMES,
+                "columns": {name: {"dtype": dtype, "shape": list(shape)}
+                            for name, (dtype, shape) in BASE_COLUMNS.items()},
+                "landmarks": {"dtype": LANDMARKS[0], "shape": list(LANDMARKS[1])},
+                "text_columns": TEXT_COLUMNS,
+                "settings": {},
+                "updated": None,
+            }
+            self._save_index()
+
+    def _migrate_sources(self):
+        """Kho version 1 lưu nguồn từng dòng trong index.json -> chuyển sang cột chuỗi"""
+        sources = self.index.pop("sources")
+        for suffix in (".bin", ".off"):
+            if os.path.exists(self._column_path("sources", suffix)):
+                os.remove(self._column_path("sources", suffix))
+        self._append_text("sources", sources[:self.index["count"]])
+        self.index["text_columns"] = TEXT_COLUMNS
+        self.index["version"] = 2
+        self._save_index()
+
+    def _migrate_sparse_landmarks(self):
+        """Kho version 2 lưu landmark NaN cho mọi dòng -> chỉ giữ dòng có landmark, thêm landmark_row / deleted"""
+        n = len(self)
+        spec = self.index["columns"].pop("landmarks")
+        valid = np.fromfile(self._column_path("has_landmarks"), dtype="u1", count=n).astype(bool)
+        rows = np.flatnonzero(valid)
+        path = self._column_path("landmarks")
+        if n:
+            dense = np.memmap(path, dtype=spec["dtype"], mode="r", shape=(n,) + tuple(spec["shape"]))
+            with open(path + ".tmp", "wb") as f:
+                for start in range(0, len(rows), REFEATURIZE_BATCH):
+                    f.write(np.ascontiguousarray(dense[rows[start:start + REFEATURIZE_BATCH]]).tobytes())
+            del dense
+            os.replace(path + ".tmp", path)
+        landmark_row = np.full(n, -1, dtype="<i8")
+        landmark_row[rows] = np.arange(len(rows))
+        for name, values in (("landmark_row", landmark_row), ("deleted", np.zeros(n, dtype="u1"))):
+            with open(self._column_path(name), "wb") as f:
+                f.write(values.tobytes())
+            dtype, shape = BASE_COLUMNS[name]
+            self.index["columns"][name] = {"dtype": dtype, "shape": list(shape)}
+        self.index["landmarks"] = spec
+        self.index["landmark_count"] = len(rows)
+        self.index["version"] = VERSION
+        self._save_index()
+
+    # ----- metadata -----
+    def __len__(self):
+        """Số dòng vật lý (kể cả dòng đã đánh dấu deleted)"""
+        return self.index["count"]
+
+    @property
+    def sources(self):
+        """Nguồn (đường dẫn ảnh / dòng CSV) của từng dòng, đọc từ cột chuỗi khi cần"""
+        return self.text_column("sources")
+
+    @property
+    def settings(self):
+        return self.index["settings"]
+
+    def _column_path(self, name, suffix=".bin"):
+        return os.path.join(self.path, name + suffix)
+
+    def _spec(self, name):
+        return self.index["landmarks"] if name == "landmarks" else self.index["columns"][name]
+
+    def _row_dtype(self, name):
+        spec = self._spec(name)
+        return np.dtype(spec["dtype"]), tuple(spec["shape"])
+
+    def _row_bytes(self, name):
+        dtype, shape = self._row_dtype(name)
+        return dtype.itemsize * int(np.prod(shape, dtype=np.int64))
+
+    def _save_index(self):
+        self.index["updated"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+        path = os.path.join(self.path, INDEX_FILE)
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.index, f)
+        os.replace(tmp, path)
+
+    def _drop_partial_rows(self):
+        """Cắt phần dữ liệu thừa của lần append bị dừng giữa chừng (index chưa kịp cập nhật)"""
+        sizes = [(self._column_path(name), self.index["count"] * self._row_bytes(name))
+                 for name in self.index["columns"]]
+        sizes.append((self._column_path("landmarks"), self.index["landmark_count"] * self._row_bytes("landmarks")))
+        for name in self.index.get("text_columns", []):
+            n = self._text_rows(name)
+            sizes.append((self._column_path(name, ".bin"), self._text_end(name, n)))
+            sizes.append((self._column_path(name, ".off"), n * 8))
+        for path, size in sizes:
+            if os.path.exists(path) and os.path.getsize(path) > size:
+                with open(path, "r+b") as f:
+                    f.truncate(size)
+
+    def _text_rows(self, name):
+        """Số dòng hợp lệ của cột chuỗi (tối đa count)"""
+        path = self._column_path(name, ".off")
+        return min(len(self), os.path.getsize(path) // 8) if os.path.exists(path) else 0
+
+    def _text_end(self, name, n):
+        """Vị trí kết thúc (byte) của dòng thứ n - 1 trong cột chuỗi, chỉ đọc 8 byte"""
+        if n == 0:
+            return 0
+        with open(self._column_path(name, ".off"), "rb") as f:
+            f.seek((n - 1) * 8)
+            return int(np.frombuffer(f.read(8), dtype="<i8")[0])
+
+    def _append_text(self, name, values):
+        blob_path = self._column_path(name, ".bin")
+        encoded = [str(v).encode("utf-8") for v in values]
+        base = os.path.getsize(blob_path) if os.path.exists(blob_path) else 0
+        ends = base + np.cumsum(np.fromiter(map(len, encoded), dtype=np.int64, count=len(encoded)))
+        with open(blob_path, "ab") as f:
+            f.write(b"".join(encoded))
+        with open(self._column_path(name, ".off"), "ab") as f:
+            f.write(ends.astype("<i8").tobytes())
+
+    # ----- đọc -----
+    def column(self, name):
+        """
+        Cột dạng mảng (count, *shape), map thẳng từ file (chỉ đọc).
+        "landmarks" là mảng thưa (landmark_count, N, 3): dòng i nằm ở landmark_row[i] (-1 nếu không có)
+        """
+        dtype, shape = self._row_dtype(name)
+        n = self.index["landmark_count"] if name == "landmarks" else len(self)
+        if n == 0:
+            return np.empty((0,) + shape, dtype=dtype)
+        return np.memmap(self._column_path(name), dtype=dtype, mode="r", shape=(n,) + shape)
+
+    def live_rows(self):
+        """Chỉ số các dòng chưa bị đánh dấu deleted"""
+        return np.flatnonzero(np.asarray(self.column("deleted")) == 0)
+
+    def text_column(self, name):
+        """Cột chuỗi -> list str (chỉ đọc file khi được gọi, không nằm trong index.json)"""
+        n = self._text_rows(name)
+        if n == 0:
+            return []
+        ends = np.fromfile(self._column_path(name, ".off"), dtype="<i8", count=n)
+        with open(self._column_path(name, ".bin"), "rb") as f:
+            blob = f.read(int(ends[-1]))
+        starts = np.concatenate([[0], ends[:-1]])
+        return [blob[a:b].decode("utf-8") for a, b in zip(starts.tolist(), ends.tolist())]
+
+    def to_dataframe(self, feature_column="features"):
+        import pandas as pd
+        rows = self.live_rows()
+        df = pd.DataFrame(np.asarray(self.column(feature_column))[rows], columns=self.index["feature_names"])
+        df["Label"] = np.asarray(self.column("labels"))[rows].astype(int)
+        return df
+
+    # ----- ghi -----
+    def append(self, features, labels, landmarks=None, image_size=None, sources=None):
+        """Nối n dòng mới; landmarks (n, N, 3) (NaN = không có) và image_size (n, 2) có thể bỏ trống"""
+        features = np.asarray(features, dtype="<f8").reshape(-1, len(FEATURE_NAMES))
+        n = len(features)
+        if n == 0:
+            return 0
+        if landmarks is None:
+            has_landmarks = np.zeros(n, dtype="u1")
+            landmarks = np.empty((0,) + LANDMARKS[1], dtype=LANDMARKS[0])
+        else:
+            landmarks = np.asarray(landmarks, dtype=LANDMARKS[0])
+            if landmarks.shape != (n,) + LANDMARKS[1]:
+                raise ValueError(f"Cột landmarks: cần shape {(n,) + LANDMARKS[1]}, nhận {landmarks.shape}")
+            has_landmarks = (~np.isnan(landmarks).any(axis=(1, 2))).astype("u1")
+            landmarks = landmarks[has_landmarks.astype(bool)]
+        landmark_row = np.full(n, -1, dtype="<i8")
+        landmark_row[has_landmarks.astype(bool)] = self.index["landmark_count"] + np.arange(len(landmarks))
+        if image_size is None:
+            image_size = np.zeros((n, 2), dtype="<i4")
+        data = {
+            "features": features,
+            "labels": np.asarray(labels, dtype="i1"),
+            "image_size": np.asarray(image_size, dtype="<i4"),
+            "has_landmarks": has_landmarks,
+            "landmark_row": landmark_row,
+            "deleted": np.zeros(n, dtype="u1"),
+        }
+        # Kiểm tra đủ mọi cột trước khi mở file nào, để lỗi không để lại dữ liệu mồ côi
+        blocks = {}
+        for name in self.index["columns"]:
+            dtype, shape = self._row_dtype(name)
+            if name not in data:
+                # Cột dẫn xuất (set_column): dòng mới nhận NaN, tính lại bằng refeaturize + set_column
+                if dtype.kind not in "fc":
+                    raise ValueError(f"Cột dẫn xuất {name} ({dtype}) không có giá trị trống cho dòng mới: "
+                                     f"dùng set_column / drop_column trước khi append")
+                blocks[name] = np.full((n,) + shape, np.nan, dtype=dtype)
+                continue
+            block = np.ascontiguousarray(data[name], dtype=dtype)
+            if block.shape != (n,) + shape:
+                raise ValueError(f"Cột {name}: cần shape {(n,) + shape}, nhận {block.shape}")
+            blocks[name] = block
+        sources = list(sources) if sources is not None else [""] * n
+        if len(sources) != n:
+            raise ValueError(f"Cột sources: cần {n} dòng, nhận {len(sources)}")
+
+        for name, block in blocks.items():
+            with open(self._column_path(name), "ab") as f:
+                f.write(block.tobytes())
+        with open(self._column_path("landmarks"), "ab") as f:
+            f.write(np.ascontiguousarray(landmarks).tobytes())
+        self._append_text("sources", sources)
+        self.index["count"] += n
+        self.index["landmark_count"] += len(landmarks)
+        self._save_index()
+        return n
+
+    def mark_deleted(self, rows):
+        """Đánh dấu các dòng bị thay / xóa (ghi 1 byte tại chỗ mỗi dòng, không chép lại kho)"""
+        rows = np.asarray(rows, dtype=np.intp)
+        if len(rows) == 0:
+            return 0
+        deleted = np.memmap(self._column_path("deleted"), dtype="u1", mode="r+", shape=(len(self),))
+        deleted[rows] = 1
+        deleted.flush()
+        del deleted
+        self._save_index()
+        return len(rows)
+
+    def set_column(self, name, values):
+        """Ghi (hoặc thay) 1 cột dẫn xuất có đủ count dòng, vd. đặc trưng mới tính lại từ landmark"""
+        if name in BASE_COLUMNS or name == "landmarks":
+            raise ValueError(f"{name} là cột gốc, không thay được bằng set_column")
+        values = np.ascontiguousarray(values)
+        if len(values) != len(self):
+            raise ValueError(f"Cột {name} cần {len(self)} dòng, nhận {len(values)}")
+        path = self._column_path(name)
+        with open(path + ".tmp", "wb") as f:
+            f.write(values.tobytes())
+        os.replace(path + ".tmp", path)
+        self.index["columns"][name] = {"dtype": values.dtype.str, "shape": list(values.shape[1:])}
+        self._save_index()
+
+    def drop_column(self, name):
+        """Xóa 1 cột dẫn xuất (chỉ khi được gọi trực tiếp)"""
+        if name in BASE_COLUMNS or name not in self.index["columns"]:
+            raise ValueError(f"Không có cột dẫn xuất {name}")
+        del self.index["columns"][name]
+        self._save_index()
+        os.remove(self._column_path(name))
+
+    def set_settings(self, **settings):
+        self.index["settings"].update(settings)
+        self._save_index()
+
+    # ----- tính lại đặc trưng -----
+    def refeaturize(self, fn=features_from_landmarks, batch_size=REFEATURIZE_BATCH):
+        """Chạy fn(landmarks, image_size) theo lô trên các dòng còn dùng có landmark -> mảng kết quả (NaN nếu không có)"""
+        landmarks = self.column("landmarks")
+        sizes = self.column("image_size")
+        landmark_row = np.asarray(self.column("landmark_row"))
+        rows = self.live_rows()
+        rows = rows[landmark_row[rows] >= 0]
+        out = None
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start:start + batch_size]
+            result = fn(landmarks[landmark_row[batch]], sizes[batch])
+            if out is None:
+                out = np.full((len(self),) + result.shape[1:], np.nan)
+            out[batch] = result
+        return out if out is not None else np.full((len(self), 0), np.nan)
+
+    # ----- CSV -----
+    def import_csv(self, csv_path=CSV_FILE):
+        """Nhập CSV cũ (LeftEAR,RightEAR,MAR,Label), các dòng này không có landmark"""
+        data = np.loadtxt(csv_path, delimiter=",", skiprows=1, ndmin=2)
+        sources = [f"{os.path.basename(csv_path)}#{i}" for i in range(len(data))]
+        return self.append(data[:, :3], data[:, 3], sources=sources)
+
+    def export_csv(self, csv_path=CSV_FILE, feature_column="features"):
+        """Xuất ra CSV giống geometry_features.csv để dùng với code cũ"""
+        rows = self.live_rows()
+        features = np.asarray(self.column(feature_column))[rows]
+        labels = np.asarray(self.column("labels"))[rows]
+        tmp = csv_path + ".tmp"
+        with open(tmp, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(self.index["feature_names"] + ["Label"])
+            for row, label in zip(features.tolist(), labels.tolist()):
+                writer.writerow(row + [label])
+        os.replace(tmp, csv_path)
+        return len(labels)
+
+
+def open_store(path=STORE_DIR):
+    """FeatureStore nếu thư mục đã có index, ngược lại None"""
+    if os.path.exists(os.path.join(path, INDEX_FILE)):
+        return FeatureStore(path)
+    return None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Kho đặc trưng dạng cột (thay cho geometry_features.csv)")
+    parser.add_argument("command", choices=["info", "import", "export", "refeaturize", "bench"])
+    parser.add_argument("--store", default=STORE_DIR)
+    parser.add_argument("--csv", default=CSV_FILE)
+    args = parser.parse_args()
+
+    store = FeatureStore(args.store) if args.command == "import" else open_store(args.store)
+    if store is None:
+        raise SystemExit(f"Chưa có kho đặc trưng: {args.store} (chạy gom_file.py hoặc lệnh import)")
+    if args.command == "import":
+        n = store.import_csv(args.csv)
+        print(f"✅ Đã nhập {n} dòng từ {args.csv} -> {args.store} (tổng {len(store)})")
+    elif args.command == "export":
+        n = store.export_csv(args.csv)
+        print(f"✅ Đã xuất {n} dòng ra {args.csv}")
+    elif args.command == "refeaturize":
+        t0 = time.perf_counter()
+        new = store.refeaturize()
+        elapsed = time.perf_counter() - t0
+        valid = ~np.isnan(new).any(axis=1)
+        old = np.asarray(store.column("features"))
+        diff = np.abs(new[valid] - old[valid]).max() if valid.any() else 0.0
+        print(f"[INFO] {valid.sum()}/{len(store.live_rows())} dòng có landmark, {elapsed * 1000:.1f} ms, "
+              f"lệch tối đa so với features đã lưu: {diff:.3g}")
+    elif args.command == "bench":
+        import pandas as pd
+        t0 = time.perf_counter()
+        pd.read_csv(args.csv)
+        t_csv = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        FeatureStore(args.store).to_dataframe()
+        t_store = time.perf_counter() - t0
+        print(f"CSV: {t_csv * 1000:.1f} ms | store: {t_store * 1000:.1f} ms (x{t_csv / max(t_store, 1e-9):.1f})")
+    else:
+        print(f"{args.store}: {len(store.live_rows())} dòng ({len(store)} kể cả dòng đã thay / xóa), "
+              f"cập nhật {store.index['updated']}")
+        for name, spec in store.index["columns"].items():
+            print(f"    {name:<15} {spec['dtype']:<5} {spec['shape']}")
+        print(f"    landmark: {store.index['landmark_count']} dòng (lưu thưa)")
+        if store.settings:
+            print(f"    cấu hình: {store.settings}")
@@ -1,13 +1,27 @@
 import cv2
 import os
 import csv
+import json
+import hashlib
 import numpy as np
+from concurrent.futures import ProcessPoolExecutor
 from face_utils import FaceMeshDetector
+from preprocessing import Preprocessor
+from feature_store import FeatureStore, open_store, N_LANDMARKS
 
 # --- CẤU HÌNH ĐƯỜNG DẪN ---
 # Bạn nhớ sửa lại đường dẫn cho đúng máy mình nhé
 OUTPUT_FILE = r"C://Users//admin//Downloads//Computer vision//KTHP//Project_TGM_HM//geometry_features.csv"
 DATASET_ROOT = r"C://Users//admin//Downloads//Computer vision//KTHP//Project_TGM_HM//dataset"
+# Manifest lưu kết quả từng ảnh (size, hash, features) để lần sau chỉ xử lý ảnh mới / đã sửa
+MANIFEST_FILE = os.path.splitext(OUTPUT_FILE)[0] + "_manifest.json"
+# Kho đặc trưng dạng cột (landmark + features), train_model.py ưu tiên đọc từ đây
+STORE_DIR = os.path.join(os.path.dirname(OUTPUT_FILE), "feature_store")
+
+# Số process chạy song song (mỗi process 1 FaceMeshDetector)
+N_WORKERS = os.cpu_count()
+# Số ảnh mỗi lô gửi cho 1 process (trích xuất bằng FaceMeshDetector.extract_batch)
+BATCH_SIZE = 16
 
 # Cấu hình thư mục và nhãn
 FOLDERS = {
@@ -18,89 +32,198 @@ FOLDERS = {
 }
 
 # --- HÀM XỬ LÝ ẢNH NÂNG CAO (PRE-PROCESSING) ---
-def preprocess_image(image):
-    """
-    Hàm này làm sạch và tối ưu ảnh trước khi đưa vào nhận diện
-    """
-    # 1. CLAHE: Cân bằng ánh sáng cục bộ (Giúp nhìn rõ mắt khi trời tối)
-    # Chuyển sang hệ màu LAB (L: Lightness, A, B: Color)
-    lab = cv2.cvtColor(image, cv2.COLOR_BGR2LAB)
-    l, a, b = cv2.split(lab)
-    
-    # Áp dụng CLAHE lên kênh sáng (L)
-    # clipLimit=2.0: Ngưỡng tương phản (cao quá sẽ bị nhiễu hạt)
-    # tileGridSize=(8,8): Chia ảnh thành lưới 8x8 để xử lý từng ô
-    clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8,8))
-    cl = clahe.apply(l)
-    
-    # Gộp lại và chuyển về BGR
-    limg = cv2.merge((cl, a, b))
-    enhanced_img = cv2.cvtColor(limg, cv2.COLOR_LAB2BGR)
-
-    # 2. SHARPENING: Làm sắc nét ảnh (Giúp viền mắt/môi rõ hơn)
-    # Ma trận làm nét cơ bản
-    kernel = np.array([[0, -1, 0],
-                       [-1, 5,-1],
-                       [0, -1, 0]])
-    sharpened_img = cv2.filter2D(enhanced_img, -1, kernel)
-
-    return sharpened_img
+# CLAHE (cân bằng ánh sáng cục bộ, giúp nhìn rõ mắt khi trời tối) + làm nét viền mắt / môi.
+# Dùng chung preprocessing.Preprocessor với chế độ lái đêm của main_gui.py
 
-# --- CHƯƠNG TRÌNH CHÍNH ---
-detector = FaceMeshDetector()
-
-print(f"[INFO] Đang tạo file CSV tại: {OUTPUT_FILE}")
-# Mở file để ghi (mode 'w' sẽ xóa dữ liệu cũ ghi mới)
-with open(OUTPUT_FILE, 'w', newline='') as f:
-    writer = csv.writer(f)
-    # Ghi tiêu đề cột
-    writer.writerow(["LeftEAR", "RightEAR", "MAR", "Label"])
-    
-    total = 0
+# --- MANIFEST: CHỈ XỬ LÝ ẢNH MỚI / ĐÃ THAY ĐỔI ---
+def file_hash(path, chunk_size=1 << 20):
+    """SHA-1 nội dung file"""
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def load_manifest(path=MANIFEST_FILE):
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_manifest(manifest, path=MANIFEST_FILE):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    os.replace(tmp, path)
+
+
+def scan_dataset(root=DATASET_ROOT):
+    """Liệt kê [(img_path, label)] theo thứ tự folder trong FOLDERS"""
+    items = []
     for folder, label in FOLDERS.items():
-        path = os.path.join(DATASET_ROOT, folder)
-        
+        path = os.path.join(root, folder)
+
         # Kiểm tra folder có tồn tại không
         if not os.path.exists(path):
             print(f"[BỎ QUA] Không tìm thấy folder: {path}")
             continue
-            
-        print(f"-> Đang xử lý folder: {folder} (Label: {label})")
-        
-        # Duyệt qua từng ảnh trong folder
-        for fname in os.listdir(path):
-            img_path = os.path.join(path, fname)
-            
-            # Đọc ảnh
-            img = cv2.imread(img_path)
-            if img is None: 
+
+        for fname in sorted(os.listdir(path)):
+            items.append((os.path.join(path, fname), label))
+    return items
+
+
+def find_changed(items, manifest):
+    """
+    Trả về (todo, unchanged_manifest): ảnh cần trích xuất lại và manifest của ảnh giữ nguyên.
+    Khớp nhanh bằng size + mtime; nếu lệch thì so hash nội dung.
+    """
+    todo, kept = [], {}
+    for img_path, label in items:
+        st = os.stat(img_path)
+        entry = manifest.get(img_path)
+        if entry is not None and entry["label"] == label and entry["size"] == st.st_size:
+            if entry["mtime"] == st.st_mtime:
+                kept[img_path] = entry
                 continue
-            
-            # === [BƯỚC NÂNG CẤP] ===
-            # Thay vì đưa ảnh gốc, ta đưa ảnh đã qua xử lý
-            processed_img = preprocess_image(img)
-            # =======================
-            
-            # Trích xuất đặc trưng
-            result = detector.extract_features(processed_img)
-            
-            # --- XỬ LÝ DỮ LIỆU TRẢ VỀ (Tương thích cả bản cũ và mới) ---
-            if result is None: 
-                continue 
-            
-            # Nếu result là tuple (features, bbox, nose_point...) -> Lấy phần tử đầu tiên
-            if isinstance(result, tuple):
-                features = result[0]
-            else:
-                features = result
-            
-            # Kiểm tra lại lần cuối xem features có hợp lệ không
+            digest = file_hash(img_path)
+            if entry["sha1"] == digest:
+                kept[img_path] = dict(entry, mtime=st.st_mtime)
+                continue
+        todo.append((img_path, label))
+    return todo, kept
+
+
+# --- WORKER: MỖI PROCESS 1 DETECTOR + 1 PREPROCESSOR ---
+_detector = None
+_preprocessor = None
+
+
+def _init_worker():
+    global _detector, _preprocessor
+    # Giữ cấu hình FaceMesh như lúc tạo geometry_features.csv / model hiện tại (chế độ video mặc định)
+    _detector = FaceMeshDetector()
+    _preprocessor = Preprocessor()
+
+
+def _load_images(chunk):
+    """
+    Đọc + tiền xử lý từng ảnh (None nếu đọc lỗi).
+    Ảnh trả về là buffer của _preprocessor: extract_batch dùng xong mới lấy ảnh tiếp theo.
+    """
+    for img_path, _ in chunk:
+        img = cv2.imread(img_path)
+        # Thay vì đưa ảnh gốc, ta đưa ảnh đã qua xử lý
+        yield None if img is None else _preprocessor.apply(img)
+
+
+def extract_chunk(chunk):
+    """Trích xuất 1 lô ảnh -> [(path, entry của manifest, (landmarks, (w, h)) hoặc None), ...]"""
+    batch = _detector.extract_batch(_load_images(chunk), keep_landmarks=True)
+    results = []
+    for i, (img_path, label) in enumerate(chunk):
+        st = os.stat(img_path)
+        entry = {"label": label, "size": st.st_size, "mtime": st.st_mtime,
+                 "sha1": file_hash(img_path), "features": None}
+        mesh = None
+        # Ảnh không thấy mặt (hoặc đọc lỗi) bị che trong mask, features giữ None
+        if batch.mask[i]:
+            entry["features"] = batch.features[i].tolist()
+            mesh = (batch.landmarks[i], tuple(int(v) for v in batch.sizes[i]))
+        results.append((img_path, entry, mesh))
+    return results
+
+
+def write_csv(items, manifest, path=OUTPUT_FILE):
+    """Ghi lại toàn bộ CSV từ manifest (ghi file tạm rồi thay thế)"""
+    total = 0
+    tmp = path + ".tmp"
+    with open(tmp, "w", newline="") as f:
+        writer = csv.writer(f)
+        # Ghi tiêu đề cột
+        writer.writerow(["LeftEAR", "RightEAR", "MAR", "Label"])
+        for img_path, label in items:
+            features = manifest[img_path]["features"]
             if features is not None:
-                # Features là numpy array, cần chuyển thành list để ghi vào CSV
                 # Cấu trúc ghi: [LeftEAR, RightEAR, MAR, Label]
-                row_data = list(features) + [label]
-                writer.writerow(row_data)
+                writer.writerow(features + [label])
                 total += 1
+    os.replace(tmp, path)
+    return total
+
+
+def write_store(items, manifest, extracted, new_landmarks, path=STORE_DIR):
+    """
+    Cập nhật kho đặc trưng tại chỗ: ảnh mới / đã sửa (extracted) được nối thêm, dòng cũ của chúng
+    và của ảnh đã xóa / không còn thấy mặt chỉ bị đánh dấu deleted. Ảnh không đổi giữ nguyên dòng cũ.
+    """
+    store = open_store(path) or FeatureStore(path)
+    sources = store.sources
+    live = {sources[i]: i for i in store.live_rows().tolist()}
+
+    rows = [(img_path, label) for img_path, label in items if manifest[img_path]["features"] is not None]
+    wanted = {img_path for img_path, _ in rows}
+    stale = [i for src, i in live.items() if src in extracted or src not in wanted]
+    added = [(img_path, label) for img_path, label in rows if img_path in extracted or img_path not in live]
+
+    n = len(added)
+    landmarks = np.full((n, N_LANDMARKS, 3), np.nan, dtype=np.float32)
+    sizes = np.zeros((n, 2), dtype=np.int32)
+    missing = 0
+    for i, (img_path, _) in enumerate(added):
+        if img_path in new_landmarks:
+            points, size = new_landmarks[img_path]
+            landmarks[i, :len(points)] = points[:N_LANDMARKS]
+            sizes[i] = size
+        else:
+            missing += 1
+
+    # Nối trước rồi mới đánh dấu: dừng giữa chừng thì chỉ thừa dòng chứ không mất dòng
+    store.append([manifest[p]["features"] for p, _ in added], [label for _, label in added],
+                 landmarks=landmarks, image_size=sizes, sources=[p for p, _ in added])
+    store.mark_deleted(stale)
+    store.set_settings(dataset_root=DATASET_ROOT, static_image_mode=False, refine_landmarks=True,
+                       preprocess=Preprocessor().describe())
+    if missing:
+        print(f"[INFO] {missing} ảnh không có landmark trong kho (xóa manifest để trích xuất lại)")
+    print(f"[INFO] Kho đặc trưng: +{n} dòng, {len(stale)} dòng cũ bị thay / xóa")
+    return len(rows)
+
+
+# --- CHƯƠNG TRÌNH CHÍNH ---
+if __name__ == "__main__":
+    items = scan_dataset()
+    old_manifest = load_manifest()
+    todo, manifest = find_changed(items, old_manifest)
+    print(f"[INFO] {len(items)} ảnh: {len(items) - len(todo)} không đổi, {len(todo)} ảnh mới / đã sửa")
+
+    new_landmarks = {}
+    if todo:
+        print(f"-> Đang trích xuất với {N_WORKERS} process...")
+        chunks = [todo[i:i + BATCH_SIZE] for i in range(0, len(todo), BATCH_SIZE)]
+        done = 0
+        with ProcessPoolExecutor(max_workers=N_WORKERS, initializer=_init_worker) as pool:
+            for results in pool.map(extract_chunk, chunks):
+                for img_path, entry, mesh in results:
+                    manifest[img_path] = entry
+                    if mesh is not None:
+                        new_landmarks[img_path] = mesh
+                if (done + len(results)) // 500 > done // 500:
+                    print(f"    {done + len(results)}/{len(todo)}")
+                done += len(results)
+
+    # Ảnh bị xóa sẽ tự rơi khỏi manifest
+    changed = manifest != old_manifest
+    if changed:
+        save_manifest(manifest)
+
+    print(f"[INFO] Đang ghi file CSV tại: {OUTPUT_FILE}")
+    total = write_csv(items, manifest)
+    if changed or open_store(STORE_DIR) is None:
+        print(f"[INFO] Đang ghi kho đặc trưng tại: {STORE_DIR}")
+        write_store(items, manifest, {img_path for img_path, _ in todo}, new_landmarks)
 
-print(f"✅ HOÀN TẤT! Tổng cộng đã trích xuất được {total} dòng dữ liệu.")
-print("-> Bây giờ bạn hãy chạy file train_model.py để huấn luyện lại nhé!")
\ No newline at end of file
+    print(f"✅ HOÀN TẤT! Tổng cộng đã trích xuất được {total} dòng dữ liệu.")
+    print("-> Bây giờ bạn hãy chạy file train_model.py để huấn luyện lại nhé!")
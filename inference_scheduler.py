@@ -0,0 +1,130 @@
+import threading
+from collections import deque
+from clock import SYSTEM_CLOCK
+
+from detection_logic import EYE_CLOSE_TIME_THRESH, YAWN_TIME_THRESH, LABEL_NORMAL
+
+# --- CẤU HÌNH ---
+FULL_RATE_HZ = 30.0
+REDUCED_RATE_HZ = 6.0
+# Khoảng nghỉ dài nhất giữa 2 lần suy luận: đủ nhỏ để vẫn thấy nhắm mắt / ngáp
+# nhiều lần trước khi vượt EYE_CLOSE_TIME_THRESH / YAWN_TIME_THRESH
+MAX_INTERVAL = min(EYE_CLOSE_TIME_THRESH, YAWN_TIME_THRESH) / 4
+STABLE_SECONDS = 5.0          # AWAKE ổn định bao lâu thì mới giảm tần số
+ALERT_SCORE_THRESH = 90.0     # score_alert tối thiểu để coi là ổn định
+MAR_SUSPICIOUS = 0.3          # miệng bắt đầu mở
+EAR_DROP_RATIO = 0.8          # EAR tụt dưới 80% mức nền -> nghi ngờ
+EAR_FAST_ALPHA = 0.5          # EMA nhanh (xu hướng gần đây)
+EAR_SLOW_ALPHA = 0.05         # EMA chậm (mức nền khi tỉnh táo)
+
+MODE_FULL = "FULL"
+MODE_REDUCED = "REDUCED"
+
+
+class AdaptiveRateScheduler:
+    """
+    Giảm tần số suy luận khi tài xế tỉnh táo ổn định, về lại tối đa ngay khi có dấu hiệu nghi ngờ.
+    should_infer() gọi từ inference worker; observe() gọi sau mỗi frame đã suy luận (thread GUI),
+    nên mọi trạng thái dùng chung (mode, EMA, decisions, bộ đếm) chỉ đọc / ghi khi giữ _lock.
+    """
+    def __init__(self, full_rate=FULL_RATE_HZ, reduced_rate=REDUCED_RATE_HZ, history=200, clock=None):
+        self.clock = clock or SYSTEM_CLOCK
+        self.full_interval = 1.0 / full_rate
+        self.reduced_interval = min(1.0 / reduced_rate, MAX_INTERVAL)
+        self.mode = MODE_FULL
+        self.last_infer = None
+        self.last_suspicious = None
+        self.ear_fast = None
+        self.ear_slow = None
+        self.reason = "start"
+        self.decisions = deque(maxlen=history)   # (thời điểm, mode, lý do) mỗi lần đổi mode
+        self.inferred = 0
+        self.skipped = 0
+        self._lock = threading.Lock()
+
+    @property
+    def interval(self):
+        return self.full_interval if self.mode == MODE_FULL else self.reduced_interval
+
+    @property
+    def rate_hz(self):
+        return 1.0 / self.interval
+
+    def should_infer(self, now=None):
+        """True nếu frame này cần chạy FaceMesh + model"""
+        if now is None:
+            now = self.clock.time()
+        with self._lock:
+            # Chế độ FULL: suy luận mọi frame camera đưa tới
+            if self.mode == MODE_FULL or self.last_infer is None or now - self.last_infer >= self.interval:
+                self.last_infer = now
+                self.inferred += 1
+                return True
+            self.skipped += 1
+            return False
+
+    def _suspicious_reason(self, features, decision, score_alert, nod_state):
+        if features is None:
+            return "mất mặt"
+        if decision.is_warning or decision.has_error:
+            return "cảnh báo"
+        if decision.pred != LABEL_NORMAL:
+            return f"nhãn {decision.pred}"
+        if decision.nods > 0 or nod_state != 0:
+            return "gật đầu"
+        if score_alert < ALERT_SCORE_THRESH:
+            return f"score_alert {score_alert:.0f}"
+        if features[2] > MAR_SUSPICIOUS:
+            return f"MAR {features[2]:.2f}"
+        if self.ear_slow is not None and self.ear_fast < self.ear_slow * EAR_DROP_RATIO:
+            return f"EAR giảm {self.ear_fast:.2f}/{self.ear_slow:.2f}"
+        return None
+
+    def observe(self, now, features, decision=None, score_alert=100.0, nod_state=0):
+        """Cập nhật mode sau 1 frame đã suy luận (features=None khi không thấy mặt)"""
+        with self._lock:
+            self._observe(now, features, decision, score_alert, nod_state)
+
+    def _observe(self, now, features, decision, score_alert, nod_state):
+        if features is not None:
+            ear = (features[0] + features[1]) / 2
+            if self.ear_fast is None:
+                self.ear_fast = self.ear_slow = ear
+            self.ear_fast += EAR_FAST_ALPHA * (ear - self.ear_fast)
+
+        reason = None
+        if features is None or decision is not None:
+            reason = self._suspicious_reason(features, decision, score_alert, nod_state)
+
+        if reason is not None:
+            self.last_suspicious = now
+            self._set_mode(now, MODE_FULL, reason)
+        else:
+            # Chỉ học mức EAR nền khi đang bình thường
+            self.ear_slow += EAR_SLOW_ALPHA * (self.ear_fast - self.ear_slow)
+            if self.last_suspicious is None:
+                self.last_suspicious = now
+            if now - self.last_suspicious >= STABLE_SECONDS:
+                self._set_mode(now, MODE_REDUCED, f"AWAKE ổn định {STABLE_SECONDS:.0f}s")
+
+    def _set_mode(self, now, mode, reason):
+        self.reason = reason
+        if mode != self.mode:
+            self.mode = mode
+            self.decisions.append((now, mode, reason))
+
+    def stats(self):
+        with self._lock:
+            return self._stats()
+
+    def _stats(self):
+        total = self.inferred + self.skipped
+        return {
+            "mode": self.mode,
+            "rate_hz": self.rate_hz,
+            "reason": self.reason,
+            "inferred": self.inferred,
+            "skipped": self.skipped,
+            "inferred_ratio": self.inferred / total if total else 1.0,
+            "mode_changes": len(self.decisions),
+        }
@@ -0,0 +1,258 @@
+import os
+import json
+import time
+import threading
+import argparse
+from bisect import bisect_left
+
+# --- CẤU HÌNH ---
+METRIC_PREFIX = "drowsiness_"
+DEFAULT_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+DEFAULT_FLUSH_INTERVAL = 10.0
+FORMATS = ("json", "prometheus")
+
+
+# ================= COUNTER / GAUGE / HISTOGRAM =================
+# Mỗi metric chỉ được ghi từ 1 thread (worker hoặc GUI) nên không cần lock;
+# thread flush chỉ đọc.
+class Counter:
+    __slots__ = ("name", "help", "value")
+
+    def __init__(self, name, help=""):
+        self.name = name
+        self.help = help
+        self.value = 0
+
+    def inc(self, n=1):
+        self.value += n
+
+
+class Gauge:
+    """Giá trị đọc lúc snapshot qua hàm fn() (vd. số frame bị bỏ trong queue)"""
+    __slots__ = ("name", "help", "fn")
+
+    def __init__(self, name, fn, help=""):
+        self.name = name
+        self.help = help
+        self.fn = fn
+
+    @property
+    def value(self):
+        try:
+            return float(self.fn())
+        except Exception:
+            return float("nan")
+
+
+class _Timer:
+    __slots__ = ("hist", "t0")
+
+    def __init__(self, hist):
+        self.hist = hist
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.hist.observe((time.perf_counter() - self.t0) * 1000)
+        return False
+
+
+class Histogram:
+    """Histogram độ trễ (ms) với các bucket cố định kiểu Prometheus"""
+    __slots__ = ("name", "help", "buckets", "counts", "sum", "count", "max")
+
+    def __init__(self, name, help="", buckets=DEFAULT_BUCKETS_MS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)   # ô cuối: > bucket lớn nhất
+        self.sum = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, ms):
+        self.counts[bisect_left(self.buckets, ms)] += 1
+        self.sum += ms
+        self.count += 1
+        if ms > self.max:
+            self.max = ms
+
+    def time(self):
+        """with hist.time(): ... -> ghi thời gian chạy của khối lệnh"""
+        return _Timer(self)
+
+    def snapshot(self):
+        return {"buckets": list(self.buckets), "counts": list(self.counts),
+                "sum": self.sum, "count": self.count, "max": self.max}
+
+
+# ================= BẢN RỖNG KHI TẮT =================
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class _NullMetric:
+    """Thay cho Counter/Histogram khi tắt instrumentation: mọi lời gọi đều không làm gì"""
+    __slots__ = ()
+    _timer = _NullTimer()
+
+    def inc(self, n=1):
+        pass
+
+    def observe(self, ms):
+        pass
+
+    def time(self):
+        return self._timer
+
+
+NULL_METRIC = _NullMetric()
+
+
+# ================= REGISTRY + FLUSH ĐỊNH KỲ =================
+class Metrics:
+    """
+    Registry các metric. Khi enabled=False trả về NULL_METRIC nên chi phí ở hot path
+    chỉ còn 1 lời gọi hàm rỗng.
+    """
+    def __init__(self, enabled=False, prefix=METRIC_PREFIX):
+        self.enabled = enabled
+        self.prefix = prefix
+        self._metrics = {}
+        self._flusher = None
+        self._stop = threading.Event()
+        self.started = time.time()
+
+    def _register(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help=""):
+        if not self.enabled:
+            return NULL_METRIC
+        return self._metrics.get(self.prefix + name) or self._register(Counter(self.prefix + name, help))
+
+    def histogram(self, name, help="", buckets=DEFAULT_BUCKETS_MS):
+        if not self.enabled:
+            return NULL_METRIC
+        return self._metrics.get(self.prefix + name) or self._register(Histogram(self.prefix + name, help, buckets))
+
+    def gauge(self, name, fn, help=""):
+        if not self.enabled:
+            return NULL_METRIC
+        return self._register(Gauge(self.prefix + name, fn, help))
+
+    def snapshot(self):
+        data = {"timestamp": time.time(), "uptime_s": time.time() - self.started,
+                "counters": {}, "gauges": {}, "histograms": {}}
+        for name, metric in list(self._metrics.items()):
+            if isinstance(metric, Counter):
+                data["counters"][name] = metric.value
+            elif isinstance(metric, Gauge):
+                data["gauges"][name] = metric.value
+            else:
+                data["histograms"][name] = metric.snapshot()
+        return data
+
+    def to_prometheus(self):
+        lines = []
+        for name, metric in list(self._metrics.items()):
+            if metric.help:
+                lines.append(f"# HELP {name} {metric.help}")
+            if isinstance(metric, Counter):
+                lines += [f"# TYPE {name} counter", f"{name} {metric.value}"]
+            elif isinstance(metric, Gauge):
+                lines += [f"# TYPE {name} gauge", f"{name} {metric.value}"]
+            else:
+                lines.append(f"# TYPE {name} histogram")
+                counts = list(metric.counts)
+                cumulative = 0
+                for le, c in zip(metric.buckets, counts):
+                    cumulative += c
+                    lines.append(f'{name}_bucket{{le="{le}"}} {cumulative}')
+                lines.append(f'{name}_bucket{{le="+Inf"}} {cumulative + counts[-1]}')
+                lines.append(f"{name}_sum {metric.sum}")
+                lines.append(f"{name}_count {metric.count}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path, fmt="json"):
+        """Ghi snapshot ra file (ghi file tạm rồi đổi tên để bên đọc không thấy file dở)"""
+        text = self.to_prometheus() if fmt == "prometheus" else json.dumps(self.snapshot(), indent=2)
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp, path)
+
+    def start_flusher(self, path, fmt="json", interval=DEFAULT_FLUSH_INTERVAL):
+        if not self.enabled or self._flusher is not None:
+            return
+
+        def loop():
+            while not self._stop.wait(interval):
+                try:
+                    self.write(path, fmt)
+                except OSError as e:
+                    print(f"[METRICS] Không ghi được {path}: {e}")
+
+        self._stop.clear()
+        self._flusher = threading.Thread(target=loop, name="metrics-flush", daemon=True)
+        self._flusher.start()
+        self._flush_args = (path, fmt)
+
+    def stop_flusher(self):
+        """Dừng thread flush và ghi snapshot cuối cùng"""
+        if self._flusher is None:
+            return
+        self._stop.set()
+        self._flusher.join(timeout=2.0)
+        self._flusher = None
+        try:
+            self.write(*self._flush_args)
+        except OSError as e:
+            print(f"[METRICS] Không ghi được {self._flush_args[0]}: {e}")
+
+
+# ================= ĐỌC FILE METRICS (THAY CHO SCRAPER) =================
+def read_snapshot(path):
+    """Đọc file do Metrics.write tạo ra -> dict {tên metric: giá trị} (JSON hoặc Prometheus text)"""
+    with open(path, encoding="utf-8") as f:
+        text = f.read()
+    if text.lstrip().startswith("{"):
+        data = json.loads(text)
+        values = dict(data["counters"])
+        values.update(data["gauges"])
+        for name, h in data["histograms"].items():
+            values[name + "_count"] = h["count"]
+            values[name + "_sum"] = h["sum"]
+        return values
+    values = {}
+    for line in text.splitlines():
+        if not line or line.startswith("#"):
+            continue
+        name, _, value = line.rpartition(" ")
+        values[name] = float(value)
+    return values
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Đọc file metrics do main_gui ghi ra")
+    parser.add_argument("path")
+    parser.add_argument("--watch", type=float, default=0, help="đọc lại sau mỗi N giây")
+    args = parser.parse_args()
+
+    while True:
+        values = read_snapshot(args.path)
+        print(f"--- {args.path} ({time.strftime('%H:%M:%S', time.localtime(os.path.getmtime(args.path)))})")
+        for name, value in values.items():
+            print(f"{name:<60} {value:g}")
+        if args.watch <= 0:
+            break
+        time.sleep(args.watch)
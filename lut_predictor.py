@@ -0,0 +1,138 @@
+import os
+import time
+import argparse
+import numpy as np
+
+# --- CẤU HÌNH ĐƯỜNG DẪN ---
+current_dir = os.path.dirname(os.path.abspath(__file__))
+CSV_FILE = os.path.join(current_dir, "geometry_features.csv")
+MODEL_PATH = os.path.join(current_dir, "drowsiness_ensemble.pkl")
+LUT_PATH = os.path.join(current_dir, "drowsiness_lut.npz")
+
+FEATURE_COLUMNS = ["LeftEAR", "RightEAR", "MAR"]
+DEFAULT_BINS = 64
+
+
+# ================= BẢNG TRA 3 CHIỀU =================
+class LUTPredictor:
+    """
+    Bảng tra lượng tử hóa đều trên 3 feature (LeftEAR, RightEAR, MAR).
+    Mỗi ô lưu xác suất các lớp tính sẵn từ ensemble tại tâm ô,
+    nên predict chỉ còn là 1 phép index mảng. Giá trị ngoài khoảng bị kẹp vào ô biên.
+    Dùng được như model sklearn: predict([features]) / predict_proba([features]).
+    """
+    def __init__(self, table, lo, hi, classes):
+        self.table = np.asarray(table, dtype=np.float32)       # (B0, B1, B2, n_classes)
+        self.lo = np.asarray(lo, dtype=np.float64)
+        self.hi = np.asarray(hi, dtype=np.float64)
+        self.classes_ = np.asarray(classes)
+        self.bins = np.array(self.table.shape[:3])
+        self._inv_step = self.bins / (self.hi - self.lo)
+        self._max_idx = self.bins - 1
+        # Nhãn tính sẵn cho từng ô -> predict không cần argmax
+        self.labels = self.classes_[self.table.argmax(axis=-1)]
+
+    def _cells(self, X):
+        X = np.asarray(X, dtype=np.float64).reshape(-1, 3)
+        idx = ((X - self.lo) * self._inv_step).astype(np.intp)
+        np.clip(idx, 0, self._max_idx, out=idx)
+        return idx[:, 0], idx[:, 1], idx[:, 2]
+
+    def predict_proba(self, X):
+        return self.table[self._cells(X)]
+
+    def predict(self, X):
+        return self.labels[self._cells(X)]
+
+    def save(self, path=LUT_PATH):
+        np.savez_compressed(path, table=self.table, lo=self.lo, hi=self.hi, classes=self.classes_)
+
+    @classmethod
+    def load(cls, path=LUT_PATH):
+        data = np.load(path)
+        return cls(data["table"], data["lo"], data["hi"], data["classes"])
+
+
+def feature_ranges(X, margin=0.02):
+    """Khoảng [lo, hi] của từng feature trong dữ liệu, nới thêm margin (tỉ lệ)"""
+    X = np.asarray(X, dtype=np.float64)
+    lo, hi = X.min(axis=0), X.max(axis=0)
+    pad = (hi - lo) * margin
+    return lo - pad, hi + pad
+
+
+def build_lut(model, lo, hi, bins=DEFAULT_BINS, batch_size=65536):
+    """Tính xác suất của model tại tâm mọi ô lưới và đóng gói thành LUTPredictor"""
+    bins = np.broadcast_to(np.asarray(bins, dtype=int), (3,))
+    lo, hi = np.asarray(lo, dtype=np.float64), np.asarray(hi, dtype=np.float64)
+    step = (hi - lo) / bins
+    centers = [lo[i] + step[i] * (np.arange(bins[i]) + 0.5) for i in range(3)]
+    grid = np.stack(np.meshgrid(*centers, indexing="ij"), axis=-1).reshape(-1, 3)
+
+    proba = np.empty((len(grid), len(model.classes_)), dtype=np.float32)
+    for start in range(0, len(grid), batch_size):
+        proba[start:start + batch_size] = model.predict_proba(grid[start:start + batch_size])
+    table = proba.reshape(*bins, len(model.classes_))
+    return LUTPredictor(table, lo, hi, model.classes_)
+
+
+def compare_with_model(lut, model, X):
+    """So sánh bảng tra với ensemble thật trên tập X"""
+    ref_proba = model.predict_proba(X)
+    ref_pred = model.classes_[ref_proba.argmax(axis=1)]
+    lut_proba = lut.predict_proba(X)
+    lut_pred = lut.predict(X)
+    diff = np.abs(lut_proba - ref_proba)
+    return {
+        "samples": len(X),
+        "disagreement": float((lut_pred != ref_pred).mean()),
+        "disagree_count": int((lut_pred != ref_pred).sum()),
+        "max_proba_diff": float(diff.max()),
+        "mean_proba_diff": float(diff.mean()),
+    }
+
+
+# ================= TOOL: BUILD BẢNG TRA TỪ PICKLE =================
+if __name__ == "__main__":
+    import joblib
+    import warnings
+    import pandas as pd
+
+    # Model được fit bằng DataFrame, còn lưới / CSV đưa vào là ndarray
+    warnings.filterwarnings("ignore", message="X does not have valid feature names")
+
+    parser = argparse.ArgumentParser(description="Build bảng tra 3-D từ drowsiness_ensemble.pkl")
+    parser.add_argument("--model", default=MODEL_PATH)
+    parser.add_argument("--csv", default=CSV_FILE)
+    parser.add_argument("--out", default=LUT_PATH)
+    parser.add_argument("--bins", type=int, nargs="+", default=[DEFAULT_BINS],
+                        help="số ô mỗi trục (1 giá trị hoặc 3 giá trị)")
+    parser.add_argument("--margin", type=float, default=0.02)
+    args = parser.parse_args()
+
+    model = joblib.load(args.model)
+    X = pd.read_csv(args.csv)[FEATURE_COLUMNS].values
+    lo, hi = feature_ranges(X, args.margin)
+    print(f"[1] Khoảng feature: lo={np.round(lo, 4)} hi={np.round(hi, 4)}, bins={args.bins}")
+
+    t0 = time.perf_counter()
+    lut = build_lut(model, lo, hi, bins=args.bins)
+    print(f"[2] Đã tính {lut.table.shape[:3]} ô trong {time.perf_counter() - t0:.1f}s")
+
+    report = compare_with_model(lut, model, X)
+    print(f"[3] So với ensemble thật trên {report['samples']} mẫu CSV:")
+    print(f"    Lệch nhãn: {report['disagree_count']} mẫu ({report['disagreement'] * 100:.2f}%)")
+    print(f"    Sai khác xác suất: max={report['max_proba_diff']:.4f} mean={report['mean_proba_diff']:.4f}")
+
+    x1 = X[:1]
+    n = 2000
+    t0 = time.perf_counter()
+    for _ in range(n): model.predict(x1)
+    t_model = (time.perf_counter() - t0) / n
+    t0 = time.perf_counter()
+    for _ in range(n): lut.predict(x1)
+    t_lut = (time.perf_counter() - t0) / n
+    print(f"[4] predict 1 mẫu: ensemble {t_model * 1e3:.3f} ms | bảng tra {t_lut * 1e3:.4f} ms (x{t_model / t_lut:.0f})")
+
+    lut.save(args.out)
+    print(f"✅ Đã lưu bảng tra tại: {args.out} ({os.path.getsize(args.out) / 1e6:.1f} MB)")
@@ -1,76 +1,83 @@
+from startup import StartupProfiler, load_runtime, STARTUP_BUDGET_S
+STARTUP = StartupProfiler()      # mốc 0 của báo cáo khởi động
+
+import gc
 import sys
 import cv2
 import numpy as np
-import joblib
 import time
 import os
-import pygame
-from face_utils import FaceMeshDetector
-from datetime import datetime
-from collections import deque
+import threading
+from pipeline import FramePipeline
+from inference_scheduler import AdaptiveRateScheduler
+from instrumentation import Metrics
+from display_utils import FrameDisplay
+from detection_logic import NOD_COUNT_THRESH, AlarmLatch
+from engine import DrowsinessEngine, FATIGUE_WARN_PERCENT
+from clock import SYSTEM_CLOCK
+from preprocessing import Preprocessor
+from telemetry_log import TelemetryLog, TELEMETRY_DIR
+from alarm_service import SOUND_ALARM, SOUND_WARN
 
 # PyQt5 Imports
 from PyQt5.QtWidgets import (QApplication, QWidget, QLabel, QPushButton, QMessageBox)
-from PyQt5.QtGui import QImage, QPixmap, QFont, QPainter, QPen, QColor, QIcon
+from PyQt5.QtGui import QPixmap, QFont, QPainter, QPen, QColor, QIcon
 from PyQt5.QtCore import QTimer, Qt
+# mediapipe, sklearn (unpickle model) và pygame được import trên thread nền, xem startup.py / alarm_service.py
+STARTUP.lap("import")
 
 
 # ================= CẤU HÌNH ĐƯỜNG DẪN & NGƯỠNG =================
 CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
 # Thay vì dùng đường dẫn C://... dài dòng và dễ sai
 MODEL_PATH = os.path.join(CURRENT_DIR, "drowsiness_ensemble.pkl")
+LUT_PATH = os.path.join(CURRENT_DIR, "drowsiness_lut.npz")
+# "pickle": ensemble gốc | "lut": bảng tra 3-D (chạy lut_predictor.py để tạo)
+# "native": ensemble gốc tính bằng numpy, cùng kết quả nhưng nhanh hơn ~15 lần
+MODEL_BACKEND = "pickle"
 
 # File tài nguyên
 BG_IMAGE_PATH = os.path.join(CURRENT_DIR, "HDPE.jpg")
 MUTE_ICON_PATH = os.path.join(CURRENT_DIR, "mute.jpg")
 SOUND_ALARM_PATH = os.path.join(CURRENT_DIR, "chuongqd.wav")
 SOUND_WARN_PATH = os.path.join(CURRENT_DIR, "bip.wav")
-
-# Ngưỡng Logic
-EYE_CLOSE_TIME_THRESH = 2.0
-YAWN_TIME_THRESH = 1.0
-NOD_COUNT_THRESH = 8
-NOD_RESET_TIME = 4.0
-
-# ================= CLASS LOGIC GẬT ĐẦU =================
-class NodDetector:
-    def __init__(self):
-        self.reset()
-        self.threshold = 60
-        self.awake_start_time = None
-        self.AWAKE_STOP_ALARM_TIME = 5.0  # giây
-        self.total_drive_seconds = 0        # tổng thời gian lái trong ngày
-        self.daily_drive_seconds_cache = 0  # cache khi stop/start
-        self.session_drive_seconds = 0      # thời gian phiên hiện tại
-
-    def reset(self):
-        """Hàm reset trạng thái về ban đầu"""
-        self.min_y = None; self.max_y = None
-        self.state = 0; self.nod_count = 0
-        self.last_nod_time = time.time()
-
-    def update(self, nose_y):
-        current_time = time.time()
-        # Reset nếu lâu quá không gật tiếp
-        if current_time - self.last_nod_time > NOD_RESET_TIME and self.nod_count > 0:
-            if self.nod_count < NOD_COUNT_THRESH: 
-                self.nod_count = 0; self.state = 0
-        
-        if self.min_y is None: self.min_y = nose_y; self.max_y = nose_y; return 0
-        self.min_y = min(self.min_y, nose_y)
-        self.max_y = max(self.max_y, nose_y)
-
-        # State Machine: 0->1->2->Count
-        if self.state == 0:
-            if nose_y > self.min_y + self.threshold: self.state = 1
-        elif self.state == 1:
-            if nose_y < self.max_y - self.threshold: self.state = 2
-        elif self.state == 2:
-             if nose_y < self.max_y - self.threshold:
-                self.nod_count += 1
-                self.last_nod_time = current_time
-                self.min_y = nose_y; self.max_y = nose_y; self.state = 0
-        return self.nod_count
+# Chuông chạy trên thread riêng (alarm_service.py); "null": không phát tiếng, chạy headless / test
+AUDIO_BACKEND = "pygame"
+
+# ROI tracking: chạy FaceMesh trên vùng mặt của frame trước (nhẹ hơn với camera 1080p)
+FACE_TRACKING = False
+# Cổng chuyển động: mặt / mắt / miệng gần như không đổi thì dùng lại landmark frame trước, bỏ qua FaceMesh
+MOTION_GATE = False
+
+# Chế độ lái đêm: làm rõ frame (CLAHE + làm nét) giống lúc tạo dataset, bật / tắt bằng nút NIGHT
+NIGHT_MODE = False
+# True: chỉ làm rõ vùng mặt của frame trước (nhẹ hơn) nhưng khác ảnh cả frame lúc huấn luyện,
+# chưa kiểm chứng trên dữ liệu có nhãn là cho cùng đặc trưng -> mặc định làm rõ cả frame
+NIGHT_MODE_ROI = False
+
+# Pipeline (capture / inference / GUI)
+GUI_POLL_MS = 15                 # chu kỳ GUI lấy kết quả mới nhất
+PIPELINE_STATS_INTERVAL = 5.0    # giây, in thống kê queue / dropped frame
+# Giảm tần số suy luận khi tài xế tỉnh táo ổn định (xem inference_scheduler.py)
+ADAPTIVE_RATE = False
+# Frame camera đọc thẳng vào bộ buffer cấp phát sẵn theo độ phân giải camera, dùng lại mỗi frame
+REUSE_FRAME_BUFFERS = True
+# Sau khi load xong: gc.freeze() các object lúc khởi động (model, MediaPipe, Qt) để GC đầy đủ
+# (MediaPipe tạo rác vòng mỗi frame) không quét lại ~130k object, tránh khựng ~50 ms giữa các frame
+FREEZE_GC_AFTER_LOAD = True
+
+# Metrics (timer / counter / histogram), tắt thì gần như không tốn gì
+METRICS_ENABLED = False
+METRICS_PATH = os.path.join(CURRENT_DIR, "metrics.prom")
+METRICS_FORMAT = "prometheus"    # "prometheus" hoặc "json"
+METRICS_FLUSH_INTERVAL = 10.0    # giây
+
+# Telemetry: log nhị phân theo ngày, khôi phục bộ đếm / thời gian lái khi mở lại app
+# (ghi vào thư mục dữ liệu người dùng, xem telemetry_log.TELEMETRY_DIR)
+TELEMETRY_ENABLED = True
+
+# Khởi động: hiện cửa sổ trước, load model / FaceMesh / âm thanh + warm-up trên thread nền
+STARTUP_POLL_MS = 50
 
 # ================= WIDGET: PROGRESS CIRCLE =================
 class ProgressCircle(QWidget):
@@ -165,58 +172,51 @@ class FatigueBar(QWidget):
 
 # ================= MAIN APPLICATION =================
 class DrowsinessApp(QWidget):
-    def __init__(self):
+    def __init__(self, clock=None):
         super().__init__()
+        # Mọi logic thời gian (ngủ / ngáp / gật, tắt chuông, thời gian lái) đọc từ clock này
+        self.clock = clock or SYSTEM_CLOCK
         self.setWindowTitle("Driver Drowsiness Detection System by HDPE")
         self.resize(1280, 720)
         
-        # Load Model
-        try:
-            self.clf = joblib.load(MODEL_PATH)
-            self.model_loaded = True
-            print(f"Load model thành công tại: {MODEL_PATH}")
-        except Exception as e:
-            print(f"Lỗi thực tế khi load model là: {e}") # Nó sẽ hiện lỗi thật ở đây
-            self.model_loaded = False
-
-        self.detector = FaceMeshDetector()
-        self.nod_logic = NodDetector()
+        # Model + FaceMesh được gắn vào engine khi thread nền load xong (xem start_runtime_loader)
+        self.model_loaded = False
+        self.runtime_ready = False
+
+        # ===== METRICS =====
+        self.metrics = Metrics(enabled=METRICS_ENABLED)
+        self.m_display = self.metrics.histogram("display_ms", "chuyển frame sang QPixmap và hiển thị")
+        self.m_frames = self.metrics.counter("frames_displayed_total", "frame đã hiển thị")
+        self.m_faces_lost = self.metrics.counter("faces_lost_total", "frame suy luận không thấy mặt")
+        self.m_alarms = self.metrics.counter("alarms_fired_total", "số lần bật chuông báo ngủ")
+        self._dropped_before = 0   # frame bị bỏ của các phiên camera trước
+        self.metrics.gauge("frames_dropped", self._dropped_frames, "frame bị bỏ trong các queue")
+        self.metrics.start_flusher(METRICS_PATH, METRICS_FORMAT, METRICS_FLUSH_INTERVAL)
+
+        # Trạng thái tài xế (logic, điểm số, bộ đếm trong ngày) nằm trong engine, không phụ thuộc Qt
+        self.engine = DrowsinessEngine(None, None, self.metrics, clock=self.clock)
+        self.night_preprocessor = Preprocessor(roi=NIGHT_MODE_ROI)
 
        # ===== AUDIO =====
-        pygame.mixer.init()
-        self.alarm_sound = pygame.mixer.Sound("chuongqd.wav")
-        self.alarm_sound.set_volume(1.0)
-
-        # Âm thanh báo fatigue > 50%
-        self.fatigue_sound = pygame.mixer.Sound("bip.wav")
-        self.fatigue_sound.set_volume(1.0)
+        # Service chuông (chuông báo ngủ + bíp báo fatigue), có sau khi thread nền load xong
+        self.audio = None
 
 
-        self.alarm_playing = False
+        # Bật / tắt chuông: kêu khi cảnh báo, tự tắt sau 5 giây tỉnh táo, mute tới lần ngủ tiếp theo
+        self.alarm = AlarmLatch(clock=self.clock)
         self.fatigue_playing = False
-        self.alarm_muted = False
-        self.awake_start_time = None
-        self.AWAKE_STOP_ALARM_SEC = 5
-
-        # --- BIẾN ĐIỂM SỐ ---
-        self.score_sleep = 0.0
-        self.score_yawn = 0.0
-        self.score_alert = 100.0
 
         # ===== FATIGUE THEO NGÀY =====
-        self.day_total = 0
-        self.day_sleep = 0
-        self.day_yawn = 0
         self._fatigue_warned = False
 
         
-        # Biến đếm thời gian
-        self.eye_start = None
-        self.yawn_start = None
-        
         self.setup_ui()
         
         self.cap = None
+        self.pipeline = None
+        self.scheduler = None
+        self._last_decision = None
+        self._last_stats_time = 0
         self.timer = QTimer()
         self.timer.timeout.connect(self.update_frame)
         self.total_drive_seconds = 0
@@ -224,7 +224,64 @@ class DrowsinessApp(QWidget):
         self.daily_drive_seconds_cache = 0   # lưu tổng thời gian khi STOP
         self.session_drive_seconds = 0       # thời gian phiên hiện tại
 
-
+        # ===== TELEMETRY =====
+        self.telemetry = None
+        self._counter_day = self.clock.now().date()
+        if TELEMETRY_ENABLED:
+            try:
+                self.telemetry = TelemetryLog(TELEMETRY_DIR, clock=self.clock)
+                self.restore_day_state(self.telemetry.recover())
+            except OSError as e:
+                print(f"[TELEMETRY] Không mở được log: {e}")
+
+        self.night_btn.setChecked(NIGHT_MODE)
+        self.start_runtime_loader()
+
+
+
+    # ================= KHỞI ĐỘNG NỀN =================
+    def start_runtime_loader(self):
+        self.start_btn.setEnabled(False)
+        self.status_label.setText("STATUS: LOADING...")
+        self._runtime = None
+        self._loader = threading.Thread(target=self._load_runtime, name="startup-loader", daemon=True)
+        self._loader.start()
+        self.loader_timer = QTimer()
+        self.loader_timer.timeout.connect(self.check_runtime_loaded)
+        self.loader_timer.start(STARTUP_POLL_MS)
+
+    def _load_runtime(self):
+        """Chạy trên thread nền, không chạm vào GUI"""
+        self._runtime = load_runtime(STARTUP, MODEL_BACKEND, MODEL_PATH, LUT_PATH, FACE_TRACKING,
+                                     (SOUND_ALARM_PATH, SOUND_WARN_PATH),
+                                     preprocessor=self.night_preprocessor, audio_backend=AUDIO_BACKEND,
+                                     clock=self.clock, metrics=self.metrics, motion_gate=MOTION_GATE)
+
+    def check_runtime_loaded(self):
+        if self._loader.is_alive():
+            return
+        self.loader_timer.stop()
+        runtime = self._runtime
+        if runtime is None:
+            self.status_label.setText("STATUS: LOAD ERROR")
+            return
+        self.engine.detector = runtime.detector
+        self.engine.clf = runtime.clf
+        self.audio = runtime.audio
+        self.model_loaded = runtime.clf is not None
+        if self.model_loaded:
+            print(f"Load model thành công ({type(runtime.clf).__name__}, backend={MODEL_BACKEND})")
+        for error in runtime.errors:
+            print(f"Lỗi thực tế khi load {error}")
+
+        if FREEZE_GC_AFTER_LOAD:
+            gc.collect()
+            gc.freeze()
+        self.runtime_ready = True
+        STARTUP.ready()
+        print(STARTUP.report(STARTUP_BUDGET_S))
+        self.start_btn.setEnabled(True)
+        self.status_label.setText("STATUS: READY")
 
     def setup_ui(self):
         # Background
@@ -240,6 +297,7 @@ class DrowsinessApp(QWidget):
         self.video_label = QLabel(self)
         self.video_label.setGeometry(100, 250, 900, 660)
         self.video_label.setStyleSheet("border:3px solid white; background:black;")
+        self.display = FrameDisplay(self.video_label)
 
         # Time
         self.time_label = QLabel(self)
@@ -294,6 +352,14 @@ class DrowsinessApp(QWidget):
         self.mute_btn.setStyleSheet("background:transparent; border:none; color: white; font-weight: bold;")
         self.mute_btn.clicked.connect(self.toggle_mute)
 
+        self.night_btn = QPushButton("NIGHT", self)
+        self.night_btn.setGeometry(900, 370, 64, 64)
+        self.night_btn.setCheckable(True)
+        self.night_btn.setStyleSheet(
+            "QPushButton { background:rgba(0,0,0,150); color: white; font-weight: bold; border-radius: 8px; }"
+            "QPushButton:checked { background:#34495e; color: #f1c40f; }")
+        self.night_btn.toggled.connect(self.set_night_mode)
+
         # Circles
         self.circle_awake = ProgressCircle("AWAKE", "#00ff00", self)
         self.circle_awake.setGeometry(500, 30, 180, 180)
@@ -313,13 +379,13 @@ class DrowsinessApp(QWidget):
         self.bg_label.setGeometry(0, 0, self.width(), self.height())
 
     def update_time(self):
-        self.time_label.setText("🕒 " + datetime.now().strftime("%d/%m/%Y  %H:%M:%S"))
+        self.time_label.setText("🕒 " + self.clock.now().strftime("%d/%m/%Y  %H:%M:%S"))
 
     def update_drive_time(self):
         if not self.drive_start_time:
             return
 
-        elapsed = datetime.now() - self.drive_start_time
+        elapsed = self.clock.now() - self.drive_start_time
         self.session_drive_seconds = int(elapsed.total_seconds())
 
         # ===== TOTAL = CACHE + SESSION =====
@@ -349,17 +415,69 @@ class DrowsinessApp(QWidget):
 
 
     # ================= LOGIC CHÍNH =================
-    def update_frame(self):
-        ret, frame = self.cap.read()
-        if not ret: return
+    def run_inference(self, frame):
+        """Chạy trên inference worker: FaceMesh + model, không chạm vào GUI"""
+        return self.engine.infer(frame)
 
-        frame = cv2.flip(frame, 1)
-        frame_ai = frame 
-        h, w = frame_ai.shape[:2]
+    def restore_day_state(self, state):
+        """Khôi phục bộ đếm hành vi + thời gian lái trong ngày từ telemetry"""
+        if state["records"] == 0:
+            return
+        self.engine.day_total = state["day_total"]
+        self.engine.day_sleep = state["day_sleep"]
+        self.engine.day_yawn = state["day_yawn"]
+        self.daily_drive_seconds_cache = state["drive_seconds"]
+        self.total_drive_seconds = state["drive_seconds"]
+        print(f"[INFO] Khôi phục hôm nay: {state['day_total']} frames, "
+              f"lái {state['drive_seconds'] // 60} phút")
+
+    def log_frame(self, result, decision):
+        """Ghi 1 frame đã suy luận vào telemetry (decision=None khi không thấy mặt)"""
+        if self.telemetry is None:
+            return
+        if self.telemetry.rolls_over(result.t_capture):
+            # Qua nửa đêm: file mới không được mang bộ đếm / thời gian lái của hôm qua
+            self.reset_day_counters(self.clock.now().date())
+        if decision is None:
+            self.telemetry.append(result.t_capture, None, -1, -1, 0.0, False, self.total_drive_seconds)
+        else:
+            self.telemetry.append(result.t_capture, result.features, decision.pred, result.pred,
+                                  result.nose[1], decision.is_warning, self.total_drive_seconds)
+
+    def reset_day_counters(self, today):
+        """Sang ngày mới: bộ đếm hành vi và thời gian lái trong ngày về 0"""
+        self._counter_day = today
+        self.engine.reset_day()
+        # total = cache + session: phần phiên đã lái trước nửa đêm thuộc về hôm qua
+        self.daily_drive_seconds_cache = -self.session_drive_seconds
+        self.total_drive_seconds = 0
+        self._fatigue_warned = False
 
-        if self.model_loaded:
-            features, bbox, nose = self.detector.extract_features(frame_ai)
-        else: features = None
+    def _dropped_frames(self):
+        pipeline = self.pipeline
+        if pipeline is None:
+            return self._dropped_before
+        return self._dropped_before + pipeline.frame_queue.dropped + pipeline.result_queue.dropped
+
+    def update_frame(self):
+        pipeline = self.pipeline
+        result = pipeline.latest_result()
+        if result is None: return
+        try:
+            self.show_result(result)
+        finally:
+            # Vẽ / hiển thị xong mới trả buffer frame cho capture dùng lại
+            pipeline.release(result)
+
+    def show_result(self, result):
+        now = time.time()
+        if now - self._last_stats_time >= PIPELINE_STATS_INTERVAL:
+            self._last_stats_time = now
+            print(self.pipeline.format_stats())
+
+        frame_ai = result.frame
+        h, w = frame_ai.shape[:2]
+        features, bbox, nose = result.features, result.bbox, result.nose
 
         status_text = "NORMAL"
         box_color = (0, 255, 0)
@@ -367,90 +485,37 @@ class DrowsinessApp(QWidget):
         has_error = False
         nods = 0
 
+        if result.inferred and features is None:
+            self.m_faces_lost.inc()
+            self.log_frame(result, None)
+            if self.scheduler is not None:
+                self.scheduler.observe(result.t_capture, None)
+
         if features is not None:
             (fx, fy, fw, fh) = bbox
-            pred = self.clf.predict([features])[0]
-
-            self.day_total += 1
-            if pred == 1:
-                self.day_sleep += 1
-            elif pred == 2:
-                self.day_yawn += 1
-
-            # Logic Ghi đè AI
-            mar = features[2]
-            if mar > 0.4: pred = 2 
-            elif pred == 2 and mar < 0.3: pred = 0 
-
-            # Logic Gật đầu
-            nods = self.nod_logic.update(nose[1])
-
-            # 1. XỬ LÝ NGỦ (SLEEP)
-            if pred == 1:
-                if self.eye_start is None: self.eye_start = time.time()
-                elapsed = time.time() - self.eye_start
-                status_text = f"SLEEP: {elapsed:.1f}s"
-                box_color = (0, 165, 255)
-                has_error = True
-                
-                # Tăng điểm Sleep (max 100)
-                self.score_sleep = min(self.score_sleep + 0.5, 100)
-                
-                if elapsed > EYE_CLOSE_TIME_THRESH: is_warning = True
-            else:
-                self.eye_start = None
-                # Giảm điểm Sleep từ từ
-                self.score_sleep = max(self.score_sleep - 0.2, 0)
-
-            # 2. XỬ LÝ NGÁP (YAWN)
-            if pred == 2:
-                if self.yawn_start is None: self.yawn_start = time.time()
-                dur = time.time() - self.yawn_start
-                if dur > YAWN_TIME_THRESH:
-                    status_text = f"YAWN !!! ({dur:.1f}s)"
-                    box_color = (0, 255, 255)
-                    has_error = True
-                    # Tăng điểm Yawn
-                    self.score_yawn = min(self.score_yawn + 0.5, 100)
-                else:
-                    status_text = " "
-                    box_color = (200, 255, 200)
-            else:
-                self.yawn_start = None
-                # Giảm điểm Yawn từ từ
-                self.score_yawn = max(self.score_yawn - 0.2, 0)
-
-            # 3. XỬ LÝ GẬT ĐẦU
-            if nods >= NOD_COUNT_THRESH:
-                is_warning = True
-                has_error = True
-                status_text = "SLEEP !!!"
-                # Phạt nặng điểm Sleep
-                self.score_sleep = min(self.score_sleep + 2.0, 100)
-
-            # --- TÍNH ĐIỂM BÙ TRỪ (TỔNG 100%) ---
-            # Công thức: Awake = 100 - (Sleep + Yawn)
-            # Nếu Sleep + Yawn > 100 thì co lại cho phù hợp
-            
-            total_fatigue = self.score_sleep + self.score_yawn
-            
-            if total_fatigue > 100:
-                # Nếu tổng mệt > 100, chuẩn hóa lại theo tỉ lệ
-                ratio = 100 / total_fatigue
-                self.score_sleep *= ratio
-                self.score_yawn *= ratio
-                self.score_alert = 0
+
+            if result.inferred or self._last_decision is None:
+                # Thời gian theo lúc chụp frame (giống telemetry / replay.py), không theo lúc GUI hiển thị
+                decision = self.engine.step(features, nose, result.pred, now=result.t_capture)
+                self._last_decision = decision
+                self.log_frame(result, decision)
+                if self.scheduler is not None:
+                    self.scheduler.observe(result.t_capture, features, decision,
+                                           self.engine.score_alert, self.engine.logic.nod_logic.state)
             else:
-                self.score_alert = 100 - total_fatigue
+                # Frame bị scheduler bỏ qua: giữ nguyên quyết định của lần suy luận trước
+                decision = self._last_decision
+            status_text = decision.status_text
+            box_color = decision.box_color
+            is_warning = decision.is_warning
+            has_error = decision.has_error
+            nods = decision.nods
 
             # --- VẼ GIAO DIỆN ---
             # ================== ALARM & WARNING LOGIC ==================
 
             if is_warning:
                 # ---- CÓ CẢNH BÁO (NGỦ / GẬT) ----
-                self.awake_start_time = None      # reset đếm awake
-                self.alarm_muted = False          # ✅ TỰ BỎ MUTE KHI NGỦ LẠI
-
                 cv2.rectangle(frame_ai, (0, 0), (w, h), (0, 0, 255), 10)
                 msg = "SLEEP !!!"
                 cv2.putText(
@@ -463,26 +528,12 @@ class DrowsinessApp(QWidget):
                     5
                 )
 
-                self.play_alarm()
-
-            else:
-                # ---- KHÔNG CẢNH BÁO (AWAKE) ----
-
-                # Nếu đã bấm mute → tắt chuông ngay
-                if self.alarm_muted:
-                    self.stop_alarm()
-                    self.awake_start_time = None
-
-                else:
-                    # Chưa mute → bắt đầu / tiếp tục đếm awake
-                    if self.awake_start_time is None:
-                        self.awake_start_time = time.time()
-                    else:
-                        awake_duration = time.time() - self.awake_start_time
-
-                        # Awake đủ 5 giây → tắt chuông
-                        if awake_duration >= self.AWAKE_STOP_ALARM_SEC:
-                            self.stop_alarm()
+            # Cảnh báo -> bật chuông (tự bỏ mute); tỉnh táo đủ 5 giây hoặc đã mute -> tắt chuông
+            alarm_event = self.alarm.update(is_warning, now=result.t_capture)
+            if alarm_event == "start":
+                self.play_alarm(result.t_capture)
+            elif alarm_event == "stop":
+                self.stop_alarm()
 
             # ================== DRAW NORMAL UI ==================
             cv2.rectangle(frame_ai, (fx, fy), (fw, fh), box_color, 2)
@@ -513,20 +564,20 @@ class DrowsinessApp(QWidget):
             )
 
         # Update Circles
-        self.circle_awake.setValue(self.score_alert)
-        self.circle_sleep.setValue(self.score_sleep)
-        self.circle_yawn.setValue(self.score_yawn)
+        self.circle_awake.setValue(self.engine.score_alert)
+        self.circle_sleep.setValue(self.engine.score_sleep)
+        self.circle_yawn.setValue(self.engine.score_yawn)
 
-        fatigue = self.calculate_fatigue(self.total_drive_seconds)
+        fatigue = self.engine.calculate_fatigue(self.total_drive_seconds)
 
         self.fatigue_bar.setValue(fatigue)
 
-        if fatigue > 70:
+        if fatigue > FATIGUE_WARN_PERCENT:
             if not self._fatigue_warned:
                 self._fatigue_warned = True
 
-                if not self.alarm_muted:
-                    self.fatigue_sound.play(loops=-1)
+                if not self.alarm.muted and self.audio is not None:
+                    self.audio.play(SOUND_WARN)
                     self.fatigue_playing = True
 
                 QMessageBox.warning(
@@ -537,51 +588,23 @@ class DrowsinessApp(QWidget):
         else:
             self._fatigue_warned = False
             if self.fatigue_playing:
-                self.fatigue_sound.stop()
+                self.audio.stop(SOUND_WARN)
                 self.fatigue_playing = False
 
         # Display Image
-        rgb = cv2.cvtColor(frame_ai, cv2.COLOR_BGR2RGB)
-        qt_img = QImage(rgb.data, w, h, w*3, QImage.Format_RGB888)
-        self.video_label.setPixmap(QPixmap.fromImage(qt_img).scaled(
-            self.video_label.size(), Qt.IgnoreAspectRatio, Qt.SmoothTransformation
-        ))
-    
-    def calculate_fatigue(self, total_seconds):
-        """
-        Tính mức độ mệt mỏi dựa trên:
-        - Số lượng frame sleep và yawn
-        - Thời gian lái (giây)
-        Trả về giá trị 0-100 (%)
-        """
-        if self.day_total == 0:
-            return 0
-
-        # Fatigue cơ bản (hành vi)
-        base_fatigue = (self.day_sleep + 0.5 * self.day_yawn) / self.day_total * 100
-
-        # Fatigue theo thời gian lái: 4 tiếng = 70%
-        time_factor = total_seconds / 14400 * 70
-
-        fatigue = base_fatigue + time_factor
-        return min(100, fatigue)
+        with self.m_display.time():
+            shown = self.display.show(frame_ai)
+        if shown:
+            self.m_frames.inc()
+
 
     # ================= CONTROLS =================
     def reset_system_state(self):
         """Hàm reset toàn bộ trạng thái về mặc định"""
-        # 1. Reset logic gật đầu
-        self.nod_logic.reset()
+        # 1. Reset logic gật đầu, các biến đếm thời gian và điểm số
+        self.engine.reset()
         
-        # 2. Reset các biến đếm thời gian
-        self.eye_start = None
-        self.yawn_start = None
-        
-        # 3. Reset điểm số
-        self.score_alert = 100.0
-        self.score_sleep = 0.0
-        self.score_yawn = 0.0
-        
-        # 4. Cập nhật giao diện ngay lập tức
+        # 2. Cập nhật giao diện ngay lập tức
         self.circle_awake.setValue(100)
         self.circle_sleep.setValue(0)
         self.circle_yawn.setValue(0)
@@ -589,34 +612,51 @@ class DrowsinessApp(QWidget):
         self.stop_alarm()
 
     def start_camera(self):
+        if not self.runtime_ready:
+            return
         self.reset_system_state()
-        self.awake_start_time = None
 
         self.cap = cv2.VideoCapture(0)
-        self.timer.start(30)
-
-        self.drive_start_time = datetime.now()
+        self.scheduler = AdaptiveRateScheduler(clock=self.clock) if ADAPTIVE_RATE else None
+        self._last_decision = None
+        # Camera mới: không bám / dùng lại landmark của phiên trước (có thể khác cả độ phân giải)
+        self.engine.detector.reset_tracking()
+        self.pipeline = FramePipeline(self.run_inference, scheduler=self.scheduler, clock=self.clock,
+                                      reuse_frames=REUSE_FRAME_BUFFERS)
+        self.pipeline.start(self.cap)
+        self.timer.start(GUI_POLL_MS)
+
+        self.drive_start_time = self.clock.now()
         self.drive_timer.start(1000)
 
         self.status_label.setText("STATUS: STARTED")
 
-        # Reset hành vi trong phiên
-        self.day_total = 0
-        self.day_sleep = 0
-        self.day_yawn = 0
+        # Reset hành vi: theo phiên, hoặc theo ngày khi có telemetry để khôi phục
+        today = self.clock.now().date()
+        if self.telemetry is None:
+            self.engine.reset_day()
+        elif today != self._counter_day:
+            self.session_drive_seconds = 0
+            self.reset_day_counters(today)
         self._fatigue_warned = False
         self.fatigue_bar.setValue(0)
 
         # ✅ CHỈ reset PHIÊN
         self.session_drive_seconds = 0
-        self.drive_start_time = datetime.now()   # OK
+        self.drive_start_time = self.clock.now()   # OK
 
 
     def stop_camera(self):
         self.timer.stop()
+        if self.pipeline:
+            self.pipeline.stop()
+            print(self.pipeline.format_stats())
+            self._dropped_before = self._dropped_frames()
+            self.pipeline = None
         if self.cap:
             self.cap.release()
-        self.video_label.clear()
+            self.cap = None
+        self.display.clear()
 
         self.stop_alarm()
 
@@ -629,36 +669,45 @@ class DrowsinessApp(QWidget):
 
         self.drive_time_label.setText("Driving Time: 00:00:00")
 
-        self.eye_start = None
-        self.yawn_start = None
-        self.awake_start_time = None
+        self.engine.logic.eye_start = None
+        self.engine.logic.yawn_start = None
 
         self.status_label.setText("STATUS: STOPPED")
 
-    def play_alarm(self):
-        if not self.alarm_playing and not self.alarm_muted:
-            try: self.alarm_sound.play(loops=-1)
-            except: pass
-            self.alarm_playing = True
+    def play_alarm(self, t_warning=None):
+        """t_warning: t_capture của frame bắt đầu cảnh báo, để đo độ trễ tới lúc chuông kêu"""
+        self.m_alarms.inc()
+        if self.audio is not None:
+            self.audio.play(SOUND_ALARM, t_warning)
 
     def stop_alarm(self):
-        try: self.alarm_sound.stop()
-        except: pass
-        self.alarm_playing = False
+        self.alarm.stop()
+        if self.audio is not None:
+            self.audio.stop(SOUND_ALARM)
+
+    def set_night_mode(self, enabled):
+        """Inference worker đọc engine.preprocessor mỗi frame nên đổi được khi đang chạy"""
+        self.engine.preprocessor = self.night_preprocessor if enabled else None
+        print(f"[INFO] Chế độ lái đêm: {'BẬT' if enabled else 'TẮT'}")
 
     def toggle_mute(self):
-        self.alarm_muted = True
+        self.alarm.mute()
         self.stop_alarm()
-        self.awake_start_time = None
 
 
     def closeEvent(self, event):
         self.stop_camera()
-        pygame.mixer.quit()
+        self.metrics.stop_flusher()
+        if self.telemetry is not None:
+            self.telemetry.close()
+        if self.audio is not None:
+            print(self.audio.format_stats())
+            self.audio.close()
         event.accept()
 
 if __name__ == "__main__":
     app = QApplication(sys.argv)
     window = DrowsinessApp()
     window.show()
+    STARTUP.lap("window")
     sys.exit(app.exec_())
@@ -0,0 +1,56 @@
+import os
+import joblib
+import numpy as np
+
+# --- CẤU HÌNH ĐƯỜNG DẪN ---
+current_dir = os.path.dirname(os.path.abspath(__file__))
+MODEL_PATH = os.path.join(current_dir, "drowsiness_ensemble.pkl")
+LUT_PATH = os.path.join(current_dir, "drowsiness_lut.npz")
+
+# "pickle": ensemble sklearn gốc | "lut": bảng tra 3-D (build bằng lut_predictor.py)
+# "native": ensemble gốc chạy bằng numpy (native_ensemble.py), kết quả như sklearn
+BACKENDS = ("pickle", "lut", "native")
+
+
+def load_classifier(backend="pickle", model_path=MODEL_PATH, lut_path=LUT_PATH):
+    """
+    Trả về model có predict()/predict_proba() theo backend được chọn.
+    Nếu thiếu file bảng tra, hoặc backend "native" không chạy được model (train_model.py --search
+    có thể chọn model không phải ensemble) thì quay về model sklearn gốc.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Backend không hợp lệ: {backend} (chọn 1 trong {BACKENDS})")
+
+    if backend == "lut":
+        if os.path.exists(lut_path):
+            from lut_predictor import LUTPredictor
+            return LUTPredictor.load(lut_path)
+        print(f"[CẢNH BÁO] Không tìm thấy bảng tra {lut_path}, dùng ensemble gốc.")
+        print("-> Hãy chạy lut_predictor.py để tạo bảng tra!")
+
+    model = joblib.load(model_path)
+    if backend == "native":
+        from native_ensemble import NativeEnsemble
+        try:
+            return NativeEnsemble(model)
+        except (TypeError, AttributeError) as e:
+            print(f"[CẢNH BÁO] Backend native không chạy được model {type(model).__name__} ({e}), dùng model gốc.")
+    return model
+
+
+def predict_batch(clf, features, mask=None):
+    """
+    Dự đoán cả lô bằng 1 lần predict_proba -> (pred (n,), proba (n, n_class)).
+    Dòng bị che bởi mask (không thấy mặt) không đưa vào model: pred = -1, proba = NaN.
+    """
+    features = np.asarray(features, dtype=np.float64)
+    n = len(features)
+    if mask is None:
+        mask = np.ones(n, dtype=bool)
+    classes = np.asarray(clf.classes_)
+    pred = np.full(n, -1, dtype=np.int64)
+    proba = np.full((n, len(classes)), np.nan)
+    if mask.any():
+        proba[mask] = clf.predict_proba(features[mask])
+        pred[mask] = classes[proba[mask].argmax(axis=1)]
+    return pred, proba
@@ -0,0 +1,213 @@
+import os
+import json
+import time
+import queue
+import argparse
+import threading
+import multiprocessing as mp
+import cv2
+
+# --- CẤU HÌNH ---
+current_dir = os.path.dirname(os.path.abspath(__file__))
+MODEL_PATH = os.path.join(current_dir, "drowsiness_ensemble.pkl")
+LUT_PATH = os.path.join(current_dir, "drowsiness_lut.npz")
+DEFAULT_FPS = 30.0
+REPORT_INTERVAL = 5.0      # giây, mỗi stream gửi thống kê về supervisor
+LIVE_RETRY_SLEEP = 0.05    # camera đọc lỗi thì chờ rồi đọc lại
+
+
+def parse_source(source):
+    """"0", "1"... -> chỉ số camera; còn lại là đường dẫn video / URL"""
+    return int(source) if source.isdigit() else source
+
+
+# ================= 1 STREAM = 1 THREAD =================
+def run_stream(stream_id, source, clf, events, stop_event, flip=True, tracking=False, realtime=False):
+    """Đọc 1 nguồn video, chạy DrowsinessEngine riêng, gửi thống kê / sự kiện về supervisor"""
+    from face_utils import FaceMeshDetector
+    from engine import DrowsinessEngine
+
+    cap = cv2.VideoCapture(source)
+    if not cap.isOpened():
+        events.put(("error", stream_id, f"Không mở được nguồn: {source}"))
+        return
+    live = isinstance(source, int)
+    src_fps = cap.get(cv2.CAP_PROP_FPS) or DEFAULT_FPS
+    # Mỗi stream 1 detector (graph MediaPipe không dùng chung được giữa các thread), model dùng chung
+    engine = DrowsinessEngine(clf, FaceMeshDetector(tracking=tracking))
+    engine.reset(now=None if live else 0.0)
+
+    frames = faces = alarms = 0
+    now = time.time() if live else 0.0
+    was_warning = False
+    status = "NORMAL"
+    t_start = last_report = time.perf_counter()
+    frames_at_report = 0
+
+    def snapshot(now_perf):
+        elapsed = max(now_perf - t_start, 1e-6)
+        return {
+            "source": str(source),
+            "frames": frames,
+            "fps": frames / elapsed,
+            "recent_fps": (frames - frames_at_report) / max(now_perf - last_report, 1e-6),
+            "face_ratio": faces / frames if frames else 0.0,
+            "alarms": alarms,
+            "status": status,
+            "score_sleep": engine.score_sleep,
+            "score_yawn": engine.score_yawn,
+            "score_alert": engine.score_alert,
+            "fatigue": engine.calculate_fatigue(frames / src_fps, now),
+        }
+
+    while not stop_event.is_set():
+        ret, frame = cap.read()
+        if not ret:
+            if live:
+                time.sleep(LIVE_RETRY_SLEEP)
+                continue
+            break
+        if flip:
+            frame = cv2.flip(frame, 1, dst=frame)
+        # Video ghi sẵn: dùng thời gian của video; camera: đồng hồ thật
+        now = time.time() if live else frames / src_fps
+        if realtime and not live:
+            delay = t_start + now - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+
+        _, _, _, decision = engine.process_frame(frame, now)
+        frames += 1
+        if decision is not None:
+            faces += 1
+            status = decision.status_text
+            if decision.is_warning and not was_warning:
+                alarms += 1
+                events.put(("alarm", stream_id, {"source": str(source), "time": now, "status": status}))
+            was_warning = decision.is_warning
+        else:
+            status = "NO FACE"
+
+        t = time.perf_counter()
+        if t - last_report >= REPORT_INTERVAL:
+            events.put(("stats", stream_id, snapshot(t)))
+            last_report, frames_at_report = t, frames
+
+    cap.release()
+    events.put(("done", stream_id, snapshot(time.perf_counter())))
+
+
+def _run_stream_safe(stream_id, *args):
+    """Lỗi của 1 stream không được làm chết các stream khác trong cùng process"""
+    try:
+        run_stream(stream_id, *args)
+    except Exception as e:
+        args[2].put(("error", stream_id, f"{type(e).__name__}: {e}"))
+
+
+# ================= 1 PROCESS = 1 MODEL + N STREAM =================
+def worker_main(assignments, backend, model_path, lut_path, events, stop_event, flip, tracking, realtime):
+    import warnings
+    from model_loader import load_classifier
+    warnings.filterwarnings("ignore", message="X does not have valid feature names")
+    clf = load_classifier(backend, model_path, lut_path)   # load 1 lần, các stream trong process dùng chung
+
+    threads = [threading.Thread(target=_run_stream_safe, name=f"stream-{sid}",
+                                args=(sid, source, clf, events, stop_event, flip, tracking, realtime),
+                                daemon=True)
+               for sid, source in assignments]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+
+# ================= SUPERVISOR =================
+def print_table(stats):
+    print(f"\n{'id':>3} {'source':<28}{'frames':>8}{'fps':>8}{'now fps':>9}{'face':>7}{'alarms':>8}  status")
+    for sid in sorted(stats):
+        s = stats[sid]
+        print(f"{sid:>3} {os.path.basename(s['source'])[:27]:<28}{s['frames']:>8}{s['fps']:>8.1f}"
+              f"{s['recent_fps']:>9.1f}{s['face_ratio'] * 100:>6.0f}%{s['alarms']:>8}  {s['status']}")
+
+
+def supervise(sources, workers, backend="pickle", model_path=MODEL_PATH, lut_path=LUT_PATH,
+              flip=True, tracking=False, realtime=False, out_path=None):
+    """Chia N stream cho các process (round-robin) và tổng hợp thống kê từng stream"""
+    workers = max(1, min(workers, len(sources)))
+    ctx = mp.get_context("spawn")
+    events = ctx.Queue()
+    stop_event = ctx.Event()
+    assignments = [[] for _ in range(workers)]
+    for sid, source in enumerate(sources):
+        assignments[sid % workers].append((sid, parse_source(source)))
+
+    procs = [ctx.Process(target=worker_main, name=f"worker-{i}",
+                         args=(assignments[i], backend, model_path, lut_path, events, stop_event,
+                               flip, tracking, realtime))
+             for i in range(workers)]
+    print(f"[INFO] {len(sources)} stream -> {workers} process")
+    t0 = time.perf_counter()
+    for p in procs:
+        p.start()
+
+    stats, alarms, errors = {}, [], []
+    done = set()
+    last_print = time.perf_counter()
+    try:
+        while len(done) < len(sources):
+            try:
+                kind, sid, payload = events.get(timeout=1.0)
+            except queue.Empty:
+                if not any(p.is_alive() for p in procs):
+                    break
+                continue
+            if kind in ("stats", "done"):
+                stats[sid] = payload
+                if kind == "done":
+                    done.add(sid)
+            elif kind == "alarm":
+                alarms.append(dict(payload, stream=sid))
+                print(f"[ALARM] stream {sid} ({os.path.basename(payload['source'])}) "
+                      f"t={payload['time']:.1f}: {payload['status']}")
+            elif kind == "error":
+                errors.append({"stream": sid, "error": payload})
+                done.add(sid)
+                print(f"[BỎ QUA] stream {sid}: {payload}")
+            if stats and time.perf_counter() - last_print >= REPORT_INTERVAL:
+                last_print = time.perf_counter()
+                print_table(stats)
+    except KeyboardInterrupt:
+        print("\n[INFO] Dừng các stream...")
+        stop_event.set()
+    stop_event.set()
+    for p in procs:
+        p.join(timeout=5.0)
+    wall = time.perf_counter() - t0
+
+    if stats:
+        print_table(stats)
+    total_frames = sum(s["frames"] for s in stats.values())
+    report = {"streams": {str(sid): stats[sid] for sid in sorted(stats)}, "alarms": alarms,
+              "errors": errors, "workers": workers, "wall_s": wall,
+              "total_fps": total_frames / wall if wall > 0 else 0.0}
+    print(f"✅ {len(stats)} stream, tổng {total_frames} frames trong {wall:.1f}s ({report['total_fps']:.1f} fps)")
+    if out_path:
+        with open(out_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Giám sát nhiều camera / video cùng lúc (không cần GUI)")
+    parser.add_argument("sources", nargs="+", help="file video, URL hoặc chỉ số camera (0, 1, ...)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--backend", default="pickle", choices=["pickle", "lut", "native"])
+    parser.add_argument("--no-flip", action="store_true", help="không lật ảnh như camera trong GUI")
+    parser.add_argument("--tracking", action="store_true", help="FaceMesh chạy trên ROI vùng mặt")
+    parser.add_argument("--realtime", action="store_true", help="phát video ghi sẵn đúng tốc độ thật")
+    parser.add_argument("--json", help="ghi thống kê cuối cùng ra file JSON")
+    args = parser.parse_args()
+
+    supervise(args.sources, args.workers, backend=args.backend, flip=not args.no_flip,
+              tracking=args.tracking, realtime=args.realtime, out_path=args.json)
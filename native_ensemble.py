@@ -0,0 +1,283 @@
+import os
+import math
+import time
+import argparse
+import numpy as np
+
+# --- CẤU HÌNH ĐƯỜNG DẪN ---
+current_dir = os.path.dirname(os.path.abspath(__file__))
+CSV_FILE = os.path.join(current_dir, "geometry_features.csv")
+MODEL_PATH = os.path.join(current_dir, "drowsiness_ensemble.pkl")
+
+FEATURE_COLUMNS = ["LeftEAR", "RightEAR", "MAR"]
+
+# Sai khác xác suất tối đa cho phép so với sklearn.
+# RF / GB khớp bit-for-bit; riêng SVM lệch cỡ 1e-13 vì BLAS (ddot) mà libsvm dùng
+# để tính ||x - sv||^2 có thể dùng lệnh FMA, còn numpy thì không.
+PROBA_TOLERANCE = 1e-12
+
+
+# ================= CÂY QUYẾT ĐỊNH DẠNG MẢNG PHẲNG =================
+class FlatForest:
+    """
+    Gộp nhiều cây sklearn thành các mảng node phẳng (feature, threshold, left, right).
+    Node lá trỏ về chính nó nên có thể duyệt mọi cây cùng lúc bằng numpy
+    trong đúng max_depth bước, không cần rẽ nhánh theo từng cây.
+    """
+    def __init__(self, trees, leaf_values):
+        features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+        offset = 0
+        for tree, value in zip(trees, leaf_values):
+            n = tree.node_count
+            is_leaf = tree.children_left == -1
+            node_ids = np.arange(n)
+            lefts.append(np.where(is_leaf, node_ids, tree.children_left) + offset)
+            rights.append(np.where(is_leaf, node_ids, tree.children_right) + offset)
+            features.append(np.where(is_leaf, 0, tree.feature))
+            thresholds.append(tree.threshold)
+            values.append(value)
+            roots.append(offset)
+            offset += n
+        self.feature = np.concatenate(features).astype(np.intp)
+        self.threshold = np.concatenate(thresholds)
+        # child[2*node]: con phải, child[2*node + 1]: con trái -> child[2*node + (x <= threshold)]
+        self.child = np.stack([np.concatenate(rights), np.concatenate(lefts)], axis=1).astype(np.intp).ravel()
+        self.value = np.concatenate(values)
+        self.roots = np.array(roots, dtype=np.intp)
+        self.max_depth = max(tree.max_depth for tree in trees)
+
+    def apply(self, X32):
+        """X32: (n, 3) float32 như sklearn -> chỉ số lá (n, n_trees)"""
+        if len(X32) == 1:
+            # Đường nhanh cho 1 mẫu (trường hợp của vòng lặp realtime)
+            x, node = X32[0], self.roots
+            for _ in range(self.max_depth):
+                node = self.child[2 * node + (x[self.feature[node]] <= self.threshold[node])]
+            return node[None, :]
+        node = np.broadcast_to(self.roots, (len(X32), len(self.roots))).copy()
+        rows = np.arange(len(X32))[:, None]
+        for _ in range(self.max_depth):
+            node = self.child[2 * node + (X32[rows, self.feature[node]] <= self.threshold[node])]
+        return node
+
+
+# ================= EVALUATOR CHO VOTINGCLASSIFIER =================
+class NativeEnsemble:
+    """
+    Tái hiện VotingClassifier (soft) của drowsiness_ensemble.pkl bằng numpy:
+    - SVM: StandardScaler + RBF trên ma trận support vector + Platt scaling (như libsvm)
+    - RandomForest / GradientBoosting: FlatForest
+    Bỏ qua bước kiểm tra input và dispatch của sklearn nên nhanh hơn nhiều với 1 mẫu.
+    """
+    def __init__(self, model):
+        self.classes_ = model.classes_
+        weights = model.weights if model.weights is not None else [1] * len(model.estimators_)
+        self.weights = [float(w) for w in weights]
+        self.weight_sum = float(sum(weights))
+
+        names = [name for name, _ in model.estimators]
+        members = dict(zip(names, model.estimators_))
+        self.order = []
+        for name in names:
+            est = members[name]
+            kind = type(est).__name__
+            if kind == "Pipeline":
+                self._init_svm(est)
+            elif kind == "RandomForestClassifier":
+                self._init_rf(est)
+            elif kind == "GradientBoostingClassifier":
+                self._init_gb(est)
+            else:
+                raise TypeError(f"Chưa hỗ trợ estimator: {kind}")
+            self.order.append(kind)
+
+    # ---------- SVM ----------
+    def _init_svm(self, pipe):
+        scaler, svc = pipe.steps[0][1], pipe.steps[-1][1]
+        if svc.kernel != "rbf" or not svc.probability:
+            raise TypeError("Chỉ hỗ trợ SVC kernel='rbf', probability=True")
+        self.mean = scaler.mean_
+        self.scale = scaler.scale_
+        self.sv = svc.support_vectors_
+        self.gamma = svc._gamma
+        n_class = len(svc.classes_)
+        start = np.concatenate([[0], np.cumsum(svc.n_support_)])
+        dual = svc._dual_coef_
+        # Với mỗi cặp lớp (i, j): chỉ số SV và hệ số tương ứng, đúng thứ tự cộng của libsvm
+        self.pairs = []
+        for i in range(n_class):
+            for j in range(i + 1, n_class):
+                idx = np.r_[start[i]:start[i + 1], start[j]:start[j + 1]]
+                coef = np.r_[dual[j - 1, start[i]:start[i + 1]], dual[i, start[j]:start[j + 1]]]
+                self.pairs.append((i, j, idx, coef))
+        self.intercept = [float(v) for v in svc._intercept_]
+        self.prob_a = [float(v) for v in svc.probA_]
+        self.prob_b = [float(v) for v in svc.probB_]
+        self.n_class = n_class
+
+    def _svm_proba(self, X):
+        Xs = (X - self.mean) / self.scale
+        diff = Xs[:, None, :] - self.sv[None, :, :]
+        sq = diff * diff
+        kvalue = np.exp(-self.gamma * ((sq[..., 0] + sq[..., 1]) + sq[..., 2]))
+
+        proba = np.empty((len(X), self.n_class))
+        for n in range(len(X)):
+            r = [[0.0] * self.n_class for _ in range(self.n_class)]
+            for p, (i, j, idx, coef) in enumerate(self.pairs):
+                # Cộng tuần tự như vòng for trong libsvm
+                dec = float(np.cumsum(coef * kvalue[n, idx])[-1]) + self.intercept[p]
+                f = dec * self.prob_a[p] + self.prob_b[p]
+                if f >= 0:
+                    prob = math.exp(-f) / (1.0 + math.exp(-f))
+                else:
+                    prob = 1.0 / (1 + math.exp(f))
+                r[i][j] = min(max(prob, 1e-7), 1 - 1e-7)
+                r[j][i] = 1 - r[i][j]
+            proba[n] = _multiclass_probability(r)
+        return proba
+
+    # ---------- RANDOM FOREST ----------
+    def _init_rf(self, rf):
+        trees = [est.tree_ for est in rf.estimators_]
+        values = []
+        for tree in trees:
+            v = tree.value[:, 0, :]
+            norm = v.sum(axis=1)
+            norm[norm == 0] = 1
+            values.append(v / norm[:, None])
+        self.rf = FlatForest(trees, values)
+        self.rf_n_trees = len(trees)
+
+    def _rf_proba(self, X32):
+        leaves = self.rf.apply(X32)
+        # Cộng lần lượt từng cây giống sklearn rồi chia cho số cây
+        return np.cumsum(self.rf.value[leaves], axis=1)[:, -1] / self.rf_n_trees
+
+    # ---------- GRADIENT BOOSTING ----------
+    def _init_gb(self, gb):
+        # "deviance" (sklearn < 1.3) và "log_loss" là cùng 1 loss; 2 lớp thì sklearn chỉ có 1 cây / stage
+        if gb.loss not in ("log_loss", "deviance") or gb.n_classes_ <= 2:
+            raise TypeError("Chỉ hỗ trợ GradientBoosting đa lớp (log_loss)")
+        n_stages, n_class = gb.estimators_.shape
+        trees = [gb.estimators_[s, k].tree_ for s in range(n_stages) for k in range(n_class)]
+        self.gb = FlatForest(trees, [t.value[:, 0, 0] for t in trees])
+        self.gb_shape = (n_stages, n_class)
+        self.gb_lr = gb.learning_rate
+        eps = np.finfo(np.float32).eps
+        prior = np.clip(gb.init_.class_prior_, eps, 1 - eps)
+        self.gb_init = np.log(prior).astype(np.float64)
+
+    def _gb_proba(self, X32):
+        leaves = self.gb.apply(X32)
+        steps = self.gb_lr * self.gb.value[leaves].reshape(len(X32), *self.gb_shape)
+        init = np.broadcast_to(self.gb_init, (len(X32), 1, self.gb_shape[1]))
+        raw = np.cumsum(np.concatenate([init, steps], axis=1), axis=1)[:, -1]
+        a_max = raw.max(axis=1, keepdims=True)
+        lse = np.log(np.exp(raw - a_max).sum(axis=1)) + a_max[:, 0]
+        return np.nan_to_num(np.exp(raw - lse[:, None]))
+
+    # ---------- API GIỐNG SKLEARN ----------
+    def predict_proba(self, X):
+        X = np.asarray(X, dtype=np.float64).reshape(-1, 3)
+        X32 = X.astype(np.float32)
+        avg = None
+        for kind, w in zip(self.order, self.weights):
+            if kind == "Pipeline":
+                p = self._svm_proba(X)
+            elif kind == "RandomForestClassifier":
+                p = self._rf_proba(X32)
+            else:
+                p = self._gb_proba(X32)
+            avg = p * w if avg is None else avg + p * w
+        return avg / self.weight_sum
+
+    def predict(self, X):
+        return self.classes_[self.predict_proba(X).argmax(axis=1)]
+
+    @classmethod
+    def from_pickle(cls, path=MODEL_PATH):
+        import joblib
+        return cls(joblib.load(path))
+
+
+def _multiclass_probability(r):
+    """Ghép xác suất từng cặp thành xác suất đa lớp (Wu, Lin & Weng) - bản Python của libsvm"""
+    k = len(r)
+    max_iter = max(100, k)
+    eps = 0.005 / k
+    p = [1.0 / k] * k
+    Q = [[0.0] * k for _ in range(k)]
+    for t in range(k):
+        for j in range(t):
+            Q[t][t] += r[j][t] * r[j][t]
+            Q[t][j] = Q[j][t]
+        for j in range(t + 1, k):
+            Q[t][t] += r[j][t] * r[j][t]
+            Q[t][j] = -r[j][t] * r[t][j]
+    Qp = [0.0] * k
+    for _ in range(max_iter):
+        pQp = 0.0
+        for t in range(k):
+            Qp[t] = 0.0
+            for j in range(k):
+                Qp[t] += Q[t][j] * p[j]
+            pQp += p[t] * Qp[t]
+        max_error = max(abs(Qp[t] - pQp) for t in range(k))
+        if max_error < eps:
+            break
+        for t in range(k):
+            diff = (-Qp[t] + pQp) / Q[t][t]
+            p[t] += diff
+            pQp = (pQp + diff * (diff * Q[t][t] + 2 * Qp[t])) / (1 + diff) / (1 + diff)
+            for j in range(k):
+                Qp[j] = (Qp[j] + diff * Q[t][j]) / (1 + diff)
+                p[j] /= (1 + diff)
+    return p
+
+
+# ================= KIỂM TRA + MICRO-BENCHMARK =================
+if __name__ == "__main__":
+    import joblib
+    import warnings
+    import pandas as pd
+
+    # Model được fit bằng DataFrame, còn input 1x3 là list / ndarray
+    warnings.filterwarnings("ignore", message="X does not have valid feature names")
+
+    parser = argparse.ArgumentParser(description="So khớp NativeEnsemble với sklearn + đo tốc độ")
+    parser.add_argument("--model", default=MODEL_PATH)
+    parser.add_argument("--csv", default=CSV_FILE)
+    parser.add_argument("--repeat", type=int, default=2000)
+    args = parser.parse_args()
+
+    model = joblib.load(args.model)
+    native = NativeEnsemble(model)
+    X = pd.read_csv(args.csv)[FEATURE_COLUMNS].values
+
+    ref_proba = model.predict_proba(X)
+    nat_proba = native.predict_proba(X)
+    diff = np.abs(nat_proba - ref_proba).max()
+    same_pred = np.array_equal(model.predict(X), native.predict(X))
+    print(f"[1] {len(X)} mẫu CSV: nhãn trùng khớp = {same_pred}, "
+          f"bit-for-bit = {np.array_equal(nat_proba, ref_proba)}, max |Δproba| = {diff:.3e}")
+    assert same_pred and diff <= PROBA_TOLERANCE, "NativeEnsemble lệch so với sklearn!"
+
+    # Từng mẫu một (đúng cách main_gui gọi)
+    for row in X[:200]:
+        assert np.array_equal(model.predict([row]), native.predict([row]))
+
+    def per_call(fn):
+        row = [X[0]]
+        fn(row)
+        t0 = time.perf_counter()
+        for _ in range(args.repeat):
+            fn(row)
+        return (time.perf_counter() - t0) / args.repeat * 1e3
+
+    t_sk = per_call(model.predict)
+    t_nat = per_call(native.predict)
+    print(f"[2] predict 1 mẫu: sklearn {t_sk:.3f} ms | native {t_nat:.3f} ms (x{t_sk / t_nat:.1f})")
+    t_sk = per_call(model.predict_proba)
+    t_nat = per_call(native.predict_proba)
+    print(f"[3] predict_proba 1 mẫu: sklearn {t_sk:.3f} ms | native {t_nat:.3f} ms (x{t_sk / t_nat:.1f})")
@@ -0,0 +1,316 @@
+import os
+import csv
+import json
+import time
+import argparse
+import numpy as np
+import cv2
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from detection_logic import DrowsinessLogic, YAWN_TIME_THRESH
+from inference_scheduler import AdaptiveRateScheduler
+from timeline_scorer import score_timeline, SERIES
+
+# --- CẤU HÌNH ---
+current_dir = os.path.dirname(os.path.abspath(__file__))
+MODEL_PATH = os.path.join(current_dir, "drowsiness_ensemble.pkl")
+LUT_PATH = os.path.join(current_dir, "drowsiness_lut.npz")
+
+VIDEO_EXTS = (".mp4", ".avi", ".mov", ".mkv", ".m4v")
+DEFAULT_FPS = 30.0
+# Số frame mỗi lô: FaceMesh chạy từng frame, tính đặc trưng + predict_proba gộp 1 lần cho cả lô
+BATCH_SIZE = 64
+
+FRAME_COLUMNS = ["frame", "time", "face", "LeftEAR", "RightEAR", "MAR", "pred_raw", "pred",
+                 "nose_y", "nods", "is_warning", "sleep_elapsed", "yawn_elapsed",
+                 "score_sleep", "score_yawn", "score_alert", "inferred"]
+
+
+# ================= WORKER: MỖI PROCESS 1 DETECTOR + 1 MODEL =================
+_detector = None
+_clf = None
+_predict_batch = None
+
+
+def _init_worker(backend, model_path, lut_path, tracking=False):
+    global _detector, _clf, _predict_batch
+    # Import trong worker để process cha không phải khởi tạo MediaPipe
+    from face_utils import FaceMeshDetector
+    from model_loader import load_classifier, predict_batch
+    import warnings
+    warnings.filterwarnings("ignore", message="X does not have valid feature names")
+    _detector = FaceMeshDetector(tracking=tracking)
+    _clf = load_classifier(backend, model_path, lut_path)
+    _predict_batch = predict_batch
+
+
+def _read_frames(cap, count, flip):
+    """Đọc tối đa count frame (iterator, không giữ lại frame nào)"""
+    for _ in range(count):
+        ret, frame = cap.read()
+        if not ret:
+            return
+        yield cv2.flip(frame, 1) if flip else frame
+
+
+def analyze_shard(task):
+    """
+    Chạy FaceMesh + model + logic ngủ/ngáp/gật trên cả video (shard [0, end)).
+    Trả về mảng kết quả (n, len(FRAME_COLUMNS)).
+    adaptive=True: frame bị AdaptiveRateScheduler bỏ qua giữ nguyên kết quả frame trước (inferred=0),
+    khi đó mỗi lô chỉ 1 frame vì quyết định bỏ qua phụ thuộc kết quả frame trước.
+    """
+    video_path, start, end, fps, flip, adaptive, batch_size = task
+    t0 = time.perf_counter()
+    cap = cv2.VideoCapture(video_path)
+    if start > 0:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+
+    # Worker dùng chung detector cho nhiều shard / video: không bám theo landmark của shard trước
+    _detector.reset_tracking()
+    logic = DrowsinessLogic()
+    rows = []
+    idx = start
+    logic.reset(now=idx / fps)
+    scheduler = AdaptiveRateScheduler(full_rate=fps) if adaptive else None
+    if adaptive:
+        batch_size = 1
+    nan = float("nan")
+    row = None
+    while idx < end:
+        # Video ghi sẵn: dùng thời gian của video thay cho đồng hồ thật
+        if row is not None and scheduler is not None and not scheduler.should_infer(idx / fps):
+            ret = cap.grab()
+            if not ret:
+                break
+            rows.append([idx, idx / fps] + row[2:-1] + [0])
+            idx += 1
+            continue
+
+        batch = _detector.extract_batch(_read_frames(cap, min(batch_size, end - idx), flip))
+        if len(batch.mask) == 0:
+            break
+        preds, _ = _predict_batch(_clf, batch.features, batch.mask)
+        for features, nose, face, pred_raw in zip(batch.features, batch.noses, batch.mask, preds.tolist()):
+            now = idx / fps
+            if not face:
+                row = [idx, now, 0, nan, nan, nan, -1, -1, nan, 0, 0, 0.0, 0.0,
+                       logic.score_sleep, logic.score_yawn, logic.score_alert, 1]
+                if scheduler is not None:
+                    scheduler.observe(now, None)
+            else:
+                d = logic.update(features, nose, pred_raw, now)
+                row = [idx, now, 1, features[0], features[1], features[2], pred_raw, d.pred,
+                       nose[1], d.nods, int(d.is_warning), d.sleep_elapsed, d.yawn_elapsed,
+                       logic.score_sleep, logic.score_yawn, logic.score_alert, 1]
+                if scheduler is not None:
+                    scheduler.observe(now, features, d, logic.score_alert, logic.nod_logic.state)
+            rows.append(row)
+            idx += 1
+    cap.release()
+    out = np.array(rows, dtype=np.float64).reshape(-1, len(FRAME_COLUMNS))
+    return video_path, start, out, time.perf_counter() - t0
+
+
+def extract_shard(task):
+    """
+    Chỉ chạy FaceMesh + model trên đoạn [start, end) frame (video chia shard), các cột logic để 0.
+    Trạng thái ngủ / ngáp / gật đầu kéo dài qua nhiều shard (điểm cộng dồn, gật đầu chốt cảnh báo)
+    nên logic chạy nối tiếp cho cả video ở process cha (apply_logic), không dựng lại trong từng shard.
+    """
+    video_path, start, end, fps, flip, _, batch_size = task
+    t0 = time.perf_counter()
+    cap = cv2.VideoCapture(video_path)
+    if start > 0:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+
+    _detector.reset_tracking()
+    col = {name: i for i, name in enumerate(FRAME_COLUMNS)}
+    parts = []
+    idx = start
+    while idx < end:
+        batch = _detector.extract_batch(_read_frames(cap, min(batch_size, end - idx), flip))
+        n = len(batch.mask)
+        if n == 0:
+            break
+        preds, _ = _predict_batch(_clf, batch.features, batch.mask)
+        part = np.zeros((n, len(FRAME_COLUMNS)))
+        part[:, col["frame"]] = np.arange(idx, idx + n)
+        part[:, col["time"]] = part[:, col["frame"]] / fps
+        part[:, col["face"]] = batch.mask
+        part[:, col["LeftEAR"]:col["MAR"] + 1] = batch.features
+        part[:, col["pred_raw"]] = preds
+        part[:, col["nose_y"]] = np.where(batch.mask, batch.noses[:, 1], np.nan)
+        part[:, col["inferred"]] = 1
+        parts.append(part)
+        idx += n
+    cap.release()
+    out = np.concatenate(parts) if parts else np.empty((0, len(FRAME_COLUMNS)))
+    return video_path, start, out, time.perf_counter() - t0
+
+
+def apply_logic(frames):
+    """Điền các cột logic (pred, nods, is_warning, elapsed, điểm) cho cả video đã ghép từ các shard"""
+    col = {name: i for i, name in enumerate(FRAME_COLUMNS)}
+    face = frames[:, col["face"]] == 1
+    series = score_timeline(frames[:, col["time"]], frames[:, col["pred_raw"]], frames[:, col["MAR"]],
+                            frames[:, col["nose_y"]], face)
+    for name in SERIES:
+        frames[:, col[name]] = series[name]
+    frames[~face, col["pred"]] = -1
+    return frames
+
+
+# ================= CHIA VIỆC =================
+def find_videos(inputs):
+    videos = []
+    for path in inputs:
+        if os.path.isdir(path):
+            for fname in sorted(os.listdir(path)):
+                if fname.lower().endswith(VIDEO_EXTS):
+                    videos.append(os.path.join(path, fname))
+        elif os.path.exists(path):
+            videos.append(path)
+        else:
+            print(f"[BỎ QUA] Không tìm thấy: {path}")
+    return videos
+
+
+def probe_video(video_path):
+    cap = cv2.VideoCapture(video_path)
+    total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    fps = cap.get(cv2.CAP_PROP_FPS) or DEFAULT_FPS
+    cap.release()
+    return total, fps
+
+
+def make_shards(video_path, total, fps, segment_seconds, flip, adaptive=False, batch_size=BATCH_SIZE):
+    """
+    Chia 1 video thành các đoạn thời gian dài segment_seconds (0 = cả file).
+    Các shard chỉ chạy song song FaceMesh + model (extract_shard), logic chạy nối tiếp sau khi ghép.
+    """
+    if segment_seconds <= 0 or total <= 0:
+        return [(video_path, 0, total if total > 0 else 1 << 62, fps, flip, adaptive, batch_size)]
+    step = max(1, int(segment_seconds * fps))
+    return [(video_path, s, min(s + step, total), fps, flip, adaptive, batch_size)
+            for s in range(0, total, step)]
+
+
+# ================= TỔNG HỢP SỰ KIỆN =================
+def intervals(times, mask):
+    """Các đoạn liên tiếp mask=True -> [(t_start, t_end), ...]"""
+    if len(mask) == 0:
+        return []
+    m = np.concatenate([[False], mask.astype(bool), [False]])
+    edges = np.flatnonzero(m[1:] != m[:-1])
+    return [(float(times[a]), float(times[b - 1])) for a, b in zip(edges[::2], edges[1::2])]
+
+
+def summarize(video_path, frames, fps, elapsed):
+    col = {name: i for i, name in enumerate(FRAME_COLUMNS)}
+    t = frames[:, col["time"]]
+    face = frames[:, col["face"]] == 1
+    sleep_alarms = intervals(t, frames[:, col["is_warning"]] == 1)
+    yawns = intervals(t, frames[:, col["yawn_elapsed"]] > YAWN_TIME_THRESH)
+    nods = frames[:, col["nods"]]
+    duration = len(frames) / fps
+    return {
+        "video": video_path,
+        "frames": int(len(frames)),
+        "duration_s": duration,
+        "face_ratio": float(face.mean()) if len(frames) else 0.0,
+        "inferred_ratio": float(frames[:, col["inferred"]].mean()) if len(frames) else 0.0,
+        "sleep_frames": int((frames[:, col["pred"]] == 1).sum()),
+        "yawn_frames": int((frames[:, col["pred"]] == 2).sum()),
+        "max_nods": int(nods.max()) if len(frames) else 0,
+        "alarm_count": len(sleep_alarms),
+        "alarms": sleep_alarms,
+        "yawn_count": len(yawns),
+        "yawns": yawns,
+        "processing_s": elapsed,
+        "speed_x_realtime": duration / elapsed if elapsed > 0 else 0.0,
+    }
+
+
+def write_frames_csv(path, frames):
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(FRAME_COLUMNS)
+        for row in frames:
+            writer.writerow([int(v) if i in (0, 2, 6, 7, 9, 10, 16) else v for i, v in enumerate(row)])
+
+
+def run(videos, out_dir, workers, segment_seconds, flip=True, backend="pickle",
+        model_path=MODEL_PATH, lut_path=LUT_PATH, tracking=False, adaptive=False, batch_size=BATCH_SIZE):
+    os.makedirs(out_dir, exist_ok=True)
+    tasks, meta = [], {}
+    for video in videos:
+        total, fps = probe_video(video)
+        meta[video] = fps
+        tasks += make_shards(video, total, fps, segment_seconds, flip, adaptive, batch_size)
+    print(f"[INFO] {len(videos)} video -> {len(tasks)} shard, {workers} process")
+    sharded = segment_seconds > 0
+    if sharded and adaptive:
+        # Frame nào được bỏ qua phụ thuộc kết quả logic của frame trước -> không chia shard được
+        raise ValueError("--adaptive không dùng được với --segment-seconds > 0")
+    worker = extract_shard if sharded else analyze_shard
+
+    results = {video: [] for video in videos}
+    cpu_time = {video: 0.0 for video in videos}
+    t0 = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(backend, model_path, lut_path, tracking)) as pool:
+        futures = [pool.submit(worker, task) for task in tasks]
+        for fut in as_completed(futures):
+            video, start, frames, elapsed = fut.result()
+            results[video].append((start, frames))
+            cpu_time[video] += elapsed
+            print(f"    -> {os.path.basename(video)} @frame {start}: {len(frames)} frames ({elapsed:.1f}s)")
+    wall = time.perf_counter() - t0
+
+    summaries = []
+    for video in videos:
+        parts = [frames for _, frames in sorted(results[video], key=lambda r: r[0])]
+        frames = np.concatenate(parts) if parts else np.empty((0, len(FRAME_COLUMNS)))
+        if sharded:
+            t_logic = time.perf_counter()
+            apply_logic(frames)
+            cpu_time[video] += time.perf_counter() - t_logic
+        base = os.path.splitext(os.path.basename(video))[0]
+        write_frames_csv(os.path.join(out_dir, f"{base}_frames.csv"), frames)
+        summary = summarize(video, frames, meta[video], cpu_time[video])
+        with open(os.path.join(out_dir, f"{base}_events.json"), "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+        summaries.append(summary)
+
+    total_duration = sum(s["duration_s"] for s in summaries)
+    report = {"videos": summaries, "wall_s": wall, "footage_s": total_duration,
+              "speed_x_realtime": total_duration / wall if wall > 0 else 0.0}
+    with open(os.path.join(out_dir, "summary.json"), "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"✅ HOÀN TẤT: {total_duration:.0f}s video trong {wall:.1f}s (x{report['speed_x_realtime']:.1f} realtime)")
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Phân tích buồn ngủ offline trên video (không cần GUI)")
+    parser.add_argument("inputs", nargs="+", help="file video hoặc thư mục chứa video")
+    parser.add_argument("--out", default="analysis_output")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--segment-seconds", type=float, default=0,
+                        help="chia video dài thành các đoạn (giây) để chạy FaceMesh + model song song, "
+                             "logic vẫn chạy nối tiếp cho cả video; 0 = cả file")
+    parser.add_argument("--backend", default="pickle", choices=["pickle", "lut", "native"])
+    parser.add_argument("--no-flip", action="store_true", help="không lật ảnh như camera trong GUI")
+    parser.add_argument("--tracking", action="store_true", help="FaceMesh chạy trên ROI vùng mặt")
+    parser.add_argument("--adaptive", action="store_true",
+                        help="giảm tần số suy luận khi tỉnh táo ổn định (AdaptiveRateScheduler)")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE,
+                        help="số frame mỗi lô trích xuất + predict (1 = từng frame như trước)")
+    args = parser.parse_args()
+    if args.adaptive and args.segment_seconds > 0:
+        parser.error("--adaptive cần chạy cả file (--segment-seconds 0)")
+
+    run(find_videos(args.inputs), args.out, args.workers, args.segment_seconds,
+        flip=not args.no_flip, backend=args.backend, tracking=args.tracking, adaptive=args.adaptive,
+        batch_size=args.batch_size)
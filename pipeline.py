@@ -0,0 +1,324 @@
+import threading
+import time
+import cv2
+import numpy as np
+from collections import deque
+from clock import SYSTEM_CLOCK
+
+# --- CẤU HÌNH ---
+FRAME_POOL_SPARE = 1          # buffer dư ngoài số frame có thể đang nằm ở các stage
+
+
+# ================= HÀNG ĐỢI "FRAME MỚI NHẤT THẮNG" =================
+class LatestQueue:
+    """
+    Hàng đợi có giới hạn: khi đầy thì bỏ phần tử cũ nhất để nhận phần tử mới.
+    Ghi lại số phần tử bị bỏ (dropped) để biết stage nào đang chậm.
+    on_drop(item): gọi với phần tử bị bỏ (vd. trả buffer frame về FramePool).
+    """
+    def __init__(self, name, maxsize=1, on_drop=None):
+        self.name = name
+        self.maxsize = maxsize
+        self.on_drop = on_drop
+        self._items = deque(maxlen=maxsize)
+        self._cond = threading.Condition()
+        self._closed = False
+        self.put_count = 0
+        self.dropped = 0
+
+    def put(self, item):
+        dropped = None
+        with self._cond:
+            if len(self._items) == self.maxsize:
+                self.dropped += 1
+                dropped = self._items[0]
+            self._items.append(item)
+            self.put_count += 1
+            self._cond.notify()
+        if dropped is not None and self.on_drop is not None:
+            self.on_drop(dropped)
+
+    def get(self, timeout=None):
+        """Chờ tới khi có phần tử (hoặc hết timeout / đã đóng) -> None"""
+        with self._cond:
+            if not self._items and not self._closed:
+                self._cond.wait(timeout)
+            return self._items.popleft() if self._items else None
+
+    def get_nowait(self):
+        with self._cond:
+            return self._items.popleft() if self._items else None
+
+    def depth(self):
+        return len(self._items)
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def stats(self):
+        return {"depth": self.depth(), "put": self.put_count, "dropped": self.dropped}
+
+
+# ================= BUFFER FRAME DÙNG LẠI =================
+class FramePool:
+    """
+    Buffer frame cấp phát 1 lần theo độ phân giải camera thực sự trả về (frame đầu tiên),
+    cap.read(buf) ghi thẳng vào buffer nên vòng lặp ổn định không cấp phát ảnh mới.
+    Mỗi frame phải được release() đúng 1 lần (queue bỏ frame hoặc GUI hiển thị xong).
+    """
+    def __init__(self, size):
+        self.size = size
+        self.shape = None
+        self._free = deque()
+        self._lock = threading.Lock()
+        self.allocated = 0
+        self.misses = 0            # lần capture không còn buffer trống (frame bị bỏ)
+
+    def configure(self, shape):
+        """Cấp phát lại khi độ phân giải đổi; buffer cũ trả về sau đó bị bỏ"""
+        with self._lock:
+            if shape == self.shape:
+                return
+            self.shape = shape
+            self._free = deque(np.empty(shape, dtype=np.uint8) for _ in range(self.size))
+            self.allocated += self.size
+
+    def acquire(self):
+        with self._lock:
+            if self._free:
+                return self._free.popleft()
+            self.misses += 1
+            return None
+
+    def release(self, frame):
+        if frame is None:
+            return
+        with self._lock:
+            if (frame.shape == self.shape and len(self._free) < self.size
+                    and not any(f is frame for f in self._free)):
+                self._free.append(frame)
+
+    def stats(self):
+        return {"size": self.size, "free": len(self._free), "allocated": self.allocated, "misses": self.misses}
+
+
+class FramePacket:
+    """Frame kèm số thứ tự và thời điểm chụp"""
+    __slots__ = ("index", "t_capture", "frame")
+
+    def __init__(self, index, t_capture, frame):
+        self.index = index
+        self.t_capture = t_capture
+        self.frame = frame
+
+
+class ResultPacket:
+    """Kết quả suy luận của một frame (inferred=False: frame bị scheduler bỏ qua, giữ kết quả cũ)"""
+    __slots__ = ("index", "t_capture", "t_done", "frame", "features", "bbox", "nose", "pred", "inferred")
+
+    def __init__(self, packet, t_done, features, bbox, nose, pred, inferred=True):
+        self.index = packet.index
+        self.t_capture = packet.t_capture
+        self.t_done = t_done
+        self.frame = packet.frame
+        self.features = features
+        self.bbox = bbox
+        self.nose = nose
+        self.pred = pred
+        self.inferred = inferred
+
+
+# ================= STAGE 1: ĐỌC CAMERA =================
+class CaptureThread(threading.Thread):
+    """
+    Đọc camera liên tục ở tốc độ tối đa, lật ảnh và đẩy vào frame_queue (t_capture lấy từ clock).
+    pool (FramePool): đọc vào buffer có sẵn thay vì cấp phát frame mới mỗi lần.
+    """
+    def __init__(self, cap, out_queue, flip=True, clock=None, pool=None):
+        super().__init__(name="capture", daemon=True)
+        self.cap = cap
+        self.clock = clock or SYSTEM_CLOCK
+        self.out_queue = out_queue
+        self.flip = flip
+        self.pool = pool
+        self.stop_event = threading.Event()
+        self.frames = 0
+        self.read_failures = 0
+
+    def _read(self):
+        pool = self.pool
+        if pool is None:
+            return self.cap.read()
+        if pool.shape is None:
+            # Frame đầu: độ phân giải camera thực sự trả về
+            ret, frame = self.cap.read()
+            if ret:
+                pool.configure(frame.shape)
+            return ret, frame
+        buf = pool.acquire()
+        if buf is None:
+            # GUI / inference đang giữ hết buffer: bỏ frame này
+            self.cap.grab()
+            return None, None
+        ret, frame = self.cap.read(buf)
+        if not ret or frame is not buf:
+            pool.release(buf)
+            if ret:
+                pool.configure(frame.shape)    # camera đổi độ phân giải
+        return ret, frame
+
+    def run(self):
+        while not self.stop_event.is_set():
+            ret, frame = self._read()
+            if ret is None:
+                continue
+            if not ret:
+                self.read_failures += 1
+                time.sleep(0.01)
+                continue
+            t_capture = self.clock.time()
+            if self.flip:
+                frame = cv2.flip(frame, 1, dst=frame)   # lật tại chỗ, không cấp phát frame mới
+            self.out_queue.put(FramePacket(self.frames, t_capture, frame))
+            self.frames += 1
+
+
+# ================= STAGE 2: SUY LUẬN =================
+class InferenceWorker(threading.Thread):
+    """
+    Lấy frame mới nhất, gọi infer_fn(frame) -> (features, bbox, nose, pred)
+    và đẩy kết quả vào result_queue. Chạy theo tốc độ riêng của FaceMesh.
+    Nếu có scheduler, frame bị bỏ qua vẫn được đẩy đi kèm kết quả suy luận gần nhất.
+    """
+    def __init__(self, infer_fn, in_queue, out_queue, scheduler=None):
+        super().__init__(name="inference", daemon=True)
+        self.infer_fn = infer_fn
+        self.in_queue = in_queue
+        self.out_queue = out_queue
+        self.scheduler = scheduler
+        self.stop_event = threading.Event()
+        self.frames = 0
+        self.skipped = 0
+        self.busy_seconds = 0.0
+        self._last = (None, None, None, None)
+
+    def run(self):
+        while not self.stop_event.is_set():
+            packet = self.in_queue.get(timeout=0.1)
+            if packet is None:
+                continue
+            if self.scheduler is not None and not self.scheduler.should_infer(packet.t_capture):
+                self.out_queue.put(ResultPacket(packet, time.time(), *self._last, inferred=False))
+                self.skipped += 1
+                continue
+            t0 = time.perf_counter()
+            self._last = self.infer_fn(packet.frame)
+            self.busy_seconds += time.perf_counter() - t0
+            self.out_queue.put(ResultPacket(packet, time.time(), *self._last))
+            self.frames += 1
+
+
+# ================= ĐIỀU PHỐI PIPELINE =================
+class FramePipeline:
+    """
+    Capture thread -> frame_queue -> inference worker -> result_queue -> GUI.
+    GUI chỉ cần gọi latest_result() trên timer và vẽ kết quả mới nhất.
+    reuse_frames=True: frame nằm trong FramePool, GUI phải gọi release(result) sau khi hiển thị.
+    """
+    def __init__(self, infer_fn, frame_queue_size=1, result_queue_size=1, scheduler=None, clock=None,
+                 reuse_frames=False):
+        self.infer_fn = infer_fn
+        self.clock = clock or SYSTEM_CLOCK
+        self.scheduler = scheduler
+        # Frame có thể nằm ở: capture, frame_queue, inference, result_queue, GUI
+        self.pool = FramePool(frame_queue_size + result_queue_size + 3 + FRAME_POOL_SPARE) if reuse_frames else None
+        on_drop = (lambda packet: self.pool.release(packet.frame)) if reuse_frames else None
+        self.frame_queue = LatestQueue("frame_queue", frame_queue_size, on_drop)
+        self.result_queue = LatestQueue("result_queue", result_queue_size, on_drop)
+        self.capture = None
+        self.worker = None
+        self.displayed = 0
+        self.last_latency = 0.0
+        self.start_time = None
+
+    def start(self, cap, flip=True):
+        self.capture = CaptureThread(cap, self.frame_queue, flip=flip, clock=self.clock, pool=self.pool)
+        self.worker = InferenceWorker(self.infer_fn, self.frame_queue, self.result_queue,
+                                      scheduler=self.scheduler)
+        self.start_time = time.time()
+        self.capture.start()
+        self.worker.start()
+
+    def stop(self):
+        """Dừng các thread; sau hàm này mới được release camera"""
+        for stage in (self.capture, self.worker):
+            if stage is not None:
+                stage.stop_event.set()
+        self.frame_queue.close()
+        self.result_queue.close()
+        for stage in (self.capture, self.worker):
+            if stage is not None:
+                stage.join(timeout=2.0)
+
+    def latest_result(self):
+        """Lấy kết quả mới nhất cho GUI (None nếu chưa có kết quả mới)"""
+        result = self.result_queue.get_nowait()
+        if result is not None:
+            self.displayed += 1
+            self.last_latency = self.clock.time() - result.t_capture
+        return result
+
+    def release(self, result):
+        """Trả buffer frame của kết quả đã hiển thị về pool (không làm gì khi reuse_frames=False)"""
+        if self.pool is not None:
+            self.pool.release(result.frame)
+
+    def stats(self):
+        elapsed = max(time.time() - self.start_time, 1e-6) if self.start_time else 1e-6
+        captured = self.capture.frames if self.capture else 0
+        inferred = self.worker.frames if self.worker else 0
+        stats = {
+            "capture": {
+                "frames": captured,
+                "fps": captured / elapsed,
+                "read_failures": self.capture.read_failures if self.capture else 0,
+            },
+            "frame_queue": self.frame_queue.stats(),
+            "inference": {
+                "frames": inferred,
+                "fps": inferred / elapsed,
+                "avg_ms": 1000 * self.worker.busy_seconds / inferred if inferred else 0.0,
+                "skipped": self.worker.skipped if self.worker else 0,
+            },
+            "result_queue": self.result_queue.stats(),
+            "display": {
+                "frames": self.displayed,
+                "fps": self.displayed / elapsed,
+                "latency_ms": 1000 * self.last_latency,
+            },
+        }
+        if self.scheduler is not None:
+            stats["scheduler"] = self.scheduler.stats()
+        if self.pool is not None:
+            stats["frame_pool"] = self.pool.stats()
+        return stats
+
+    def format_stats(self):
+        s = self.stats()
+        text = (
+            f"[PIPELINE] capture {s['capture']['fps']:.1f} fps | "
+            f"frame_q depth={s['frame_queue']['depth']} dropped={s['frame_queue']['dropped']} | "
+            f"infer {s['inference']['fps']:.1f} fps ({s['inference']['avg_ms']:.1f} ms) | "
+            f"result_q depth={s['result_queue']['depth']} dropped={s['result_queue']['dropped']} | "
+            f"display {s['display']['fps']:.1f} fps (latency {s['display']['latency_ms']:.0f} ms)"
+        )
+        if "scheduler" in s:
+            sch = s["scheduler"]
+            text += (f" | scheduler {sch['mode']} {sch['rate_hz']:.0f} Hz "
+                     f"skipped={s['inference']['skipped']} ({sch['reason']})")
+        if "frame_pool" in s:
+            pool = s["frame_pool"]
+            text += f" | frame_pool free={pool['free']}/{pool['size']} misses={pool['misses']}"
+        return text
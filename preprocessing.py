@@ -0,0 +1,92 @@
+import cv2
+import numpy as np
+
+# --- CẤU HÌNH ---
+CLAHE_CLIP_LIMIT = 2.0        # ngưỡng tương phản (cao quá sẽ bị nhiễu hạt)
+CLAHE_TILE_GRID = (8, 8)      # chia ảnh thành lưới 8x8 để xử lý từng ô
+ROI_PADDING = 0.35            # nới bbox mỗi phía khi chỉ làm rõ vùng mặt
+ROI_MIN_SIZE = 32
+
+# Ma trận làm nét cơ bản
+SHARPEN_KERNEL = np.array([[0, -1, 0],
+                           [-1, 5, -1],
+                           [0, -1, 0]], dtype=np.float32)
+
+
+# ================= TIỀN XỬ LÝ: CLAHE + LÀM NÉT =================
+class Preprocessor:
+    """
+    Làm rõ ảnh trước khi đưa vào FaceMesh (giống lúc tạo dataset trong gom_file.py):
+    CLAHE trên kênh sáng L của LAB rồi làm nét bằng filter2D.
+    Giữ sẵn đối tượng CLAHE và 1 bộ buffer theo kích thước lớn nhất từng gặp (ROI đổi kích thước
+    gần như mỗi frame -> dùng view [:h, :w] trên cùng buffer), không cấp phát lại mỗi frame.
+    roi=True: chỉ làm rõ vùng mặt quanh bbox của frame trước (nhẹ hơn nhiều với frame lớn).
+    Kết quả nằm trong buffer nội bộ, chỉ dùng được tới lần gọi apply() tiếp theo.
+    """
+    def __init__(self, clip_limit=CLAHE_CLIP_LIMIT, tile_grid=CLAHE_TILE_GRID, roi=False, roi_padding=ROI_PADDING):
+        self.clip_limit = clip_limit
+        self.tile_grid = tuple(tile_grid)
+        self.roi = roi
+        self.roi_padding = roi_padding
+        self.clahe = cv2.createCLAHE(clipLimit=clip_limit, tileGridSize=self.tile_grid)
+        self._buffers = None
+        self._out = None
+        self.roi_used = False          # lần gọi gần nhất có chỉ xử lý vùng mặt hay không
+
+    def describe(self):
+        return f"clahe({self.clip_limit}, {self.tile_grid[0]}x{self.tile_grid[1]}) + sharpen"
+
+    def _bufs(self, shape):
+        """View [:h, :w] của buffer LAB / kênh L / BGR; chỉ cấp phát lại khi ảnh lớn hơn mọi lần trước"""
+        h, w = shape
+        h_max, w_max = self._buffers[0].shape[:2] if self._buffers is not None else (0, 0)
+        if h > h_max or w > w_max:
+            h_max, w_max = max(h, h_max), max(w, w_max)
+            self._buffers = (np.empty((h_max, w_max, 3), np.uint8), np.empty((h_max, w_max), np.uint8),
+                             np.empty((h_max, w_max), np.uint8), np.empty((h_max, w_max, 3), np.uint8))
+        return tuple(buf[:h, :w] for buf in self._buffers)
+
+    def _enhance(self, image, dst):
+        """CLAHE trên kênh L + làm nét: image (BGR) -> dst, cùng kích thước"""
+        lab, l, cl, bgr = self._bufs(image.shape[:2])
+        cv2.cvtColor(image, cv2.COLOR_BGR2LAB, dst=lab)
+        cv2.extractChannel(lab, 0, dst=l)
+        self.clahe.apply(l, dst=cl)
+        cv2.insertChannel(cl, lab, 0)
+        cv2.cvtColor(lab, cv2.COLOR_LAB2BGR, dst=bgr)
+        cv2.filter2D(bgr, -1, SHARPEN_KERNEL, dst=dst)
+        return dst
+
+    def roi_window(self, bbox, w, h):
+        """Vùng (x0, y0, x1, y1) quanh bbox đã nới roi_padding, nằm gọn trong ảnh; None nếu quá nhỏ"""
+        x_min, y_min, x_max, y_max = bbox
+        pad_x = (x_max - x_min) * self.roi_padding
+        pad_y = (y_max - y_min) * self.roi_padding
+        x0, y0 = max(int(x_min - pad_x), 0), max(int(y_min - pad_y), 0)
+        x1, y1 = min(int(x_max + pad_x), w), min(int(y_max + pad_y), h)
+        if x1 - x0 < ROI_MIN_SIZE or y1 - y0 < ROI_MIN_SIZE:
+            return None
+        return x0, y0, x1, y1
+
+    def apply(self, image, bbox=None):
+        """
+        Làm rõ cả frame, hoặc (roi=True và có bbox (x_min, y_min, x_max, y_max) của frame trước)
+        chỉ vùng mặt, phần còn lại giữ nguyên ảnh gốc. Ảnh gốc không bị sửa.
+        """
+        h, w = image.shape[:2]
+        if self._out is None or self._out.shape != image.shape:
+            self._out = np.empty_like(image)
+        window = self.roi_window(bbox, w, h) if self.roi and bbox is not None else None
+        self.roi_used = window is not None
+        if window is None:
+            return self._enhance(image, self._out)
+
+        x0, y0, x1, y1 = window
+        np.copyto(self._out, image)
+        self._enhance(image[y0:y1, x0:x1], self._out[y0:y1, x0:x1])
+        return self._out
+
+
+def preprocess_image(image):
+    """Bản 1 lần gọi (trả về mảng mới), kết quả giống Preprocessor().apply(image)"""
+    return Preprocessor().apply(image).copy()
@@ -0,0 +1,223 @@
+import os
+import csv
+import json
+import time
+import argparse
+import numpy as np
+
+from clock import ManualClock
+from detection_logic import AlarmLatch
+from engine import DrowsinessEngine, FATIGUE_WARN_PERCENT
+
+# --- CẤU HÌNH ---
+current_dir = os.path.dirname(os.path.abspath(__file__))
+MODEL_PATH = os.path.join(current_dir, "drowsiness_ensemble.pkl")
+LUT_PATH = os.path.join(current_dir, "drowsiness_lut.npz")
+DEFAULT_FPS = 30.0
+BATCH_SIZE = 64
+TIME_TOLERANCE = 1e-6         # giây, khi so sự kiện với file --expect
+
+
+# ================= TIMELINE: (t, features, nose_y, pred_raw, face) =================
+class Timeline:
+    """Chuỗi frame đã trích xuất: thời gian (giây), [LeftEAR, RightEAR, MAR], nose_y, nhãn model, có mặt hay không"""
+    def __init__(self, t, features, nose_y, pred_raw, face, source=""):
+        self.t = np.asarray(t, dtype=np.float64)
+        self.features = np.asarray(features, dtype=np.float64).reshape(-1, 3)
+        self.nose_y = np.asarray(nose_y, dtype=np.float64)
+        self.pred_raw = np.asarray(pred_raw, dtype=np.int64)
+        self.face = np.asarray(face, dtype=bool)
+        self.source = source
+
+    def __len__(self):
+        return len(self.t)
+
+
+def timeline_from_frames_csv(path):
+    """*_frames.csv của offline_analysis.py"""
+    with open(path, newline="") as f:
+        rows = list(csv.DictReader(f))
+    col = lambda name, dtype=float: np.array([dtype(float(r[name])) for r in rows])
+    return Timeline(col("time"), np.stack([col("LeftEAR"), col("RightEAR"), col("MAR")], axis=1).reshape(-1, 3),
+                    col("nose_y"), col("pred_raw", int), col("face", int) == 1, path)
+
+
+def timeline_from_telemetry(path):
+    """File .tlog của telemetry_log.py (thời gian là time.time() lúc ghi)"""
+    from telemetry_log import read_records
+    r = read_records(path)
+    features = np.stack([r["left_ear"], r["right_ear"], r["mar"]], axis=1).astype(np.float64)
+    return Timeline(r["t"], features, r["nose_y"], r["pred_raw"], r["pred_raw"] >= 0, path)
+
+
+def timeline_from_video(path, clf, flip=True, tracking=False, batch_size=BATCH_SIZE):
+    """FaceMesh + model theo lô trên video, thời gian = số frame / fps của video"""
+    import cv2
+    from face_utils import FaceMeshDetector
+    from model_loader import predict_batch
+
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        raise SystemExit(f"Không mở được video: {path}")
+    fps = cap.get(cv2.CAP_PROP_FPS) or DEFAULT_FPS
+    detector = FaceMeshDetector(tracking=tracking)
+
+    def frames():
+        for _ in range(batch_size):
+            ret, frame = cap.read()
+            if not ret:
+                return
+            yield cv2.flip(frame, 1) if flip else frame
+
+    parts = []
+    while True:
+        batch = detector.extract_batch(frames())
+        if len(batch.mask) == 0:
+            break
+        preds, _ = predict_batch(clf, batch.features, batch.mask)
+        parts.append((batch.features, batch.noses[:, 1].astype(np.float64), preds, batch.mask))
+    cap.release()
+    if not parts:
+        return Timeline([], np.empty((0, 3)), [], [], [], path)
+    features, nose_y, preds, face = (np.concatenate(p) for p in zip(*parts))
+    return Timeline(np.arange(len(face)) / fps, features, nose_y, preds, face, path)
+
+
+def load_timeline(path, clf=None, flip=True, tracking=False):
+    if path.endswith(".csv"):
+        return timeline_from_frames_csv(path)
+    if path.endswith(".tlog"):
+        return timeline_from_telemetry(path)
+    return timeline_from_video(path, clf, flip=flip, tracking=tracking)
+
+
+# ================= REPLAY =================
+def replay(timeline, clf=None, drive_seconds=0):
+    """
+    Chạy lại logic giống update_frame của GUI (engine.step + AlarmLatch + cảnh báo fatigue)
+    với đồng hồ = timestamp của frame, không chờ thời gian thật.
+    clf: dự đoán lại nhãn từ features (vd. thử model mới) thay cho pred_raw đã lưu.
+    """
+    preds = timeline.pred_raw
+    if clf is not None and len(timeline):
+        from model_loader import predict_batch
+        preds, _ = predict_batch(clf, timeline.features, timeline.face)
+
+    t0 = float(timeline.t[0]) if len(timeline) else 0.0
+    clock = ManualClock(t0)
+    engine = DrowsinessEngine(None, None, clock=clock)
+    engine.reset()
+    alarm = AlarmLatch(clock=clock)
+    fatigue_warned = False
+    events = []
+    alarm_start = None
+    alarm_seconds = 0.0
+
+    for t, features, nose_y, pred, face in zip(timeline.t.tolist(), timeline.features, timeline.nose_y.tolist(),
+                                              preds.tolist(), timeline.face.tolist()):
+        clock.set(t)
+        if face:
+            decision = engine.step(features, (0, nose_y), pred)
+            event = alarm.update(decision.is_warning)
+            if event == "start":
+                alarm_start = t
+                events.append({"t": t, "event": "alarm_start", "status": decision.status_text})
+            elif event == "stop":
+                alarm_seconds += t - alarm_start
+                events.append({"t": t, "event": "alarm_stop", "status": decision.status_text})
+
+        # GUI tính fatigue mỗi frame, thời gian lái cập nhật theo giây
+        fatigue = engine.calculate_fatigue(drive_seconds + int(t - t0))
+        if fatigue > FATIGUE_WARN_PERCENT:
+            if not fatigue_warned:
+                fatigue_warned = True
+                events.append({"t": t, "event": "fatigue_warning", "status": f"{fatigue:.0f}%"})
+        else:
+            fatigue_warned = False
+
+    if alarm.playing:
+        alarm_seconds += float(timeline.t[-1]) - alarm_start
+    duration = float(timeline.t[-1] - t0) if len(timeline) else 0.0
+    return {
+        "source": timeline.source,
+        "frames": int(len(timeline)),
+        "face_frames": int(timeline.face.sum()),
+        "duration_s": duration,
+        "alarm_count": sum(e["event"] == "alarm_start" for e in events),
+        "alarm_seconds": alarm_seconds,
+        "fatigue_warnings": sum(e["event"] == "fatigue_warning" for e in events),
+        "day_total": engine.day_total,
+        "day_sleep": engine.day_sleep,
+        "day_yawn": engine.day_yawn,
+        "events": events,
+    }
+
+
+def compare_events(events, expected, tolerance=TIME_TOLERANCE):
+    """So 2 danh sách sự kiện -> list mô tả khác biệt (rỗng = giống)"""
+    diffs = []
+    for i in range(max(len(events), len(expected))):
+        got = events[i] if i < len(events) else None
+        exp = expected[i] if i < len(expected) else None
+        if got is None or exp is None or got["event"] != exp["event"] or abs(got["t"] - exp["t"]) > tolerance:
+            diffs.append(f"#{i}: nhận {got}, cần {exp}")
+    return diffs
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Replay video / *_frames.csv / .tlog qua toàn bộ logic quyết định, nhanh hơn thời gian thật")
+    parser.add_argument("inputs", nargs="+", help="video, *_frames.csv (offline_analysis.py) hoặc .tlog (telemetry)")
+    parser.add_argument("--backend", default="pickle", choices=["pickle", "lut", "native"])
+    parser.add_argument("--repredict", action="store_true", help="dự đoán lại nhãn của CSV / .tlog bằng model")
+    parser.add_argument("--no-flip", action="store_true", help="không lật ảnh như camera trong GUI")
+    parser.add_argument("--tracking", action="store_true", help="FaceMesh chạy trên ROI vùng mặt")
+    parser.add_argument("--drive-seconds", type=int, default=0, help="thời gian lái đã có trước khi replay")
+    parser.add_argument("--json", help="ghi báo cáo ra file JSON")
+    parser.add_argument("--expect", help="JSON báo cáo cũ: khác sự kiện thì thoát với mã 1 (kiểm thử hồi quy)")
+    parser.add_argument("--tolerance", type=float, default=TIME_TOLERANCE)
+    args = parser.parse_args()
+
+    clf = None
+    if args.repredict or any(not p.endswith((".csv", ".tlog")) for p in args.inputs):
+        import warnings
+        from model_loader import load_classifier
+        warnings.filterwarnings("ignore", message="X does not have valid feature names")
+        clf = load_classifier(args.backend, MODEL_PATH, LUT_PATH)
+
+    reports = []
+    t_wall = time.perf_counter()
+    for path in args.inputs:
+        t0 = time.perf_counter()
+        timeline = load_timeline(path, clf, flip=not args.no_flip, tracking=args.tracking)
+        t_load = time.perf_counter() - t0
+        report = replay(timeline, clf if args.repredict else None, args.drive_seconds)
+        elapsed = time.perf_counter() - t0
+        report["load_s"], report["replay_s"] = t_load, elapsed - t_load
+        reports.append(report)
+        speed = report["duration_s"] / elapsed if elapsed > 0 else 0.0
+        print(f"-> {os.path.basename(path)}: {report['frames']} frames ({report['duration_s']:.0f}s) trong {elapsed:.2f}s "
+              f"(x{speed:.0f} realtime, logic {report['replay_s'] * 1000:.0f} ms) | "
+              f"{report['alarm_count']} báo động ({report['alarm_seconds']:.1f}s), {report['fatigue_warnings']} cảnh báo fatigue")
+        for e in report["events"]:
+            print(f"    t={e['t']:>10.2f}  {e['event']:<16}{e['status']}")
+
+    result = {"reports": reports, "wall_s": time.perf_counter() - t_wall}
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+
+    if args.expect:
+        with open(args.expect, encoding="utf-8") as f:
+            expected = {r["source"]: r["events"] for r in json.load(f)["reports"]}
+        failed = False
+        for report in reports:
+            if report["source"] not in expected:
+                diffs = ["không có trong file mong đợi"]
+            else:
+                diffs = compare_events(report["events"], expected[report["source"]], args.tolerance)
+            for d in diffs:
+                print(f"[KHÁC] {os.path.basename(report['source'])} {d}")
+            failed |= bool(diffs)
+        print("❌ Sự kiện khác với file mong đợi" if failed else "✅ Sự kiện giống file mong đợi")
+        raise SystemExit(1 if failed else 0)
@@ -0,0 +1,169 @@
+import time
+import json
+import argparse
+import threading
+from contextlib import contextmanager
+
+# --- CẤU HÌNH ---
+STARTUP_BUDGET_S = 4.0              # từ lúc chạy tới lúc sẵn sàng giám sát (đã warm-up)
+WARMUP_FRAME_SHAPE = (480, 640, 3)  # cùng kích thước frame camera mặc định
+WARMUP_REPEATS = 2
+WARMUP_FEATURES = [0.3, 0.3, 0.1]   # mắt mở, miệng khép
+
+
+# ================= ĐO THỜI GIAN KHỞI ĐỘNG =================
+class StartupProfiler:
+    """
+    Ghi thời gian từng giai đoạn khởi động (import, load model, FaceMesh, audio, warm-up...).
+    lap(): giai đoạn trên thread chính, tính từ mốc trước; phase(): khối code bất kỳ, thread nào cũng được.
+    """
+    def __init__(self, t0=None):
+        self.t0 = time.perf_counter() if t0 is None else t0
+        self._last = self.t0
+        self._lock = threading.Lock()
+        self.phases = []          # (tên, thread, bắt đầu, thời gian) tính bằng giây từ t0
+        self.t_ready = None
+
+    def _add(self, name, start, seconds):
+        with self._lock:
+            self.phases.append((name, threading.current_thread().name, start - self.t0, seconds))
+
+    def lap(self, name):
+        now = time.perf_counter()
+        self._add(name, self._last, now - self._last)
+        self._last = now
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._add(name, start, time.perf_counter() - start)
+
+    def ready(self):
+        """Đánh dấu lúc app sẵn sàng giám sát"""
+        self.t_ready = time.perf_counter() - self.t0
+        return self.t_ready
+
+    def to_dict(self, budget=STARTUP_BUDGET_S):
+        return {
+            "phases": [{"name": n, "thread": th, "start_s": s, "seconds": d} for n, th, s, d in self.phases],
+            "ready_s": self.t_ready,
+            "budget_s": budget,
+            "within_budget": self.t_ready is not None and self.t_ready <= budget,
+        }
+
+    def report(self, budget=STARTUP_BUDGET_S):
+        lines = [f"{'giai đoạn':<18}{'thread':<16}{'bắt đầu':>9}{'thời gian':>11}"]
+        for name, thread, start, seconds in self.phases:
+            lines.append(f"{name:<18}{thread[:15]:<16}{start * 1000:>7.0f}ms{seconds * 1000:>9.0f}ms")
+        if self.t_ready is not None:
+            mark = "" if self.t_ready <= budget else "  ⚠️ VƯỢT NGÂN SÁCH"
+            lines.append(f"-> sẵn sàng sau {self.t_ready:.2f}s (ngân sách {budget:.1f}s){mark}")
+        return "\n".join(lines)
+
+
+# ================= LOAD PHẦN NẶNG =================
+class Runtime:
+    """Các thành phần nặng, tạo trên thread nền: model, FaceMesh detector, service âm thanh"""
+    def __init__(self):
+        self.clf = None
+        self.detector = None
+        self.audio = None           # alarm_service.AlarmService
+        self.errors = []
+
+
+def load_runtime(profiler, backend, model_path, lut_path, tracking=False, sound_paths=None, warmup=True,
+                 preprocessor=None, audio_backend="pygame", clock=None, metrics=None, motion_gate=False):
+    """
+    Import + load model, tạo FaceMeshDetector, chạy service âm thanh (load sẵn chuông / bíp) rồi warm-up.
+    Lỗi của từng phần được ghi vào runtime.errors, không làm hỏng các phần còn lại.
+    """
+    runtime = Runtime()
+
+    with profiler.phase("model_load"):
+        try:
+            from model_loader import load_classifier
+            runtime.clf = load_classifier(backend, model_path, lut_path)
+        except Exception as e:
+            runtime.errors.append(f"model: {e}")
+
+    with profiler.phase("detector_init"):
+        from face_utils import FaceMeshDetector
+        runtime.detector = FaceMeshDetector(tracking=tracking, motion_gate=motion_gate)
+
+    if sound_paths is not None:
+        with profiler.phase("audio_init"):
+            from alarm_service import AlarmService, SOUND_ALARM, SOUND_WARN
+            alarm_path, warn_path = sound_paths
+            runtime.audio = AlarmService({SOUND_ALARM: alarm_path, SOUND_WARN: warn_path}, audio_backend,
+                                         clock=clock, metrics=metrics)
+            runtime.audio.start()
+            if not runtime.audio.wait_ready():
+                runtime.errors.append("audio: chưa sẵn sàng, chuông có thể kêu trễ")
+            runtime.errors.extend(runtime.audio.errors)
+
+    if warmup:
+        with profiler.phase("warmup"):
+            warm_up(runtime.detector, runtime.clf, preprocessor=preprocessor)
+    return runtime
+
+
+def warm_up(detector, clf, frame_shape=WARMUP_FRAME_SHAPE, repeats=WARMUP_REPEATS, preprocessor=None):
+    """
+    Chạy FaceMesh trên frame giả và predict 1 mẫu giả để khởi tạo graph MediaPipe
+    và các lần gọi đầu của model trước khi frame thật tới. Không để lại trạng thái tracking.
+    Có preprocessor (chế độ lái đêm) thì chạy cả nó: lần gọi CLAHE đầu tiên mất ~200 ms.
+    """
+    import numpy as np
+    frame = np.zeros(frame_shape, dtype=np.uint8)
+    if preprocessor is not None:
+        preprocessor.apply(frame)
+    for _ in range(repeats):
+        detector.extract_features(frame)
+        if clf is not None:
+            clf.predict([WARMUP_FEATURES])
+    detector.reset_tracking()
+
+
+if __name__ == "__main__":
+    profiler = StartupProfiler()
+    import os
+    import warnings
+    import numpy as np
+    import cv2
+    profiler.lap("import")
+
+    current_dir = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description="Đo thời gian khởi động phần nặng của main_gui (không mở cửa sổ)")
+    parser.add_argument("--backend", default="pickle", choices=["pickle", "lut", "native"])
+    parser.add_argument("--tracking", action="store_true")
+    parser.add_argument("--audio", action="store_true", help="đo cả service âm thanh + file âm thanh")
+    parser.add_argument("--audio-backend", default="pygame", choices=["pygame", "null"])
+    parser.add_argument("--no-warmup", action="store_true", help="bỏ warm-up để so sánh frame đầu tiên")
+    parser.add_argument("--budget", type=float, default=STARTUP_BUDGET_S)
+    parser.add_argument("--json", help="ghi báo cáo ra file JSON")
+    args = parser.parse_args()
+    warnings.filterwarnings("ignore", message="X does not have valid feature names")
+
+    sounds = (os.path.join(current_dir, "chuongqd.wav"), os.path.join(current_dir, "bip.wav")) if args.audio else None
+    runtime = load_runtime(profiler, args.backend, os.path.join(current_dir, "drowsiness_ensemble.pkl"),
+                           os.path.join(current_dir, "drowsiness_lut.npz"), args.tracking, sounds,
+                           warmup=not args.no_warmup, audio_backend=args.audio_backend)
+    profiler.ready()
+
+    # Frame "thật" đầu tiên sau khi sẵn sàng: đây là độ trễ tài xế thấy khi vừa bấm START
+    frame = np.zeros(WARMUP_FRAME_SHAPE, dtype=np.uint8)
+    with profiler.phase("first_frame"):
+        runtime.detector.extract_features(cv2.flip(frame, 1))
+        if runtime.clf is not None:
+            runtime.clf.predict([WARMUP_FEATURES])
+
+    print(profiler.report(args.budget))
+    for error in runtime.errors:
+        print(f"[BỎ QUA] {error}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(profiler.to_dict(args.budget), f, indent=2)
+    raise SystemExit(0 if profiler.t_ready <= args.budget else 1)
@@ -0,0 +1,262 @@
+import os
+import sys
+import mmap
+import time
+import argparse
+import threading
+from datetime import date, datetime, timedelta
+import numpy as np
+
+from clock import SYSTEM_CLOCK
+
+# --- CẤU HÌNH ---
+APP_NAME = "DriverDrowsiness"
+
+
+def user_data_dir(app=APP_NAME):
+    """Thư mục dữ liệu của người dùng (không nằm trong thư mục mã nguồn)"""
+    if os.name == "nt":
+        base = os.environ.get("LOCALAPPDATA") or os.path.expanduser(os.path.join("~", "AppData", "Local"))
+    elif sys.platform == "darwin":
+        base = os.path.expanduser(os.path.join("~", "Library", "Application Support"))
+    else:
+        base = os.environ.get("XDG_DATA_HOME") or os.path.expanduser(os.path.join("~", ".local", "share"))
+    return os.path.join(base, app)
+
+
+# Mỗi ngày ~3.5 MB cấp sẵn: ghi vào thư mục dữ liệu người dùng, đổi bằng biến môi trường DROWSINESS_TELEMETRY_DIR
+TELEMETRY_DIR = os.environ.get("DROWSINESS_TELEMETRY_DIR") or os.path.join(user_data_dir(), "telemetry")
+FILE_EXT = ".tlog"
+MAGIC = b"DDTLOG01"
+HEADER_SIZE = 64
+CHUNK_RECORDS = 30 * 3600        # mỗi lần nới file thêm ~1 giờ dữ liệu ở 30 FPS
+FLUSH_INTERVAL = 2.0             # giây, đẩy trang mmap xuống đĩa
+
+# 1 bản ghi = 32 byte, cố định
+RECORD_DTYPE = np.dtype([
+    ("t", "<f8"),                # time.time()
+    ("left_ear", "<f4"),
+    ("right_ear", "<f4"),
+    ("mar", "<f4"),
+    ("nose_y", "<f4"),
+    ("drive_seconds", "<f4"),    # tổng thời gian lái trong ngày tại thời điểm ghi
+    ("pred", "i1"),              # nhãn sau logic, -1 = không thấy mặt
+    ("pred_raw", "i1"),          # nhãn của model (dùng để dựng lại bộ đếm ngày)
+    ("alarm", "u1"),
+    ("flags", "u1"),
+])
+HEADER_DTYPE = np.dtype([
+    ("magic", "S8"),
+    ("record_size", "<u4"),
+    ("version", "<u4"),
+    ("count", "<u8"),            # số bản ghi hợp lệ, cập nhật sau mỗi lần ghi
+    ("day", "S10"),
+    ("_pad", "V30"),
+])
+assert RECORD_DTYPE.itemsize == 32 and HEADER_DTYPE.itemsize == HEADER_SIZE
+
+
+def day_path(log_dir, day):
+    return os.path.join(log_dir, day.isoformat() + FILE_EXT)
+
+
+def _next_midnight(day):
+    return time.mktime((day + timedelta(days=1)).timetuple())
+
+
+# ================= GHI LOG =================
+class TelemetryLog:
+    """
+    Log nhị phân append-only, mỗi ngày 1 file, ghi qua memory map.
+    append() chỉ gán vào vùng nhớ đã map (vài µs); thread nền flush định kỳ.
+    clock: ngày của file lấy theo clock này (clock.ManualClock -> chạy lại cho kết quả giống hệt).
+    _lock giữ trong append(); _map_lock chỉ giữ khi flush / đổi mmap (qua ngày, nới file),
+    nên flush xuống đĩa không chặn vòng lặp frame.
+    """
+    def __init__(self, log_dir=TELEMETRY_DIR, flush_interval=FLUSH_INTERVAL, clock=None):
+        self.log_dir = log_dir
+        self.clock = clock or SYSTEM_CLOCK
+        os.makedirs(log_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._map_lock = threading.Lock()
+        self._mm = None
+        self.day = None
+        self._open(self.clock.now().date())
+        self._stop = threading.Event()
+        self._flusher = threading.Thread(target=self._flush_loop, args=(flush_interval,),
+                                         name="telemetry-flush", daemon=True)
+        self._flusher.start()
+
+    # ----- file / mmap -----
+    def _map(self, path, capacity):
+        size = HEADER_SIZE + capacity * RECORD_DTYPE.itemsize
+        self._file = open(path, "r+b")
+        if os.path.getsize(path) < size:
+            self._file.truncate(size)
+        self._mm = mmap.mmap(self._file.fileno(), size)
+        self._header = np.frombuffer(self._mm, dtype=HEADER_DTYPE, count=1)
+        self._records = np.frombuffer(self._mm, dtype=RECORD_DTYPE, count=capacity, offset=HEADER_SIZE)
+        self.capacity = capacity
+
+    def _unmap(self):
+        if self._mm is not None:
+            # Phải bỏ hết view numpy trước khi đóng mmap
+            self._header = self._records = None
+            self._mm.flush()
+            self._mm.close()
+            self._file.close()
+            self._mm = None
+
+    def _open(self, day):
+        path = day_path(self.log_dir, day)
+        count = 0
+        if os.path.exists(path):
+            header = read_header(path)
+            if header is not None:
+                count = int(header["count"])
+        else:
+            with open(path, "wb"):
+                pass
+        capacity = max(CHUNK_RECORDS, -(-count // CHUNK_RECORDS) * CHUNK_RECORDS + CHUNK_RECORDS)
+        self._map(path, capacity)
+        h = self._header[0]
+        if h["magic"] != MAGIC:
+            h["magic"] = MAGIC
+            h["record_size"] = RECORD_DTYPE.itemsize
+            h["version"] = 1
+            h["day"] = day.isoformat().encode()
+        h["count"] = count
+        self.count = count
+        self.path = path
+        self.day = day
+        self._rollover = _next_midnight(day)
+
+    def _grow(self):
+        self._unmap()
+        self._map(self.path, self.capacity + CHUNK_RECORDS)
+
+    # ----- ghi -----
+    def rolls_over(self, t):
+        """True nếu bản ghi thời điểm t sẽ sang file của ngày mới (bộ đếm trong ngày của app phải reset trước)"""
+        return t >= self._rollover
+
+    def append(self, t, features, pred, pred_raw, nose_y, alarm, drive_seconds, flags=0):
+        """Ghi 1 frame; features=None khi không thấy mặt"""
+        with self._lock:
+            if t >= self._rollover:
+                with self._map_lock:
+                    self._unmap()
+                    self._open(max(self.clock.now().date(), self.day + timedelta(days=1)))
+            if self.count >= self.capacity:
+                with self._map_lock:
+                    self._grow()
+            r = self._records[self.count]
+            r["t"] = t
+            if features is None:
+                r["left_ear"] = r["right_ear"] = r["mar"] = r["nose_y"] = np.nan
+                r["pred"] = r["pred_raw"] = -1
+            else:
+                r["left_ear"], r["right_ear"], r["mar"] = features[0], features[1], features[2]
+                r["nose_y"] = nose_y
+                r["pred"] = pred
+                r["pred_raw"] = pred_raw
+            r["alarm"] = 1 if alarm else 0
+            r["drive_seconds"] = drive_seconds
+            r["flags"] = flags
+            self.count += 1
+            self._header[0]["count"] = self.count   # cập nhật sau khi bản ghi đã đầy đủ
+
+    def flush(self):
+        with self._map_lock:
+            if self._mm is not None:
+                self._mm.flush()
+
+    def _flush_loop(self, interval):
+        while not self._stop.wait(interval):
+            self.flush()
+
+    def close(self):
+        self._stop.set()
+        self._flusher.join(timeout=2.0)
+        with self._lock, self._map_lock:
+            self._unmap()
+
+    def recover(self):
+        """Dựng lại bộ đếm ngày + thời gian lái từ file của hôm nay"""
+        self.flush()
+        return recover_state(self.path)
+
+
+# ================= ĐỌC LOG =================
+def read_header(path):
+    with open(path, "rb") as f:
+        raw = f.read(HEADER_SIZE)
+    if len(raw) < HEADER_SIZE:
+        return None
+    header = np.frombuffer(raw, dtype=HEADER_DTYPE)[0]
+    if header["magic"] != MAGIC or header["record_size"] != RECORD_DTYPE.itemsize:
+        return None
+    return header
+
+
+def read_records(path):
+    """Đọc toàn bộ bản ghi hợp lệ của 1 file -> mảng structured (1 lần đọc, không lặp Python)"""
+    header = read_header(path)
+    if header is None:
+        return np.empty(0, dtype=RECORD_DTYPE)
+    return np.fromfile(path, dtype=RECORD_DTYPE, count=int(header["count"]), offset=HEADER_SIZE)
+
+
+def recover_state(path):
+    records = read_records(path) if os.path.exists(path) else np.empty(0, dtype=RECORD_DTYPE)
+    raw = records["pred_raw"]
+    return {
+        "records": int(len(records)),
+        "day_total": int((raw >= 0).sum()),
+        "day_sleep": int((raw == 1).sum()),
+        "day_yawn": int((raw == 2).sum()),
+        "drive_seconds": int(records["drive_seconds"][-1]) if len(records) else 0,
+        "last_time": float(records["t"][-1]) if len(records) else None,
+    }
+
+
+def summarize_day(records):
+    """Báo cáo 1 ngày: số frame, tỉ lệ có mặt, số lần / tổng thời gian báo động, thời gian lái"""
+    if len(records) == 0:
+        return {"records": 0}
+    t = records["t"]
+    alarm = records["alarm"].astype(bool)
+    edges = np.flatnonzero(np.diff(np.concatenate([[False], alarm, [False]]).astype(np.int8)))
+    starts, ends = edges[::2], edges[1::2] - 1
+    pred = records["pred"]
+    face = pred >= 0
+    return {
+        "records": int(len(records)),
+        "first": datetime.fromtimestamp(t[0]).isoformat(timespec="seconds"),
+        "last": datetime.fromtimestamp(t[-1]).isoformat(timespec="seconds"),
+        "face_ratio": float(face.mean()),
+        "sleep_frames": int((pred == 1).sum()),
+        "yawn_frames": int((pred == 2).sum()),
+        "alarm_count": int(len(starts)),
+        "alarm_seconds": float((t[ends] - t[starts]).sum()),
+        "drive_seconds": float(records["drive_seconds"][-1]),
+        "mean_ear": float(np.nanmean((records["left_ear"][face] + records["right_ear"][face]) / 2)) if face.any() else None,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Đọc telemetry log theo ngày")
+    parser.add_argument("--dir", default=TELEMETRY_DIR)
+    parser.add_argument("--day", default=date.today().isoformat(), help="YYYY-MM-DD")
+    args = parser.parse_args()
+
+    path = day_path(args.dir, date.fromisoformat(args.day))
+    if not os.path.exists(path):
+        raise SystemExit(f"Không có log: {path}")
+    t0 = time.perf_counter()
+    records = read_records(path)
+    report = summarize_day(records)
+    elapsed = time.perf_counter() - t0
+    for key, value in report.items():
+        print(f"{key:<15} {value}")
+    print(f"[INFO] {len(records)} bản ghi, đọc + tổng hợp trong {elapsed * 1000:.0f} ms")
@@ -0,0 +1,256 @@
+import os
+import csv
+import argparse
+import numpy as np
+
+# --- CẤU HÌNH ---
+EAR_CLOSED_THRESH = 0.2       # EAR trung bình 2 mắt dưới ngưỡng -> mắt nhắm
+MAR_YAWN_THRESH = 0.4         # giống ngưỡng ghi đè nhãn ngáp trong detection_logic
+BLINK_MAX_DURATION = 0.5      # nhắm lâu hơn thì không tính là chớp mắt
+YAWN_MIN_DURATION = 1.0       # mở miệng ít nhất bấy nhiêu giây mới tính là 1 lần ngáp
+
+PERCLOS_WINDOW = 60.0         # giây
+BLINK_WINDOW = 60.0
+YAWN_WINDOW = 300.0
+EAR_VAR_WINDOW = 10.0
+MAX_SAMPLES = 60 * 60         # giới hạn bộ nhớ mỗi cửa sổ (60 s x 60 fps)
+RESYNC_EVERY = 10000          # tính lại tổng chính xác định kỳ để tránh trôi số float
+# Mỗi mẫu PERCLOS / EAR nặng bằng khoảng thời gian từ mẫu trước (giây): tốc độ suy luận thay đổi
+# (chế độ REDUCED, bỏ frame) không làm lệch kết quả. Mẫu đầu tiên / sau khi mất mặt lâu bị chặn trên.
+DEFAULT_SAMPLE_DT = 1 / 30
+MAX_SAMPLE_DT = 0.5
+
+FEATURE_NAMES = ["perclos", "blink_rate", "blink_duration", "yawn_rate", "ear_var"]
+
+
+# ================= CỬA SỔ TRƯỢT THEO THỜI GIAN =================
+class RunningWindow:
+    """
+    Cửa sổ trượt (t, value, weight) trong `seconds` giây, tối đa `maxlen` mẫu, lưu trong
+    mảng vòng NumPy cấp sẵn (head / count); giữ sẵn tổng trọng số, tổng và tổng bình phương
+    có trọng số -> mean / var O(1) mỗi frame. weight=1 cho mọi mẫu -> trung bình theo số mẫu.
+    """
+    def __init__(self, seconds, maxlen=MAX_SAMPLES):
+        self.seconds = seconds
+        self.maxlen = maxlen
+        self.times = np.empty(maxlen)
+        self.values = np.empty(maxlen)
+        self.weights = np.empty(maxlen)
+        self.clear()
+
+    def _pop(self):
+        i = self.head
+        w, v = self.weights.item(i), self.values.item(i)
+        self.weight -= w
+        self.sum -= w * v
+        self.sumsq -= w * v * v
+        self.head = (i + 1) % self.maxlen
+        self.count -= 1
+        if self.count == 0:
+            self.weight = self.sum = self.sumsq = 0.0
+
+    def _resync(self):
+        """Tính lại tổng chính xác trên các mẫu đang có (2 đoạn liên tục của mảng vòng)"""
+        w, v = self.weights, self.values
+        self.weight = self.sum = self.sumsq = 0.0
+        for part in self._parts():
+            self.weight += float(w[part].sum())
+            self.sum += float((w[part] * v[part]).sum())
+            self.sumsq += float((w[part] * v[part] * v[part]).sum())
+
+    def _parts(self):
+        end = self.head + self.count
+        if end <= self.maxlen:
+            return (slice(self.head, end),)
+        return slice(self.head, self.maxlen), slice(0, end - self.maxlen)
+
+    def expire(self, now):
+        """Bỏ các mẫu cũ hơn now - seconds"""
+        limit = now - self.seconds
+        times = self.times
+        while self.count and times.item(self.head) < limit:
+            self._pop()
+
+    def push(self, t, value, weight=1.0):
+        if self.count >= self.maxlen:
+            self._pop()
+        i = (self.head + self.count) % self.maxlen
+        self.times[i], self.values[i], self.weights[i] = t, value, weight
+        self.count += 1
+        self.weight += weight
+        self.sum += weight * value
+        self.sumsq += weight * value * value
+        self._pushes += 1
+        if self._pushes % RESYNC_EVERY == 0:
+            self._resync()
+        self.expire(t)
+
+    def __len__(self):
+        return self.count
+
+    def mean(self):
+        return self.sum / self.weight if self.count and self.weight > 0 else 0.0
+
+    def var(self):
+        if self.count < 2 or self.weight <= 0:
+            return 0.0
+        m = self.sum / self.weight
+        return max(self.sumsq / self.weight - m * m, 0.0)
+
+    def clear(self):
+        self.head = self.count = 0
+        self.weight = self.sum = self.sumsq = 0.0
+        self._pushes = 0
+
+
+# ================= PERCLOS / CHỚP MẮT / NGÁP / EAR =================
+class TemporalFeatures:
+    """
+    Đặc trưng theo thời gian, cập nhật O(1) mỗi frame:
+    - perclos: tỉ lệ thời gian mắt nhắm trong PERCLOS_WINDOW (mỗi frame nặng bằng dt tới frame trước)
+    - blink_rate: số lần chớp mắt / phút, blink_duration: thời gian chớp trung bình (s)
+    - yawn_rate: số lần ngáp / phút trong YAWN_WINDOW
+    - ear_var: phương sai EAR trong EAR_VAR_WINDOW (cũng theo dt)
+    - coverage: số giây dữ liệu có mặt trong cửa sổ PERCLOS
+    """
+    def __init__(self, perclos_window=PERCLOS_WINDOW, blink_window=BLINK_WINDOW,
+                 yawn_window=YAWN_WINDOW, ear_window=EAR_VAR_WINDOW):
+        self.closed = RunningWindow(perclos_window)
+        self.blinks = RunningWindow(blink_window)     # value = thời gian chớp
+        self.yawns = RunningWindow(yawn_window)       # value = thời gian ngáp
+        self.ear = RunningWindow(ear_window)
+        self.reset()
+
+    def reset(self):
+        for window in (self.closed, self.blinks, self.yawns, self.ear):
+            window.clear()
+        self.eye_closed_since = None
+        self.mouth_open_since = None
+        self.yawn_counted = False
+        self.last_time = None
+
+    def update(self, now, features):
+        """features: [LeftEAR, RightEAR, MAR] của frame có mặt"""
+        ear = (features[0] + features[1]) / 2
+        mar = features[2]
+
+        # PERCLOS + phương sai EAR, trọng số theo thời gian thay vì theo số frame
+        dt = DEFAULT_SAMPLE_DT if self.last_time is None else min(max(now - self.last_time, 0.0), MAX_SAMPLE_DT)
+        self.last_time = now
+        closed = ear < EAR_CLOSED_THRESH
+        self.closed.push(now, 1.0 if closed else 0.0, dt)
+        self.ear.push(now, ear, dt)
+
+        # Chớp mắt: đoạn nhắm ngắn hơn BLINK_MAX_DURATION, tính khi mắt mở lại
+        if closed:
+            if self.eye_closed_since is None:
+                self.eye_closed_since = now
+        elif self.eye_closed_since is not None:
+            duration = now - self.eye_closed_since
+            if duration <= BLINK_MAX_DURATION:
+                self.blinks.push(now, duration)
+            self.eye_closed_since = None
+
+        # Ngáp: MAR vượt ngưỡng liên tục ít nhất YAWN_MIN_DURATION, đếm 1 lần mỗi lần mở miệng
+        if mar > MAR_YAWN_THRESH:
+            if self.mouth_open_since is None:
+                self.mouth_open_since = now
+                self.yawn_counted = False
+            duration = now - self.mouth_open_since
+            if not self.yawn_counted and duration >= YAWN_MIN_DURATION:
+                self.yawns.push(now, duration)
+                self.yawn_counted = True
+        else:
+            self.mouth_open_since = None
+
+        # Cửa sổ sự kiện phải trôi theo thời gian cả khi không có sự kiện mới
+        self.blinks.expire(now)
+        self.yawns.expire(now)
+
+    def expire(self, now):
+        """Trôi mọi cửa sổ tới now (gọi khi không có frame mặt để giá trị không bị đóng băng)"""
+        for window in (self.closed, self.blinks, self.yawns, self.ear):
+            window.expire(now)
+
+    # ----- giá trị hiện tại -----
+    @property
+    def perclos(self):
+        return self.closed.mean()
+
+    @property
+    def coverage(self):
+        return self.closed.weight
+
+    @property
+    def blink_rate(self):
+        return len(self.blinks) * 60.0 / self.blinks.seconds
+
+    @property
+    def blink_duration(self):
+        return self.blinks.mean()
+
+    @property
+    def yawn_rate(self):
+        return len(self.yawns) * 60.0 / self.yawns.seconds
+
+    @property
+    def ear_var(self):
+        return self.ear.var()
+
+    def values(self):
+        return [self.perclos, self.blink_rate, self.blink_duration, self.yawn_rate, self.ear_var]
+
+    def snapshot(self):
+        return dict(zip(FEATURE_NAMES, self.values()))
+
+
+# ================= BATCH CHO HUẤN LUYỆN =================
+def compute_timeline(times, left_ear, right_ear, mar, **windows):
+    """
+    Chạy TemporalFeatures trên cả chuỗi frame -> mảng (n, len(FEATURE_NAMES)).
+    Frame không có mặt (NaN) giữ nguyên giá trị của frame trước.
+    """
+    tf = TemporalFeatures(**windows)
+    out = np.zeros((len(times), len(FEATURE_NAMES)))
+    for i, (t, l, r, m) in enumerate(zip(times, left_ear, right_ear, mar)):
+        if not (np.isnan(l) or np.isnan(r) or np.isnan(m)):
+            tf.update(t, (l, r, m))
+        out[i] = tf.values()
+    return out
+
+
+def add_temporal_columns(in_path, out_path, fps=30.0):
+    """Thêm cột đặc trưng thời gian vào CSV theo frame (vd. *_frames.csv của offline_analysis)"""
+    with open(in_path, newline="") as f:
+        rows = list(csv.DictReader(f))
+    if not rows:
+        return 0
+    columns = list(rows[0].keys())
+
+    def col(name):
+        return np.array([float(r[name]) if r[name] not in ("", "nan") else np.nan for r in rows])
+    times = col("time") if "time" in columns else np.arange(len(rows)) / fps
+    values = compute_timeline(times, col("LeftEAR"), col("RightEAR"), col("MAR"))
+
+    tmp = out_path + ".tmp"
+    with open(tmp, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(columns + FEATURE_NAMES)
+        for row, extra in zip(rows, values):
+            writer.writerow([row[c] for c in columns] + [f"{v:.6g}" for v in extra])
+    os.replace(tmp, out_path)
+    return len(rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Thêm PERCLOS / chớp mắt / ngáp / phương sai EAR vào CSV theo frame")
+    parser.add_argument("csv_files", nargs="+", help="CSV có cột LeftEAR, RightEAR, MAR (và time nếu có)")
+    parser.add_argument("--fps", type=float, default=30.0, help="dùng khi CSV không có cột time")
+    parser.add_argument("--suffix", default="_temporal")
+    args = parser.parse_args()
+
+    for path in args.csv_files:
+        base, ext = os.path.splitext(path)
+        out = base + args.suffix + ext
+        n = add_temporal_columns(path, out, args.fps)
+        print(f"✅ {path} -> {out} ({n} dòng)")
@@ -0,0 +1,424 @@
+import os
+import json
+import time
+import argparse
+import numpy as np
+
+from detection_logic import (EYE_CLOSE_TIME_THRESH, YAWN_TIME_THRESH, NOD_COUNT_THRESH, NOD_RESET_TIME,
+                             AWAKE_STOP_ALARM_SEC, LABEL_NORMAL, LABEL_SLEEP, LABEL_YAWN)
+
+# --- CẤU HÌNH ---
+MAR_YAWN_ON = 0.4             # giống DrowsinessLogic.update: MAR > 0.4 -> ngáp
+MAR_YAWN_OFF = 0.3            # ... model nói ngáp nhưng MAR < 0.3 -> bình thường
+NOD_THRESHOLD = 60            # NodDetector.threshold (pixel)
+SCORE_UP = 0.5
+SCORE_DOWN = 0.2
+NOD_PENALTY = 2.0
+SCORE_MAX = 100.0
+WINDOW = 256                  # cửa sổ ban đầu khi quét tìm sự kiện (tự nhân đôi khi không thấy)
+SCALAR_BLOCK = 256            # sự kiện dày đặc (kẹp / co lại liên tục) -> chạy vòng lặp thường từng đoạn này
+
+SERIES = ["pred", "sleep_elapsed", "yawn_elapsed", "nods", "is_warning",
+          "score_sleep", "score_yawn", "score_alert"]
+
+
+# ================= CỘNG DỒN CÓ KẸP BIÊN =================
+def clamped_accumulate(deltas, start, lo=0.0, hi=SCORE_MAX, window=WINDOW):
+    """
+    Giống vòng lặp v = min(max(v + d, lo), hi) cho từng d, giống hệt từng bit:
+    đoạn không chạm biên dùng np.add.accumulate (cộng tuần tự cùng thứ tự), chạm biên thì kẹp rồi
+    nhảy qua cả đoạn bước đang đẩy ra ngoài biên (giá trị đứng yên ở biên).
+    Chạm biên liên tục (vd. -0.2 / +2.0 xen kẽ sát 100) thì tính vòng lặp thường cho SCALAR_BLOCK bước.
+    """
+    deltas = np.asarray(deltas, dtype=np.float64)
+    n = len(deltas)
+    out = np.empty(n)
+    up = np.flatnonzero(deltas > 0)
+    down = np.flatnonzero(deltas < 0)
+    i, v, w = 0, float(start), window
+    while i < n:
+        if v <= lo or v >= hi:
+            # Đứng ở biên: giữ nguyên tới bước đầu tiên kéo vào trong
+            leave = up if v <= lo else down
+            pos = np.searchsorted(leave, i)
+            j = leave[pos] if pos < len(leave) else n
+            out[i:j] = v
+            i = j
+            if i >= n:
+                break
+        j = min(i + w, n)
+        acc = np.add.accumulate(np.concatenate(([v], deltas[i:j])))[1:]
+        bad = np.flatnonzero((acc < lo) | (acc > hi))
+        if len(bad) == 0:
+            out[i:j] = acc
+            v = float(acc[-1])
+            i = j
+            w *= 2
+            continue
+        k = bad[0]
+        out[i:i + k] = acc[:k]
+        v = lo if acc[k] < lo else hi
+        out[i + k] = v
+        i += k + 1
+        w = window
+        if k < 8:
+            j = min(i + SCALAR_BLOCK, n)
+            block = []
+            for d in deltas[i:j].tolist():
+                v = min(max(v + d, lo), hi)
+                block.append(v)
+            out[i:j] = block
+            i = j
+    return out
+
+
+def _first_after(t, k0, t_ref, seconds, strict):
+    """Chỉ số k >= k0 đầu tiên có t[k] - t_ref > seconds (strict) hoặc >= seconds; len(t) nếu không có"""
+    k = max(int(np.searchsorted(t, t_ref + seconds, side="left")) - 1, k0)
+    n = len(t)
+    # searchsorted chỉ để đoán, điều kiện chốt tính đúng phép trừ như code từng frame
+    while k < n and not ((t[k] - t_ref > seconds) if strict else (t[k] - t_ref >= seconds)):
+        k += 1
+    return k
+
+
+# ================= GẬT ĐẦU (NodDetector) =================
+def nod_counts(t, nose_y, threshold=NOD_THRESHOLD, window=WINDOW):
+    """
+    Số lần gật đầu sau mỗi frame, giống NodDetector.update chạy tuần tự từ trạng thái reset.
+    Vòng lặp chỉ chạy theo sự kiện (đổi trạng thái / reset bộ đếm), mỗi lần tìm bằng numpy.
+    """
+    t = np.asarray(t, dtype=np.float64)
+    y = np.asarray(nose_y, dtype=np.float64)
+    n = len(y)
+    counts = np.zeros(n, dtype=np.int64)
+    if n == 0:
+        return counts
+    cmin = cmax = y[0]           # frame đầu chỉ khởi tạo min / max
+    state, count, last_nod = 0, 0, None
+    p = 1
+    while p < n:
+        # Bộ đếm chưa đủ ngưỡng bị xóa nếu quá NOD_RESET_TIME không gật tiếp (kiểm tra đầu mỗi frame)
+        k_reset = n
+        if 0 < count < NOD_COUNT_THRESH:
+            k_reset = _first_after(t, p, last_nod, NOD_RESET_TIME, strict=True)
+
+        # Tìm frame đầu tiên (trước k_reset) đổi trạng thái, min / max cộng dồn từ carry
+        k_event, a, w = None, p, window
+        while a < k_reset:
+            b = min(a + w, k_reset)
+            seg = y[a:b]
+            if state == 0:
+                run_min = np.minimum(np.minimum.accumulate(seg), cmin)
+                hit = np.flatnonzero(seg > run_min + threshold)
+            else:
+                run_max = np.maximum(np.maximum.accumulate(seg), cmax)
+                hit = np.flatnonzero(seg < run_max - threshold)
+            if len(hit):
+                k_event = a + hit[0]
+                cmin = min(cmin, seg[:hit[0] + 1].min())
+                cmax = max(cmax, seg[:hit[0] + 1].max())
+                break
+            cmin = min(cmin, seg.min())
+            cmax = max(cmax, seg.max())
+            a, w = b, w * 2
+
+        if k_event is None:
+            counts[p:k_reset] = count
+            if k_reset >= n:
+                break
+            # Reset bộ đếm ở k_reset, frame đó xét tiếp với trạng thái 0 (min / max giữ nguyên)
+            count, state = 0, 0
+            p = k_reset
+            continue
+
+        counts[p:k_event] = count
+        if state == 0:
+            state = 1
+        elif state == 1:
+            state = 2
+        else:
+            count += 1
+            last_nod = t[k_event]
+            cmin = cmax = y[k_event]
+            state = 0
+        counts[k_event] = count
+        p = k_event + 1
+    return counts
+
+
+# ================= THỜI GIAN NHẮM MẮT / NGÁP =================
+def run_elapsed(t, active):
+    """t - thời điểm bắt đầu đoạn active liên tiếp (0 ngoài đoạn), giống eye_start / yawn_start"""
+    n = len(active)
+    idx = np.arange(n)
+    starts = np.where(active & ~np.concatenate(([False], active[:-1])), idx, 0)
+    start = np.maximum.accumulate(starts) if n else starts
+    return np.where(active, t - t[start], 0.0)
+
+
+# ================= ĐIỂM SLEEP / YAWN / AWAKE =================
+def score_series(sleep, yawn, yawn_long, nod_penalty, window=WINDOW):
+    """
+    score_sleep / score_yawn / score_alert sau mỗi frame, giống DrowsinessLogic.update:
+    tăng / giảm có kẹp (yawn chỉ tăng khi ngáp quá YAWN_TIME_THRESH), phạt gật đầu, co lại khi tổng > 100.
+    Tổng > 100 thì chạy lại từ frame sau.
+    """
+    n = len(sleep)
+    # Mỗi frame 1 bước cho sleep (+0.5 / -0.2), frame phạt gật thêm 1 bước +2.0 ngay sau đó
+    ops_per_frame = 1 + nod_penalty.astype(np.int64)
+    frame_end = np.cumsum(ops_per_frame)             # op cuối của frame i là frame_end[i] - 1
+    sleep_ops = np.empty(frame_end[-1] if n else 0)
+    first_op = frame_end - ops_per_frame
+    sleep_ops[first_op] = np.where(sleep, SCORE_UP, -SCORE_DOWN)
+    sleep_step, penalty = sleep_ops[first_op].tolist(), nod_penalty.tolist()
+    sleep_ops[first_op[nod_penalty] + 1] = NOD_PENALTY
+    yawn_ops = np.where(yawn, np.where(yawn_long, SCORE_UP, 0.0), -SCORE_DOWN)
+    yawn_step = yawn_ops.tolist()
+
+    out_s, out_y, out_a = np.empty(n), np.empty(n), np.empty(n)
+    i, s, y, w = 0, 0.0, 0.0, window
+    while i < n:
+        j = min(i + w, n)
+        s_acc = clamped_accumulate(sleep_ops[first_op[i]:frame_end[j - 1]], s)[frame_end[i:j] - 1 - first_op[i]]
+        y_acc = clamped_accumulate(yawn_ops[i:j], y)
+        total = s_acc + y_acc
+        over = np.flatnonzero(total > SCORE_MAX)
+        k = over[0] if len(over) else j - i
+        out_s[i:i + k], out_y[i:i + k] = s_acc[:k], y_acc[:k]
+        out_a[i:i + k] = SCORE_MAX - total[:k]
+        if len(over) == 0:
+            s, y = float(s_acc[-1]), float(y_acc[-1])
+            i, w = j, w * 2
+            continue
+        ratio = SCORE_MAX / total[k]
+        s, y = float(s_acc[k] * ratio), float(y_acc[k] * ratio)
+        out_s[i + k], out_y[i + k], out_a[i + k] = s, y, 0.0
+        i, w = i + k + 1, window
+
+        # Co lại thường kéo dài nhiều frame liền: tính từng frame tới khi có SCALAR_BLOCK frame liền không co
+        calm = 0
+        while i < n and calm < SCALAR_BLOCK:
+            s = min(max(s + sleep_step[i], 0.0), SCORE_MAX)
+            if penalty[i]:
+                s = min(s + NOD_PENALTY, SCORE_MAX)
+            y = min(max(y + yawn_step[i], 0.0), SCORE_MAX)
+            total_i = s + y
+            if total_i > SCORE_MAX:
+                ratio = SCORE_MAX / total_i
+                s, y = s * ratio, y * ratio
+                out_a[i], calm = 0.0, 0
+            else:
+                out_a[i], calm = SCORE_MAX - total_i, calm + 1
+            out_s[i], out_y[i] = s, y
+            i += 1
+    return out_s, out_y, out_a
+
+
+# ================= CẢ TIMELINE =================
+def intervals(t, mask):
+    """Các đoạn liên tiếp mask=True -> [(t_start, t_end), ...]"""
+    if len(mask) == 0:
+        return []
+    m = np.concatenate([[False], mask.astype(bool), [False]])
+    edges = np.flatnonzero(m[1:] != m[:-1])
+    return [(float(t[s]), float(t[e - 1])) for s, e in zip(edges[::2], edges[1::2])]
+
+
+def alarm_intervals(t, is_warning, awake_stop_seconds=AWAKE_STOP_ALARM_SEC):
+    """
+    Chuông (AlarmLatch, không mute): bật ở frame cảnh báo đầu tiên, tắt ở frame đầu tiên
+    tỉnh táo liên tục đủ awake_stop_seconds -> [(t_start, t_stop hoặc None nếu còn kêu), ...]
+    """
+    n = len(is_warning)
+    m = np.concatenate([[False], np.asarray(is_warning, dtype=bool), [False]])
+    edges = np.flatnonzero(m[1:] != m[:-1])
+    starts, ends = edges[::2], edges[1::2]
+    out, start = [], None
+    for i, (s, e) in enumerate(zip(starts.tolist(), ends.tolist())):
+        if start is None:
+            start = float(t[s])
+        if e >= n:
+            break
+        # Đoạn tỉnh táo bắt đầu ở e, kéo dài tới đợt cảnh báo kế tiếp
+        next_warn = starts[i + 1] if i + 1 < len(starts) else n
+        stop = _first_after(t[:next_warn], e, t[e], awake_stop_seconds, strict=False)
+        if stop < next_warn:
+            out.append((start, float(t[stop])))
+            start = None
+    if start is not None:
+        out.append((start, None))
+    return out
+
+
+def score_timeline(t, pred, mar, nose_y, face=None):
+    """
+    Toàn bộ logic ngủ / ngáp / gật đầu cho cả timeline -> dict mảng theo SERIES (cùng độ dài input)
+    + "warning_intervals" / "alarm_intervals". Frame không có mặt (face=False) không cập nhật logic,
+    giống GUI: pred = -1, nods / cảnh báo = 0, điểm giữ giá trị của frame trước.
+    """
+    t = np.asarray(t, dtype=np.float64)
+    n = len(t)
+    face = np.ones(n, dtype=bool) if face is None else np.asarray(face, dtype=bool)
+    fi = np.flatnonzero(face)
+    tf = t[fi]
+    p = np.asarray(pred, dtype=np.int64)[fi]
+    m = np.asarray(mar, dtype=np.float64)[fi]
+
+    # Ghi đè nhãn theo MAR
+    p = np.where(m > MAR_YAWN_ON, LABEL_YAWN, np.where((p == LABEL_YAWN) & (m < MAR_YAWN_OFF), LABEL_NORMAL, p))
+    sleep, yawn = p == LABEL_SLEEP, p == LABEL_YAWN
+    sleep_elapsed = run_elapsed(tf, sleep)
+    yawn_elapsed = run_elapsed(tf, yawn)
+    nods = nod_counts(tf, np.asarray(nose_y, dtype=np.float64)[fi])
+    nod_alarm = nods >= NOD_COUNT_THRESH
+    is_warning = (sleep & (sleep_elapsed > EYE_CLOSE_TIME_THRESH)) | nod_alarm
+    s, y, a = score_series(sleep, yawn, yawn_elapsed > YAWN_TIME_THRESH, nod_alarm)
+
+    out = {
+        "pred": np.full(n, -1, dtype=np.int64),
+        "sleep_elapsed": np.zeros(n), "yawn_elapsed": np.zeros(n),
+        "nods": np.zeros(n, dtype=np.int64), "is_warning": np.zeros(n, dtype=bool),
+    }
+    out["pred"][fi], out["sleep_elapsed"][fi], out["yawn_elapsed"][fi] = p, sleep_elapsed, yawn_elapsed
+    out["nods"][fi], out["is_warning"][fi] = nods, is_warning
+    # Điểm của frame không có mặt = điểm của frame có mặt gần nhất trước đó (ban đầu 0 / 0 / 100)
+    carry = np.maximum.accumulate(np.where(face, np.arange(n), -1)) if n else np.zeros(0, dtype=np.int64)
+    pos = np.searchsorted(fi, carry)   # carry = -1 -> trước frame có mặt đầu tiên
+    for name, values, initial in (("score_sleep", s, 0.0), ("score_yawn", y, 0.0), ("score_alert", a, SCORE_MAX)):
+        series = np.full(n, initial)
+        has = carry >= 0
+        series[has] = values[pos[has]]
+        out[name] = series
+    out["warning_intervals"] = intervals(tf, is_warning)
+    out["alarm_intervals"] = alarm_intervals(tf, is_warning)
+    return out
+
+
+# ================= ĐỐI CHIẾU VỚI LOGIC TỪNG FRAME =================
+def score_reference(t, pred, mar, nose_y, face=None):
+    """Chạy DrowsinessLogic + AlarmLatch từng frame với ManualClock (dùng để kiểm tra score_timeline)"""
+    from clock import ManualClock
+    from detection_logic import DrowsinessLogic, AlarmLatch
+    n = len(t)
+    face = np.ones(n, dtype=bool) if face is None else np.asarray(face, dtype=bool)
+    clock = ManualClock(t[0] if n else 0.0)
+    logic = DrowsinessLogic(clock)
+    logic.reset()
+    alarm = AlarmLatch(clock=clock)
+    out = {name: np.zeros(n) for name in SERIES}
+    out["pred"] = np.full(n, -1, dtype=np.int64)
+    alarms, start = [], None
+    for i in range(n):
+        clock.set(t[i])
+        if face[i]:
+            d = logic.update((0.0, 0.0, mar[i]), (0, nose_y[i]), int(pred[i]))
+            out["pred"][i], out["sleep_elapsed"][i], out["yawn_elapsed"][i] = d.pred, d.sleep_elapsed, d.yawn_elapsed
+            out["nods"][i], out["is_warning"][i] = d.nods, d.is_warning
+            event = alarm.update(d.is_warning)
+            if event == "start":
+                start = float(t[i])
+            elif event == "stop":
+                alarms.append((start, float(t[i])))
+        out["score_sleep"][i], out["score_yawn"][i] = logic.score_sleep, logic.score_yawn
+        out["score_alert"][i] = logic.score_alert
+    if alarm.playing:
+        alarms.append((start, None))
+    out["nods"] = out["nods"].astype(np.int64)
+    out["is_warning"] = out["is_warning"].astype(bool)
+    out["alarm_intervals"] = alarms
+    return out
+
+
+def compare(got, ref):
+    """Tên các chuỗi khác nhau (so từng bit với array_equal)"""
+    bad = [name for name in SERIES if not np.array_equal(got[name], ref[name])]
+    if got["alarm_intervals"] != ref["alarm_intervals"]:
+        bad.append("alarm_intervals")
+    return bad
+
+
+def random_timeline(n, seed=0, fps=30.0, nod_burst=12):
+    """
+    Timeline ngẫu nhiên có đủ tình huống: ngủ / ngáp dài ngắn, gật đầu, mất mặt, fps dao động.
+    nod_burst: số lần gật tối đa mỗi đợt (+1); từ NOD_COUNT_THRESH trở lên sẽ báo động gật đầu tới hết timeline.
+    """
+    rng = np.random.default_rng(seed)
+    t = np.cumsum(rng.uniform(0.6, 1.4, n) / fps)
+    pred = np.zeros(n, dtype=np.int64)
+    for label, count, longest in ((LABEL_SLEEP, n // 300, 240), (LABEL_YAWN, n // 600, 3000)):
+        for s in rng.integers(0, n, count):
+            pred[s:s + rng.integers(1, longest)] = label
+    pred[rng.random(n) < 0.02] = rng.integers(0, 3)
+    mar = rng.uniform(0.0, 0.5, n) ** 2 + np.where(pred == LABEL_YAWN, rng.uniform(0.2, 0.5, n), 0.0)
+    nose_y = 300 + rng.normal(0, 5, n)
+    for s in rng.integers(0, n, n // 2000 + 1):
+        for k in range(rng.integers(2, nod_burst)):
+            a = s + k * 20
+            nose_y[a:a + 10] += 90
+    face = rng.random(n) > 0.03
+    return t, pred, mar, np.round(nose_y), face
+
+
+if __name__ == "__main__":
+    from replay import load_timeline
+
+    parser = argparse.ArgumentParser(description="Chấm điểm ngủ / ngáp / gật đầu cho cả timeline bằng numpy")
+    parser.add_argument("inputs", nargs="*", help="*_frames.csv (offline_analysis.py) hoặc .tlog")
+    parser.add_argument("--verify", action="store_true", help="so từng frame với DrowsinessLogic (chậm)")
+    parser.add_argument("--random", type=int, default=0, help="kiểm tra thêm N timeline ngẫu nhiên")
+    parser.add_argument("--bench-hours", type=float, default=0, help="đo tốc độ trên timeline ngẫu nhiên dài N giờ")
+    parser.add_argument("--json", help="ghi kết quả ra file JSON")
+    args = parser.parse_args()
+
+    report = {"inputs": [], "random": [], "bench": None}
+    failed = False
+    for path in args.inputs:
+        timeline = load_timeline(path)
+        t, pred, mar, nose_y, face = (timeline.t, timeline.pred_raw, timeline.features[:, 2],
+                                      timeline.nose_y, timeline.face)
+        t0 = time.perf_counter()
+        scores = score_timeline(t, pred, mar, nose_y, face)
+        elapsed = time.perf_counter() - t0
+        entry = {"source": path, "frames": int(len(t)), "seconds": elapsed,
+                 "warning_intervals": scores["warning_intervals"], "alarm_intervals": scores["alarm_intervals"],
+                 "max_nods": int(scores["nods"].max()) if len(t) else 0}
+        print(f"-> {os.path.basename(path)}: {len(t)} frames trong {elapsed * 1000:.1f} ms | "
+              f"{len(scores['alarm_intervals'])} báo động, gật tối đa {entry['max_nods']}")
+        if args.verify:
+            entry["mismatch"] = compare(scores, score_reference(t, pred, mar, nose_y, face))
+            failed |= bool(entry["mismatch"])
+            print(f"    đối chiếu từng frame: {'KHỚP' if not entry['mismatch'] else 'KHÁC ' + str(entry['mismatch'])}")
+        report["inputs"].append(entry)
+
+    for seed in range(args.random):
+        n = 20000 + seed * 7919
+        data = random_timeline(n, seed)
+        bad = compare(score_timeline(*data), score_reference(*data))
+        failed |= bool(bad)
+        report["random"].append({"seed": seed, "frames": n, "mismatch": bad})
+        print(f"[RANDOM] seed {seed}: {n} frames -> {'KHỚP' if not bad else 'KHÁC ' + str(bad)}")
+
+    if args.bench_hours > 0:
+        n = int(args.bench_hours * 3600 * 30)
+        report["bench"] = []
+        # typical: gật lẻ tẻ (tối đa 3 lần mỗi đợt); worst: sớm báo động gật đầu -> co điểm gần như mọi frame
+        for case, nod_burst in (("typical", 4), ("worst", 12)):
+            data = random_timeline(n, seed=123, nod_burst=nod_burst)
+            t0 = time.perf_counter()
+            scores = score_timeline(*data)
+            t_vec = time.perf_counter() - t0
+            t0 = time.perf_counter()
+            ref = score_reference(*data)
+            t_ref = time.perf_counter() - t0
+            bad = compare(scores, ref)
+            failed |= bool(bad)
+            report["bench"].append({"case": case, "hours": args.bench_hours, "frames": n, "vectorized_s": t_vec,
+                                    "per_frame_s": t_ref, "speedup": t_ref / t_vec, "mismatch": bad})
+            print(f"[BENCH] {case:<8}{args.bench_hours:g} giờ ({n} frames): numpy {t_vec:.2f}s | "
+                  f"từng frame {t_ref:.2f}s (x{t_ref / t_vec:.1f}) | {'KHỚP' if not bad else 'KHÁC ' + str(bad)}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    raise SystemExit(1 if failed else 0)
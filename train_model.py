@@ -1,79 +1,278 @@
 import pandas as pd
+import numpy as np
 import joblib
 import os
-from sklearn.model_selection import train_test_split
+import io
+import json
+import time
+import argparse
+import warnings
+from sklearn.model_selection import train_test_split, StratifiedKFold, cross_validate
 from sklearn.preprocessing import StandardScaler
 from sklearn.svm import SVC
 from sklearn.ensemble import RandomForestClassifier, VotingClassifier, GradientBoostingClassifier
 from sklearn.linear_model import LogisticRegression
 from sklearn.pipeline import Pipeline
 from sklearn.metrics import classification_report, accuracy_score
+from feature_store import open_store
+from lut_predictor import build_lut, feature_ranges, compare_with_model
 
 # --- CẤU HÌNH ĐƯỜNG DẪN ---
 # Dùng đường dẫn tương đối để tránh lỗi máy khác nhau
 current_dir = os.path.dirname(os.path.abspath(__file__))
 CSV_FILE = os.path.join(current_dir, "geometry_features.csv")
+# Kho đặc trưng dạng cột do gom_file.py tạo, có thì đọc thay cho CSV
+STORE_DIR = os.path.join(current_dir, "feature_store")
 MODEL_PATH = os.path.join(current_dir, "drowsiness_ensemble.pkl")
+# Bảng tra của backend "lut": chỉ build ở chế độ --search --backend lut (hoặc bằng lut_predictor.py)
+LUT_PATH = os.path.join(current_dir, "drowsiness_lut.npz")
+# Báo cáo của chế độ --search, nằm cạnh file model
+REPORT_CSV = os.path.join(current_dir, "drowsiness_model_report.csv")
+REPORT_JSON = os.path.join(current_dir, "drowsiness_model_report.json")
 
-print("[1] 📥 Đang tải dữ liệu...")
-try:
-    df = pd.read_csv(CSV_FILE)
-    print(f"-> Đã tải {len(df)} dòng dữ liệu.")
-except FileNotFoundError:
-    print(f"❌ LỖI: Không tìm thấy file {CSV_FILE}")
-    print("-> Hãy chạy gom_file.py để tạo dữ liệu trước!")
-    exit()
-
-# Lấy dữ liệu đầu vào (Features) và nhãn (Label)
-X = df[["LeftEAR", "RightEAR", "MAR"]]
-y = df["Label"]
-
-# Chia tập train/test (80% học, 20% thi)ẽ
-# stratify=y: Đảm bảo tỷ lệ các nhãn (Ngáp, Ngủ, Bình thường) ở tập train và test giống nhau
-X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42, stratify=y)
-
-print("[2] ⚙️ Đang thiết lập kiến trúc 'Siêu Model' (Ensemble)...")
-
-# --- KỸ THUẬT 1: PIPELINE & SCALING (MỚI) ---
-# SVM rất nhạy cảm với dữ liệu chưa chuẩn hóa.
-# Ta tạo một 'đường ống' (Pipeline): Dữ liệu đi qua Scaler (làm sạch) -> rồi mới vào SVM.
-svm_pipeline = Pipeline([
-    ('scaler', StandardScaler()), # Chuẩn hóa dữ liệu về dạng chuẩn (Mean=0, Std=1)
-    ('svm', SVC(kernel='rbf', C=10, gamma='scale', probability=True, class_weight='balanced'))
-])
-
-# --- KỸ THUẬT 2: RANDOM FOREST (GIỮ NGUYÊN) ---
-# Random Forest không cần Scale, nó giỏi xử lý nhiễu.
-rf_clf = RandomForestClassifier(n_estimators=100, random_state=42, class_weight='balanced')
-
-# --- KỸ THUẬT 3: GRADIENT BOOSTING (MỚI - CỰC MẠNH) ---
-# Model này học theo kiểu "Sửa sai". Nó nhìn xem các model trước sai ở đâu để tập trung học chỗ đó.
-gb_clf = GradientBoostingClassifier(n_estimators=100, learning_rate=0.1, max_depth=3, random_state=42)
-
-# --- TỔNG HỢP: VOTING CLASSIFIER (HỘI ĐỒNG GIÁM KHẢO) ---
-# Kết hợp cả 3 ông lớn: SVM (Toán học) + Random Forest (Thống kê) + Gradient Boosting (Học sâu chuỗi)
-voting_clf = VotingClassifier(
-    estimators=[
-        ('svm_pipe', svm_pipeline), 
-        ('rf', rf_clf),
-        ('gb', gb_clf)
-    ],
-    voting='soft', # 'soft': Tính trung bình độ tin cậy (xác suất) thay vì chỉ đếm phiếu bầu
-    weights=[2, 1, 1] # (Tuỳ chọn) Cho SVM quyền lực gấp đôi nếu nó chính xác nhất
-)
-
-print("[3] 🧠 Đang huấn luyện (Training)...")
-voting_clf.fit(X_train, y_train)
-
-# Đánh giá kết quả
-print("\n--- 📊 KẾT QUẢ ĐÁNH GIÁ MODEL ---")
-predictions = voting_clf.predict(X_test)
-acc = accuracy_score(y_test, predictions)
-print(f"Độ chính xác tổng thể: {acc*100:.2f}%")
-print(classification_report(y_test, predictions, target_names=["Normal", "Sleep", "Yawn"]))
-
-# Lưu model
-joblib.dump(voting_clf, MODEL_PATH)
-print(f"✅ Đã lưu model thành công tại: {MODEL_PATH}")
-print("-> Model mới đã tích hợp bộ chuẩn hóa (Scaler) bên trong.")
-print("-> Bạn không cần sửa code run_realtime.py, cứ chạy là nó tự hiểu!")
\ No newline at end of file
+# --- CẤU HÌNH TÌM MODEL ---
+LATENCY_BUDGET_MS = 5.0      # thời gian predict tối đa cho 1 frame (p95, 1 mẫu)
+CV_FOLDS = 5
+LATENCY_REPEATS = 200
+BACKENDS = ("pickle", "lut", "native")   # giống model_loader.BACKENDS
+
+
+def load_data():
+    print("[1] 📥 Đang tải dữ liệu...")
+    store = open_store(STORE_DIR)
+    try:
+        if store is not None and len(store):
+            df = store.to_dataframe()
+            print(f"-> Đã tải {len(df)} dòng dữ liệu từ kho đặc trưng {STORE_DIR}")
+        else:
+            df = pd.read_csv(CSV_FILE)
+            print(f"-> Đã tải {len(df)} dòng dữ liệu.")
+    except FileNotFoundError:
+        print(f"❌ LỖI: Không tìm thấy file {CSV_FILE}")
+        print("-> Hãy chạy gom_file.py để tạo dữ liệu trước!")
+        exit()
+
+    # Lấy dữ liệu đầu vào (Features) và nhãn (Label)
+    X = df[["LeftEAR", "RightEAR", "MAR"]]
+    y = df["Label"]
+
+    # Chia tập train/test (80% học, 20% thi)ẽ
+    # stratify=y: Đảm bảo tỷ lệ các nhãn (Ngáp, Ngủ, Bình thường) ở tập train và test giống nhau
+    return train_test_split(X, y, test_size=0.2, random_state=42, stratify=y)
+
+
+def build_ensemble(weights=(2, 1, 1), rf_trees=100, gb_stages=100):
+    # --- KỸ THUẬT 1: PIPELINE & SCALING (MỚI) ---
+    # SVM rất nhạy cảm với dữ liệu chưa chuẩn hóa.
+    # Ta tạo một 'đường ống' (Pipeline): Dữ liệu đi qua Scaler (làm sạch) -> rồi mới vào SVM.
+    svm_pipeline = Pipeline([
+        ('scaler', StandardScaler()), # Chuẩn hóa dữ liệu về dạng chuẩn (Mean=0, Std=1)
+        ('svm', SVC(kernel='rbf', C=10, gamma='scale', probability=True, class_weight='balanced'))
+    ])
+
+    # --- KỸ THUẬT 2: RANDOM FOREST (GIỮ NGUYÊN) ---
+    # Random Forest không cần Scale, nó giỏi xử lý nhiễu.
+    rf_clf = RandomForestClassifier(n_estimators=rf_trees, random_state=42, class_weight='balanced')
+
+    # --- KỸ THUẬT 3: GRADIENT BOOSTING (MỚI - CỰC MẠNH) ---
+    # Model này học theo kiểu "Sửa sai". Nó nhìn xem các model trước sai ở đâu để tập trung học chỗ đó.
+    gb_clf = GradientBoostingClassifier(n_estimators=gb_stages, learning_rate=0.1, max_depth=3, random_state=42)
+
+    # --- TỔNG HỢP: VOTING CLASSIFIER (HỘI ĐỒNG GIÁM KHẢO) ---
+    # Kết hợp cả 3 ông lớn: SVM (Toán học) + Random Forest (Thống kê) + Gradient Boosting (Học sâu chuỗi)
+    return VotingClassifier(
+        estimators=[
+            ('svm_pipe', svm_pipeline),
+            ('rf', rf_clf),
+            ('gb', gb_clf)
+        ],
+        voting='soft', # 'soft': Tính trung bình độ tin cậy (xác suất) thay vì chỉ đếm phiếu bầu
+        weights=list(weights) # (Tuỳ chọn) Cho SVM quyền lực gấp đôi nếu nó chính xác nhất
+    )
+
+
+def train_default(X_train, X_test, y_train, y_test):
+    print("[2] ⚙️ Đang thiết lập kiến trúc 'Siêu Model' (Ensemble)...")
+    voting_clf = build_ensemble()
+
+    print("[3] 🧠 Đang huấn luyện (Training)...")
+    voting_clf.fit(X_train, y_train)
+
+    # Đánh giá kết quả
+    print("\n--- 📊 KẾT QUẢ ĐÁNH GIÁ MODEL ---")
+    predictions = voting_clf.predict(X_test)
+    acc = accuracy_score(y_test, predictions)
+    print(f"Độ chính xác tổng thể: {acc*100:.2f}%")
+    print(classification_report(y_test, predictions, target_names=["Normal", "Sleep", "Yawn"]))
+
+    # Lưu model
+    joblib.dump(voting_clf, MODEL_PATH)
+    print(f"✅ Đã lưu model thành công tại: {MODEL_PATH}")
+    warn_stale_lut()
+    print("-> Model mới đã tích hợp bộ chuẩn hóa (Scaler) bên trong.")
+    print("-> Bạn không cần sửa code run_realtime.py, cứ chạy là nó tự hiểu!")
+
+
+# ================= CHẾ ĐỘ TÌM MODEL THEO NGÂN SÁCH ĐỘ TRỄ =================
+def candidate_models():
+    """Các model ứng viên: model đơn lẻ + ensemble với nhiều bộ trọng số / kích thước"""
+    svm = lambda C: Pipeline([
+        ('scaler', StandardScaler()),
+        ('svm', SVC(kernel='rbf', C=C, gamma='scale', probability=True, class_weight='balanced'))
+    ])
+    candidates = {
+        "logreg": Pipeline([('scaler', StandardScaler()),
+                            ('lr', LogisticRegression(max_iter=1000, class_weight='balanced'))]),
+        "svm_C1": svm(1),
+        "svm_C10": svm(10),
+        "rf_30_d12": RandomForestClassifier(n_estimators=30, max_depth=12, random_state=42, class_weight='balanced'),
+        "rf_100": RandomForestClassifier(n_estimators=100, random_state=42, class_weight='balanced'),
+        "gb_50": GradientBoostingClassifier(n_estimators=50, learning_rate=0.2, max_depth=3, random_state=42),
+        "gb_100": GradientBoostingClassifier(n_estimators=100, learning_rate=0.1, max_depth=3, random_state=42),
+    }
+    for weights in [(2, 1, 1), (1, 1, 1), (1, 2, 1), (1, 1, 2)]:
+        candidates["ensemble_" + "".join(map(str, weights))] = build_ensemble(weights)
+    candidates["ensemble_211_small"] = build_ensemble((2, 1, 1), rf_trees=30, gb_stages=50)
+    return candidates
+
+
+def measure_latency(model, sample, repeats=LATENCY_REPEATS):
+    """Độ trễ predict 1 mẫu giống main_gui: clf.predict([features]) -> (p50, p95) ms"""
+    row = [list(sample)]
+    times = []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        model.predict(row)
+        times.append(time.perf_counter() - t0)
+    times = np.array(times) * 1000
+    return float(np.percentile(times, 50)), float(np.percentile(times, 95))
+
+
+def make_lut(model, X_train, X_test):
+    """Bảng tra của model trên khoảng feature của toàn bộ dữ liệu (giống lut_predictor.py)"""
+    lo, hi = feature_ranges(np.vstack([np.asarray(X_train), np.asarray(X_test)]))
+    return build_lut(model, lo, hi)
+
+
+def save_lut(lut, model, X_test, path=LUT_PATH):
+    """Ghi bảng tra mới cạnh model, tránh backend "lut" dùng bảng của model cũ"""
+    lut.save(path)
+    report = compare_with_model(lut, model, np.asarray(X_test))
+    print(f"✅ Đã build lại bảng tra: {path} (lệch nhãn {report['disagreement'] * 100:.2f}% trên tập test)")
+
+
+def warn_stale_lut(path=LUT_PATH):
+    """Model mới mà không build lại bảng tra: backend "lut" sẽ dùng bảng của model cũ"""
+    if os.path.exists(path):
+        print(f"⚠️ {path} là bảng tra của model cũ: chạy lut_predictor.py trước khi dùng backend \"lut\"")
+
+
+def native_model(model):
+    """NativeEnsemble của model, None nếu backend "native" không chạy được model này"""
+    from native_ensemble import NativeEnsemble
+    try:
+        return NativeEnsemble(model)
+    except (TypeError, AttributeError):
+        return None
+
+
+def serialized_size(model):
+    buffer = io.BytesIO()
+    joblib.dump(model, buffer)
+    return buffer.tell()
+
+
+def run_search(X_train, X_test, y_train, y_test, budget_ms=LATENCY_BUDGET_MS, n_jobs=-1, folds=CV_FOLDS,
+               backend="pickle"):
+    """
+    Độ trễ đo trên pickle / native của model_loader, và lut khi backend="lut"
+    (bảng tra 64^3 ô build cho từng ứng viên chỉ trong trường hợp đó, các backend khác để None);
+    ngân sách và xếp hạng theo backend mà app sẽ dùng. Model không phải ensemble thì backend native
+    chạy bằng model gốc (giống model_loader.load_classifier) nên đo như pickle.
+    """
+    cv = StratifiedKFold(n_splits=folds, shuffle=True, random_state=42)
+    sample = X_test.iloc[0].values
+    results = []
+    print(f"[2] 🔎 Tìm model: {folds}-fold CV, n_jobs={n_jobs}, ngân sách {budget_ms} ms/frame (backend {backend})")
+    for name, model in candidate_models().items():
+        t0 = time.perf_counter()
+        scores = cross_validate(model, X_train, y_train, cv=cv, n_jobs=n_jobs)
+        model.fit(X_train, y_train)
+        lut = make_lut(model, X_train, X_test) if backend == "lut" else None
+        native = native_model(model)
+        runners = {"pickle": model, "lut": lut, "native": native if native is not None else model}
+        latency = {b: measure_latency(r, sample) if r is not None else (None, None) for b, r in runners.items()}
+        result = {
+            "name": name,
+            "cv_accuracy": float(scores["test_score"].mean()),
+            "cv_std": float(scores["test_score"].std()),
+            "test_accuracy": float(accuracy_score(y_test, model.predict(X_test))),
+            "lut_disagreement": (compare_with_model(lut, model, np.asarray(X_test))["disagreement"]
+                                 if lut is not None else None),
+            "native_supported": native is not None,
+            "size_kb": serialized_size(model) / 1024,
+            "fit_s": time.perf_counter() - t0,
+        }
+        for b in BACKENDS:
+            result[f"{b}_p50_ms"], result[f"{b}_p95_ms"] = latency[b]
+        result["latency_p50_ms"], result["latency_p95_ms"] = latency[backend]
+        result["within_budget"] = latency[backend][1] <= budget_ms
+        results.append((result, model, lut))
+        p95 = " / ".join(f"{b} {latency[b][1]:.2f}" for b in BACKENDS if latency[b][1] is not None)
+        print(f"    -> {name:<20} CV {result['cv_accuracy'] * 100:.2f}% | test {result['test_accuracy'] * 100:.2f}% | "
+              f"p95 ms: {p95} | {result['size_kb']:.0f} KB")
+
+    # Xếp hạng: trong ngân sách trước, rồi độ chính xác CV, rồi độ trễ
+    results.sort(key=lambda r: (not r[0]["within_budget"], -r[0]["cv_accuracy"], r[0]["latency_p95_ms"]))
+    for rank, (result, _, _) in enumerate(results, 1):
+        result["rank"] = rank
+    return results
+
+
+def write_report(results, budget_ms, selected, backend):
+    pd.DataFrame([r for r, _, _ in results]).to_csv(REPORT_CSV, index=False)
+    with open(REPORT_JSON, "w", encoding="utf-8") as f:
+        json.dump({"budget_ms": budget_ms, "backend": backend, "selected": selected,
+                   "candidates": [r for r, _, _ in results]}, f, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Huấn luyện model nhận diện buồn ngủ")
+    parser.add_argument("--search", action="store_true",
+                        help="tìm model chính xác nhất nằm trong ngân sách độ trễ thay vì train ensemble cố định")
+    parser.add_argument("--budget-ms", type=float, default=LATENCY_BUDGET_MS)
+    parser.add_argument("--n-jobs", type=int, default=-1)
+    parser.add_argument("--folds", type=int, default=CV_FOLDS)
+    parser.add_argument("--backend", default="pickle", choices=BACKENDS,
+                        help="backend app dùng (MODEL_BACKEND của main_gui): tính ngân sách độ trễ theo backend này")
+    args = parser.parse_args()
+
+    X_train, X_test, y_train, y_test = load_data()
+    # Model fit bằng DataFrame, còn lưới bảng tra / mẫu đo độ trễ là ndarray
+    warnings.filterwarnings("ignore", message="X does not have valid feature names")
+    if not args.search:
+        train_default(X_train, X_test, y_train, y_test)
+    else:
+        results = run_search(X_train, X_test, y_train, y_test, args.budget_ms, args.n_jobs, args.folds, args.backend)
+        best, model, lut = results[0]
+        if not best["within_budget"]:
+            print(f"⚠️ Không model nào đạt {args.budget_ms} ms, chọn model chính xác nhất")
+        write_report(results, args.budget_ms, best["name"], args.backend)
+
+        print(f"\n--- 📊 XẾP HẠNG (p95 theo backend {args.backend}) ---")
+        print(f"{'#':>2} {'model':<20}{'CV %':>8}{'test %':>8}{'p95 ms':>9}{'KB':>8}")
+        for result, _, _ in results:
+            mark = "" if result["within_budget"] else "  (vượt ngân sách)"
+            print(f"{result['rank']:>2} {result['name']:<20}{result['cv_accuracy'] * 100:>8.2f}"
+                  f"{result['test_accuracy'] * 100:>8.2f}{result['latency_p95_ms']:>9.2f}{result['size_kb']:>8.0f}{mark}")
+
+        # App / các script đều load MODEL_PATH; backend native gặp model không phải ensemble thì tự quay về pickle
+        joblib.dump(model, MODEL_PATH)
+        print(f"✅ Đã chọn {best['name']} và lưu tại: {MODEL_PATH}")
+        if not best["native_supported"]:
+            print("-> Model không phải ensemble: backend \"native\" sẽ chạy bằng model gốc (như pickle)")
+        if lut is not None:
+            save_lut(lut, model, X_test)
+        else:
+            warn_stale_lut()
+        print(f"-> Báo cáo: {REPORT_CSV}")